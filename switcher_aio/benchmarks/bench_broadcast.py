@@ -0,0 +1,97 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Micro-benchmark for the SwitcherV2 broadcast message parser.
+Compares the per-message cost of SwitcherV2BroadcastMSG against the previous hexlify based parser.
+
+Runs in the python environment Home Assistant runs in, or anywhere voluptuous is installed with the
+shims of compat.py, run from this folder:
+python3 bench_broadcast.py [number of messages]
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import binascii as ba
+import datetime
+import os
+import socket
+import sys
+import timeit
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components"))
+
+import compat  # noqa: E402
+compat.install()
+
+import switcher_aio  # noqa: E402
+
+DEFAULT_NUMBER = 20000
+
+
+def build_broadcast_message(device_id="a1b2c3", name="Switcher Boiler", ip_addr="192.168.1.50", state_on=True, power=2680, time_left=1800, auto_off=5400):
+    """build a 165 bytes broadcast message in the layout sent by the device"""
+    message = bytearray(165)
+    message[0:2] = b"\xfe\xf0"
+    message[18:21] = ba.unhexlify(device_id)
+    message[42:42 + len(name)] = name.encode("utf-8")
+    message[76:80] = socket.inet_aton(ip_addr)
+    message[80:86] = b"\x12\x34\x56\x78\x9a\xbc"
+    message[133:135] = b"\x01\x00" if state_on else b"\x00\x00"
+    message[135:137] = pack("<H", power)
+    message[147:151] = pack("<I", time_left)
+    message[155:159] = pack("<I", auto_off)
+    return bytes(message)
+
+
+def legacy_seconds_to_iso_time(all_seconds):
+    """the datetime based conversion used before the struct layout"""
+    minutes, seconds = divmod(int(all_seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return datetime.time(hour=hours, minute=minutes, second=seconds).isoformat()
+
+
+def legacy_parse(message):
+    """the hexlify based parser SwitcherV2BroadcastMSG used before the struct layout"""
+    verified = ba.hexlify(message)[0:4].decode("utf-8") == 'fef0' and len(message) == 165
+    if not verified:
+        return None
+    temp_ip = ba.hexlify(message)[152:160]
+    ip_addr = int(temp_ip[6:8] + temp_ip[4:6] + temp_ip[2:4] + temp_ip[0:2], 16)
+    ip_address = socket.inet_ntoa(pack("<L", ip_addr))
+    mac = ba.hexlify(message)[160:172].decode("utf-8").upper()
+    mac = mac[0:2] + ':' + mac[2:4] + ':' + mac[4:6] + ':' + mac[6:8] + ':' + mac[8:10] + ':' + mac[10:12]
+    name = message[42:74].decode("utf-8").rstrip('\x00')
+    device_id = ba.hexlify(message)[36:42].decode("utf-8")
+    state = time_left = switcher_aio.STATE_ON if ba.hexlify(message)[266:270].decode("utf-8") == switcher_aio.STATE_RESPONSE_ON else switcher_aio.STATE_OFF
+    temp_auto_off_config = ba.hexlify(message)[310:318]
+    auto_off = legacy_seconds_to_iso_time(int(temp_auto_off_config[6:8] + temp_auto_off_config[4:6] + temp_auto_off_config[2:4] + temp_auto_off_config[0:2], 16))
+    power = current = 0
+    if state == switcher_aio.STATE_ON:
+        temp_power = ba.hexlify(message)[270:278]
+        power = int(temp_power[2:4] + temp_power[0:2], 16)
+        current = round((power / float(220)), 1)
+        temp_time_left = ba.hexlify(message)[294:302]
+        time_left = legacy_seconds_to_iso_time(int(temp_time_left[6:8] + temp_time_left[4:6] + temp_time_left[2:4] + temp_time_left[0:2], 16))
+    return ip_address, mac, name, device_id, state, time_left, auto_off, power, current
+
+
+def current_parse(message):
+    """the parser shipped with the component"""
+    msg = switcher_aio.SwitcherV2BroadcastMSG(message)
+    return msg.ip, msg.mac, msg.name, msg.device_id, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current
+
+
+def main(number):
+    """verify both parsers agree and print the per message cost"""
+    messages = [build_broadcast_message(), build_broadcast_message(state_on=False)]
+    for message in messages:
+        assert legacy_parse(message) == current_parse(message), "parsers disagree"
+
+    results = {}
+    for label, func in (("hexlify (before)", legacy_parse), ("struct (after)", current_parse)):
+        best = min(timeit.repeat(lambda: [func(message) for message in messages], number=number // len(messages), repeat=5))
+        results[label] = best / number * 1e6
+        print("{:<18} {:8.2f} us/message".format(label, results[label]))
+
+    print("{:<18} {:8.2f}x".format("speedup", results["hexlify (before)"] / results["struct (after)"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUMBER)
@@ -0,0 +1,170 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Benchmark suite for the SwitcherV2 protocol codec, the per packet work done on every command and
+broadcast: request encoding and crc signing, response and broadcast decoding, schedule parsing.
+Each benchmark reports the best per call time and the peak bytes allocated by a single call, and is
+compared against the baseline recorded in bench_codec_baseline.json, a slower or heavier benchmark
+beyond the tolerance is reported as a regression and the script exits with status 1. The
+allocations are deterministic and gated tightly, the timings get a looser tolerance for noise.
+
+Runs in the python environment Home Assistant runs in, or anywhere voluptuous is installed with the
+shims of compat.py (asyncio.coroutine on python 3.11 and later, stand-ins without Home Assistant),
+run from this folder:
+python3 bench_codec.py [--number N] [--tolerance 0.5] [--save]
+
+The baseline is machine dependant, record it again with --save on the machine running the
+comparison before relying on the timings (the allocations are portable across machines). The
+baseline records the python version and the applied shims, a run with another python version or
+other shims is warned about, its timings and allocations are not comparable with the baseline.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "custom_components"))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "tools"))
+
+import compat  # noqa: E402
+compat.install()
+
+import switcher_aio  # noqa: E402
+import switcher_simulator  # noqa: E402
+from bench_broadcast import build_broadcast_message  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCHMARKS_DIR, "bench_codec_baseline.json")
+DEFAULT_NUMBER = 20000
+DEFAULT_TOLERANCE = 0.5
+ALLOCATION_SLACK = 64
+REPEAT = 7
+
+DEVICE_ID = "a1b2c3"
+PHONE_ID = "0000"
+DEVICE_PASSWORD = "00000000"
+SESSION_ID = bytes.fromhex("0a1b2c3d")
+TIMESTAMP = 1551434400
+SCHEDULE_DATA = bytes((3, 1, 0x2a, 1)) + (1551434400).to_bytes(4, "little") + (1551438000).to_bytes(4, "little")
+
+
+def build_responses():
+    """build the device responses with the simulator, the way a device answers the requests"""
+    device = switcher_simulator.SimulatedSwitcher(switcher_simulator.SimulatorConfig(), DEVICE_ID, "192.168.1.50", "Switcher Boiler")
+    device.turn_on(1800)
+    for _ in range(switcher_simulator.MAX_SCHEDULES):
+        device.handle_request(switcher_simulator.REQUEST_CREATE_SCHEDULE, b"\x00" * switcher_simulator.CREATE_SCHEDULE_OFFSET + SCHEDULE_DATA[1:], SESSION_ID)
+    sign = switcher_simulator.crc_sign_packet
+    return {
+        "login": bytes(sign(switcher_simulator.new_response(switcher_simulator.ACK_RESPONSE_LENGTH, SESSION_ID))),
+        "state": bytes(sign(device.handle_request(switcher_simulator.REQUEST_GET_STATE, b"", SESSION_ID))),
+        "ack": bytes(sign(switcher_simulator.new_response(switcher_simulator.ACK_RESPONSE_LENGTH, SESSION_ID))),
+        "schedules": bytes(sign(device.handle_request(switcher_simulator.REQUEST_GET_SCHEDULES, b"", SESSION_ID)))
+    }
+
+
+def get_benchmarks():
+    """return the benchmarks by name, each is a no arguments callable doing one unit of work"""
+    encoder = switcher_aio.SwitcherV2PacketEncoder(DEVICE_ID, PHONE_ID, DEVICE_PASSWORD)
+    responses = build_responses()
+    broadcast = build_broadcast_message()
+    schedule_details = [SCHEDULE_DATA.hex() + "00000000"]
+    control_packet = bytearray(switcher_aio.SEND_CONTROL_PACKET)
+    return {
+        "sign_control": lambda: switcher_aio.crc_sign_packet(control_packet),
+        "encode_login": lambda: encoder.login(TIMESTAMP),
+        "encode_get_state": lambda: encoder.get_state(SESSION_ID, TIMESTAMP),
+        "encode_control": lambda: encoder.control(SESSION_ID, TIMESTAMP, switcher_aio.COMMAND_ON, 1800),
+        "encode_set_auto_off": lambda: encoder.set_auto_off(SESSION_ID, TIMESTAMP, 5400),
+        "encode_update_name": lambda: encoder.update_name(SESSION_ID, TIMESTAMP, switcher_aio.convert_string_to_device_name("Switcher Boiler")),
+        "encode_get_schedules": lambda: encoder.get_schedules(SESSION_ID, TIMESTAMP),
+        "encode_create_schedule": lambda: encoder.create_schedule(SESSION_ID, TIMESTAMP, SCHEDULE_DATA[1:]),
+        "seconds_to_iso_time": lambda: switcher_aio.convert_seconds_to_iso_time(5399),
+        "decode_login": lambda: switcher_aio.SwitcherV2LoginResponseMSG(responses["login"]).session_id,
+        "decode_state": lambda: switcher_aio.SwitcherV2StateResponseMSG(responses["state"]).state,
+        "decode_control": lambda: switcher_aio.SwitcherV2ControlResponseMSG(responses["ack"]).successful,
+        "decode_schedules": lambda: switcher_aio.SwitcherV2GetScheduleResponseMSG(responses["schedules"]).get_schedules,
+        "decode_broadcast": lambda: switcher_aio.SwitcherV2BroadcastMSG(broadcast).state,
+        "parse_schedule": lambda: switcher_aio.SwitcherV2Schedule(0, schedule_details).schedule_data
+    }
+
+
+def measure_time(func, number):
+    """return the best per call time in microseconds"""
+    return min(timeit.repeat(func, number=number, repeat=REPEAT)) / number * 1e6
+
+
+def measure_allocations(func):
+    """return the peak bytes allocated by a single call, the lowest of a few calls"""
+    func()
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(REPEAT):
+            tracemalloc.clear_traces()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    return min(peaks)
+
+
+def run(number):
+    """run the benchmarks, returns the results by benchmark name"""
+    results = {}
+    for name, func in sorted(get_benchmarks().items()):
+        results[name] = {"us": round(measure_time(func, number), 3), "bytes": measure_allocations(func)}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """print the results against the baseline, returns the names of the regressed benchmarks"""
+    regressions = []
+    print("{:<24} {:>10} {:>10} {:>8} {:>8} {:>8}".format("benchmark", "us/call", "baseline", "ratio", "bytes", "baseline"))
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print("{:<24} {:>10.3f} {:>10} {:>8} {:>8} {:>8}".format(name, result["us"], "-", "-", result["bytes"], "-"))
+            continue
+        ratio = result["us"] / base["us"] if base["us"] else 1.0
+        regressed = ratio > 1 + tolerance or result["bytes"] > base["bytes"] + ALLOCATION_SLACK
+        if regressed:
+            regressions.append(name)
+        print("{:<24} {:>10.3f} {:>10.3f} {:>7.2f}x {:>8} {:>8}{}".format(name, result["us"], base["us"], ratio, result["bytes"], base["bytes"], "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    """parse the command line, run the benchmarks and compare or save the baseline"""
+    parser = argparse.ArgumentParser(description="Benchmark the SwitcherV2 protocol codec")
+    parser.add_argument("--number", type=int, default=DEFAULT_NUMBER, help="calls per timing repeat")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown fraction before reporting a regression")
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.number)
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            recorded = json.load(baseline_file)
+        baseline = recorded["results"]
+        if not (recorded.get("python") == platform.python_version() and recorded.get("shims", []) == compat.SHIMS):
+            print("warning: baseline recorded with python {} and shims {}, running python {} with shims {}".format(
+                recorded.get("python"), recorded.get("shims", []), platform.python_version(), compat.SHIMS))
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(BASELINE_FILE, "w") as baseline_file:
+            json.dump({"recorded": datetime.date.today().isoformat(), "python": platform.python_version(), "shims": compat.SHIMS, "results": results}, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("baseline saved to " + BASELINE_FILE)
+    elif regressions:
+        print("regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
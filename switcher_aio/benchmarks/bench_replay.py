@@ -0,0 +1,139 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Replay benchmark for switcher_aio, feeds a broadcasts capture (the capture_file configuration key)
+to the listener and reports the parse throughput and the end to end update latency. The parse
+throughput decodes every captured datagram in process, the update latency starts a fresh Home
+Assistant core with the group component, sets up switcher_aio for the captured devices and measures
+the time from sending each datagram to the first state change of the device entities, datagrams
+changing nothing the entities present are counted but not timed.
+
+Requires a Home Assistant installation (the same python environment Home Assistant runs in) and
+the loopback broadcast port 20002 to be free, run from this folder:
+python3 bench_replay.py switcher_aio.capture [--speed 10] [--lean]
+
+The captured devices are usually not reachable from the benchmark, their schedules requests fail
+and are logged, the broadcasts alone drive the measured updates.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "custom_components"))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "tools"))
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, EVENT_STATE_CHANGED  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+
+import switcher_aio  # noqa: E402
+import switcher_replay  # noqa: E402
+
+DEFAULT_SPEED = 10.0
+PARSE_REPEAT = 5
+SETTLE_TIME = 1.0
+PHONE_ID = "0000"
+DEVICE_PASSWORD = "00000000"
+
+
+def measure_parse(records):
+    """return the best datagrams parsed per second over the captured datagrams"""
+    datagrams = [data for _, data in records]
+    best = min(timeit.repeat(lambda: [switcher_aio.SwitcherV2BroadcastMSG(data).state for data in datagrams], number=1, repeat=PARSE_REPEAT))
+    return len(datagrams) / best if best else 0.0
+
+
+async def async_measure_updates(records, devices, speed, lean):
+    """replay the records to the component, returns the update latencies in milliseconds and the number of datagrams sent"""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+        config = {switcher_aio.DOMAIN: {
+            switcher_aio.CONF_PHONE_ID: PHONE_ID,
+            switcher_aio.CONF_DEVICE_PASSWORD: DEVICE_PASSWORD,
+            switcher_aio.CONF_DEVICES: [{switcher_aio.CONF_DEVICE_ID: device_id} for device_id in devices],
+            switcher_aio.CONF_LEAN: lean
+        }}
+
+        """the send time of the last datagram of each device not yet followed by a state change"""
+        pending = {}
+        latencies = []
+
+        def get_device_id(entity_id):
+            """return the device of an entity, the entities are suffixed with the device id when managing multiple devices"""
+            if len(devices) == 1:
+                return devices[0]
+            return next((device_id for device_id in devices if entity_id.endswith("_" + device_id)), None)
+
+        def state_changed(event):
+            """time the first state change following each datagram"""
+            if event.data["entity_id"].startswith(switcher_aio.DOMAIN + "."):
+                sent_at = pending.pop(get_device_id(event.data["entity_id"]), None)
+                if sent_at is not None:
+                    latencies.append((time.monotonic() - sent_at) * 1000)
+
+        await async_setup_component(hass, "group", {})
+        hass.bus.async_listen(EVENT_STATE_CHANGED, state_changed)
+        if not await switcher_aio.async_setup(hass, switcher_aio.CONFIG_SCHEMA(config)):
+            raise RuntimeError("switcher_aio setup failed")
+
+        transport, send = await switcher_replay.async_open_sender()
+        try:
+            def timed_send(data):
+                """send a datagram and mark its device as pending"""
+                device_id = switcher_replay.get_device_id(data)
+                if device_id in devices:
+                    pending[device_id] = time.monotonic()
+                send(data)
+
+            """the first datagram of each device discovers it, the entities creation is not part of the latency"""
+            for device_id in devices:
+                send(next(data for _, data in records if switcher_replay.get_device_id(data) == device_id))
+            await asyncio.sleep(SETTLE_TIME)
+            await hass.async_block_till_done()
+            pending.clear()
+
+            count = await switcher_replay.async_replay(records, timed_send, speed)
+            await asyncio.sleep(SETTLE_TIME)
+            await hass.async_block_till_done()
+            return latencies, count
+        finally:
+            transport.close()
+            """stop the component without stopping the loop"""
+            hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+            await hass.async_block_till_done()
+
+
+def main():
+    """parse the command line and run the replay benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark the switcher_aio listener with a broadcasts capture")
+    parser.add_argument("capture_file", help="path of the capture file")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="replay speed factor, 0 replays as fast as possible")
+    parser.add_argument("--lean", action="store_true", help="set up the component in lean mode")
+    args = parser.parse_args()
+
+    records = list(switcher_replay.read_capture(args.capture_file))
+    devices = sorted(device_id for device_id in set(switcher_replay.get_device_id(data) for _, data in records) if device_id is not None)
+    if not devices:
+        print("no broadcasts in " + args.capture_file)
+        sys.exit(1)
+
+    print("{} datagrams of {} device(s)".format(len(records), len(devices)))
+    print("parse throughput: {:.0f} datagrams/s".format(measure_parse(records)))
+
+    loop = asyncio.get_event_loop()
+    latencies, count = loop.run_until_complete(async_measure_updates(records, devices, args.speed, args.lean))
+    print("replayed {} datagrams at speed {}, {} entity updates".format(count, args.speed, len(latencies)))
+    if latencies:
+        latencies.sort()
+        print("datagram to entity update: median {:.2f}ms, p95 {:.2f}ms, max {:.2f}ms".format(
+            statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))], latencies[-1]))
+
+
+if __name__ == "__main__":
+    main()
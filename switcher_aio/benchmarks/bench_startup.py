@@ -0,0 +1,104 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Startup benchmark for switcher_aio, the time from the first broadcast of the devices to all their
+entities and groups being available in the state machine. Each run starts a fresh Home Assistant
+core with the group component, sets up switcher_aio for the simulated devices and starts the
+simulator. The run is timed to the last entity or group reporting its first state, once no new
+state was reported for the settle time, and fails if the number of states differs from the expected
+count, so a stale expected count can not cut the measurement short.
+
+Requires a Home Assistant installation (the same python environment Home Assistant runs in) and
+the loopback broadcast port 20002 to be free, run from this folder:
+python3 bench_startup.py [--devices N] [--runs N] [--lean]
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "custom_components"))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "tools"))
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, EVENT_STATE_CHANGED  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+
+import switcher_aio  # noqa: E402
+import switcher_simulator  # noqa: E402
+
+DEFAULT_DEVICES = 1
+DEFAULT_RUNS = 5
+RUN_TIMEOUT = 30
+SETTLE_TIME = 3
+PHONE_ID = "0000"
+DEVICE_PASSWORD = "00000000"
+"""entities and groups created for each device, the full mode creates the four groups and the view, checked against the states of every run"""
+EXPECTED_STATES = {False: 37 + 5, True: 8}
+
+
+async def async_run_once(devices, lean):
+    """set up the component for the simulated devices, returns the milliseconds from the first broadcast to all the states available"""
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+        simulator = switcher_simulator.create_simulator(switcher_simulator.SimulatorConfig(broadcast_interval=RUN_TIMEOUT), devices)
+        config = {switcher_aio.DOMAIN: {
+            switcher_aio.CONF_PHONE_ID: PHONE_ID,
+            switcher_aio.CONF_DEVICE_PASSWORD: DEVICE_PASSWORD,
+            switcher_aio.CONF_DEVICES: [{switcher_aio.CONF_DEVICE_ID: device.device_id} for device in simulator.devices],
+            switcher_aio.CONF_LEAN: lean
+        }}
+
+        expected = EXPECTED_STATES[lean] * devices
+        available = set()
+        last_available = [None]
+
+        def state_changed(event):
+            """record the switcher_aio entities and groups reporting their first state and the time of the last one"""
+            entity_id = event.data["entity_id"]
+            if event.data.get("old_state") is None and (entity_id.startswith(switcher_aio.DOMAIN + ".") or entity_id.startswith("group.")):
+                available.add(entity_id)
+                last_available[0] = time.monotonic()
+
+        await async_setup_component(hass, "group", {})
+        hass.bus.async_listen(EVENT_STATE_CHANGED, state_changed)
+        if not await switcher_aio.async_setup(hass, switcher_aio.CONFIG_SCHEMA(config)):
+            raise RuntimeError("switcher_aio setup failed")
+
+        try:
+            started = time.monotonic()
+            await simulator.async_start()
+            while time.monotonic() - started < RUN_TIMEOUT:
+                await asyncio.sleep(0.1)
+                if last_available[0] is not None and time.monotonic() - last_available[0] >= SETTLE_TIME:
+                    break
+            if not len(available) == expected:
+                raise RuntimeError("{} states available, expected {}".format(len(available), expected))
+            return (last_available[0] - started) * 1000
+        finally:
+            await simulator.async_stop()
+            """stop the component without stopping the loop the next runs use"""
+            hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+            await hass.async_block_till_done()
+
+
+def main():
+    """parse the command line and run the startup benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark the switcher_aio startup")
+    parser.add_argument("--devices", type=int, default=DEFAULT_DEVICES, help="number of simulated devices")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="number of startups to measure")
+    parser.add_argument("--lean", action="store_true", help="set up the component in lean mode")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    timings = [loop.run_until_complete(async_run_once(args.devices, args.lean)) for _ in range(args.runs)]
+    print("{} device(s), {} mode, {} states per device".format(args.devices, "lean" if args.lean else "full", EXPECTED_STATES[args.lean]))
+    print("first broadcast to all entities available: min {:.1f}ms, median {:.1f}ms, max {:.1f}ms".format(min(timings), statistics.median(timings), max(timings)))
+
+
+if __name__ == "__main__":
+    main()
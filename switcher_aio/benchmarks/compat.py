@@ -0,0 +1,95 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Compatibility shim for the codec benchmark, lets bench_codec.py import the component outside of the
+environment Home Assistant runs in. The codec is plain python, encoding and decoding packets touches
+neither asyncio nor Home Assistant, only the import of the component does:
+- asyncio.coroutine was removed in python 3.11, the component and Home Assistant 0.88 decorate
+  their coroutines with it, it is restored on top of types.coroutine when missing.
+- without a Home Assistant installation the homeassistant modules are replaced with stand-ins, their
+  constants are their lowercased names, their classes are empty and their functions return their
+  first argument. Enough for the module level code of the component, nothing more, the benchmarks
+  setting the component up (bench_startup.py, bench_replay.py) still require Home Assistant.
+
+Nothing is replaced when the running environment has what the component needs. The applied shims
+are listed in SHIMS and recorded with the baseline, timings recorded with and without shims are not
+compared blindly.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import asyncio
+import functools
+import importlib.abc
+import importlib.machinery
+import inspect
+import sys
+import types
+
+SHIM_COROUTINE = "asyncio.coroutine"
+SHIM_HOMEASSISTANT = "homeassistant"
+HOMEASSISTANT_PACKAGE = "homeassistant"
+
+# constants with a value the component formats or compares at import time
+STAND_IN_CONSTANTS = {"STATE_ON": "on", "STATE_OFF": "off"}
+
+SHIMS = []
+
+
+def coroutine(func):
+    """the removed asyncio.coroutine, generator functions become generator based coroutines, other functions are wrapped in one"""
+    if inspect.isgeneratorfunction(func):
+        return types.coroutine(func)
+
+    @functools.wraps(func)
+    @types.coroutine
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = yield from result.__await__()
+        return result
+    return wrapper
+
+
+def stand_in_function(value=None, *args, **kwargs):
+    """stand-in for the homeassistant functions, decorators return the decorated function"""
+    return value
+
+
+class StandInModule(types.ModuleType):
+    """represntation of a stand-in homeassistant module"""
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name == "DOMAIN":
+            return self.__name__.split(".")[-1]
+        if name.endswith("_FORMAT"):
+            return self.__name__.split(".")[-1] + ".{}"
+        if name.isupper():
+            return STAND_IN_CONSTANTS.get(name, name.lower())
+        if name[0].isupper():
+            return type(name, (object,), {"__init__": stand_in_function})
+        return stand_in_function
+
+
+class StandInFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """represntation of the import hook creating the stand-in homeassistant modules"""
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname == HOMEASSISTANT_PACKAGE or fullname.startswith(HOMEASSISTANT_PACKAGE + "."):
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+        return None
+
+    def create_module(self, spec):
+        return StandInModule(spec.name)
+
+    def exec_module(self, module):
+        module.__path__ = []
+
+
+def install():
+    """apply the shims the running environment needs, returns the applied shims"""
+    if not hasattr(asyncio, "coroutine"):
+        asyncio.coroutine = coroutine
+        SHIMS.append(SHIM_COROUTINE)
+    try:
+        import homeassistant  # noqa: F401
+    except ImportError:
+        sys.meta_path.insert(0, StandInFinder())
+        SHIMS.append(SHIM_HOMEASSISTANT)
+    return SHIMS
@@ -29,38 +29,65 @@ switcher_aio:
   create_view: true/false (default is true)
   create_groups: true/false (default is true)
   schedules_scan_interval:
+    minutes: 60 (default is 60, schedules are also refreshed on unexplained state changes)
+  heartbeat_interval:
     minutes: 5 (default is 5)
+  silence_window:
+    minutes: 1 (default is 1)
+  capture_file: switcher_aio.capture (optional, path relative to the configuration folder)
+  warm_sessions: true/false (default is false)
+  attributes_policy: (overrides the default policy per attribute)
+    time_left:
+      min_interval:
+        seconds: 30 (default is 30)
+    current_power_consumption:
+      min_delta: 50 (default is 50)
+    electric_current:
+      min_delta: 0.2 (default is 0.2)
+    last_update:
+      exclude: true/false (default is false)
+
+Multiple Devices (phone_id and device_password can be set per device or shared at the top level):
+switcher_aio:
+  phone_id: xxxx
+  device_password: xxxxxxxx
+  devices:
+    - device_id: xxxxxx
+    - device_id: yyyyyy
+      device_password: yyyyyyyy
 
 ////////////////////////////////////////////////////////////////////////////////////////////////"""
 import asyncio
 import logging
+import collections
+import bisect
+import array
+import math
 
 import binascii as ba
 import time
-from struct import pack
+from struct import Struct
 import re
 import socket
 import datetime
 import traceback
-import threading
 
 import voluptuous as vol
 
-from homeassistant.core import callback
-from homeassistant.const import (EVENT_HOMEASSISTANT_STOP, EVENT_CALL_SERVICE, EVENT_SERVICE_REGISTERED, STATE_ON, STATE_OFF, ATTR_SERVICE, 
-    CONF_IP_ADDRESS, CONF_DEVICE, CONF_NAME, CONF_TYPE, SERVICE_TURN_ON, SERVICE_TURN_OFF, SERVICE_TOGGLE, CONF_ENTITY_ID, ATTR_HIDDEN , CONF_ICON)
+from homeassistant.core import callback, ServiceCall
+from homeassistant.const import (EVENT_HOMEASSISTANT_STOP, EVENT_CALL_SERVICE, EVENT_SERVICE_REGISTERED, STATE_ON, STATE_OFF, 
+    CONF_IP_ADDRESS, CONF_DEVICE, CONF_NAME, CONF_TYPE, SERVICE_TURN_ON, SERVICE_TURN_OFF, SERVICE_TOGGLE, CONF_ENTITY_ID, ATTR_HIDDEN , CONF_ICON, CONF_UNIT_OF_MEASUREMENT)
 from homeassistant.loader import bind_hass
 
-from homeassistant.helpers.script import Script
 import homeassistant.helpers.config_validation as cv
-import homeassistant.helpers.template as template_helper
 from homeassistant.helpers.entity import Entity, async_generate_entity_id, ToggleEntity
 from homeassistant.helpers.restore_state import RestoreEntity
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.event import async_track_time_interval, async_track_point_in_utc_time
+from homeassistant.helpers.storage import Store
 
 from homeassistant.components.input_number import (MODE_SLIDER, ATTR_VALUE, ATTR_MIN, ATTR_MAX, ATTR_STEP, ATTR_MODE, SERVICE_SET_VALUE,
     SERVICE_SET_VALUE_SCHEMA, DOMAIN as INPUT_NUMBER_DOMAIN)
-from homeassistant.components.script import DOMAIN as SCRIPT_DOMAIN, ATTR_CAN_CANCEL, ATTR_LAST_ACTION, ATTR_LAST_TRIGGERED
+from homeassistant.components.script import DOMAIN as SCRIPT_DOMAIN, ATTR_LAST_TRIGGERED
 from homeassistant.components.input_select import DOMAIN as INPUT_SELECT_DOMAIN, ATTR_OPTIONS, SERVICE_SELECT_OPTION, SERVICE_SELECT_NEXT, SERVICE_SELECT_PREVIOUS
 from homeassistant.components.input_text import DOMAIN as INPUT_TEXT_DOMAIN, MODE_TEXT, ATTR_VALUE, ATTR_MIN, ATTR_MAX, ATTR_PATTERN, ATTR_MODE
 from homeassistant.components.group import DOMAIN as GROUP_DOMAIN, ENTITY_ID_FORMAT as GROUP_ENTITY_ID_FORMAT
@@ -82,21 +109,58 @@ ENTITY_ID_FORMAT = DOMAIN + ".{}"
 CONF_PHONE_ID = 'phone_id'
 CONF_DEVICE_PASSWORD = 'device_password'
 CONF_DEVICE_ID = 'device_id'
+CONF_DEVICES = 'devices'
 CONF_TIME_LEFT = "time_left"
 CONF_AUTO_OFF = "auto_off"
 CONF_CURRENT_POWER_CONSUMPTIOMN = "current_power_consumption"
 CONF_ELECTRIC_CURRENT = "electric_current"
 CONF_LAST_UPDATE = "last_update"
 CONF_LAST_STATE_CHANGE = "last_state_change"
+CONF_MAC_ADDRESS = "mac_address"
+CONF_SCHEDULES = "schedules"
+CONF_ENERGY = "energy"
+CONF_ENERGY_DATE = "energy_date"
+CONF_DAILY_ENERGY = "daily_energy"
+CONF_MONTHLY_ENERGY = "monthly_energy"
+CONF_TOTAL_ENERGY = "total_energy"
+CONF_TELEMETRY = "telemetry"
+CONF_WINDOW = "window"
+CONF_RESOLUTION = "resolution"
+CONF_SAMPLES = "samples"
+CONF_ON_RATIO = "on_ratio"
+CONF_MIN = "min"
+CONF_MAX = "max"
+CONF_AVG = "avg"
+CONF_VIEW = "view"
 CONF_CREATE_VIEW = "create_view"
 CONF_CREATE_GROUPS = "create_groups"
+CONF_LEAN = "lean"
+CONF_CAPTURE_FILE = "capture_file"
+CONF_WARM_SESSIONS = "warm_sessions"
 CONF_SCHEDULE_SCAN_INTERVAL = "schedules_scan_interval"
+CONF_HEARTBEAT_INTERVAL = "heartbeat_interval"
+CONF_SILENCE_WINDOW = "silence_window"
+CONF_WATCHED_FIELDS = "watched_fields"
+CONF_ATTRIBUTES_POLICY = "attributes_policy"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MIN_DELTA = "min_delta"
+CONF_EXCLUDE = "exclude"
+CONF_STATE = "state"
+CONF_NEXT_RUN = "next_run"
+CONF_QUEUE_DEPTH = "queue_depth"
+CONF_QUEUE_WAIT_TIME = "queue_wait_time"
+CONF_METRICS = "metrics"
+CONF_COUNT = "count"
+CONF_ERRORS = "errors"
+CONF_BUCKETS = "buckets"
+CONF_AVG_MS = "avg_ms"
+CONF_P50_MS = "p50_ms"
+CONF_P95_MS = "p95_ms"
+CONF_MAX_MS = "max_ms"
 CONF_DEVICE_NAME = "device_name"
 CONF_ENTITY = "entity"
 CONF_STATE_CARD = "custom_ui_state_card"
 CONF_CARD = "card"
-CONF_DATA_TEMPLATE = "data_template"
-CONF_SERVICE_TEMPLATE = "service_template"
 CONF_ENABLED = "enabled"
 ATTR_NOT_ENABLED = "Not enabled"
 CONF_RECURRING = "recurring"
@@ -107,14 +171,31 @@ CONF_DAYS = "days"
 CONF_CONFIGURED = "configured"
 ATTR_NOT_CONFIGURED = "Not configured"
 CONF_SCHEDULE_ID = "schedule_id"
+# the credentials are packed as raw bytes into the request packets, a malformed value is rejected by the schema
+PHONE_ID_PATTERN = r"^[0-9a-fA-F]{4}$"
+DEVICE_ID_PATTERN = r"^[0-9a-fA-F]{6}$"
+DEVICE_PASSWORD_PATTERN = r"^[0-9a-fA-F]{8}$"
 
 """###############################
 ######### Default Values #########
 ###############################"""
 DEFAULT_CREATE_VIEW = True
 DEFAULT_CREATE_GROUPS = True
+DEFAULT_LEAN = False
+DEFAULT_WARM_SESSIONS = False
 DEFAULT_CONF_DAYS = []
-DEFAULT_SCHEDULES_SCAN_INTERVAL = datetime.timedelta(minutes=5)
+DEFAULT_SCHEDULES_SCAN_INTERVAL = datetime.timedelta(minutes=60)
+DEFAULT_HEARTBEAT_INTERVAL = datetime.timedelta(minutes=5)
+DEFAULT_SILENCE_WINDOW = datetime.timedelta(minutes=1)
+DEFAULT_TELEMETRY_WINDOW = datetime.timedelta(hours=1)
+DEFAULT_TELEMETRY_VIEW = False
+TELEMETRY_RESOLUTIONS = {"1s": 1, "1m": 60, "15m": 900}
+DEFAULT_ATTRIBUTES_POLICY = {
+    CONF_LAST_UPDATE: {CONF_EXCLUDE: False},
+    CONF_TIME_LEFT: {CONF_MIN_INTERVAL: datetime.timedelta(seconds=30), CONF_EXCLUDE: False},
+    CONF_CURRENT_POWER_CONSUMPTIOMN: {CONF_MIN_DELTA: 50, CONF_EXCLUDE: False},
+    CONF_ELECTRIC_CURRENT: {CONF_MIN_DELTA: 0.2, CONF_EXCLUDE: False}
+}
 
 """###############################
 ####### Weekdays Constants #######
@@ -133,34 +214,88 @@ WEEKDAY_TUP = (MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY)
 """###############################
 ##### Configuration Schemas ######
 ###############################"""
+PHONE_ID_SCHEMA = vol.All(cv.string, vol.Match(PHONE_ID_PATTERN, msg="phone id must be 4 hex digits"))
+DEVICE_ID_SCHEMA = vol.All(cv.string, vol.Match(DEVICE_ID_PATTERN, msg="device id must be 6 hex digits"))
+DEVICE_PASSWORD_SCHEMA = vol.All(cv.string, vol.Match(DEVICE_PASSWORD_PATTERN, msg="device password must be 8 hex digits"))
+
+DEVICE_SCHEMA = vol.Schema({
+    vol.Required(CONF_DEVICE_ID): DEVICE_ID_SCHEMA,
+    vol.Optional(CONF_PHONE_ID): PHONE_ID_SCHEMA,
+    vol.Optional(CONF_DEVICE_PASSWORD): DEVICE_PASSWORD_SCHEMA
+})
+
+ATTRIBUTE_POLICY_SCHEMA = vol.Schema({
+    vol.Optional(CONF_MIN_INTERVAL): vol.All(cv.time_period, cv.positive_timedelta),
+    vol.Optional(CONF_MIN_DELTA): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_EXCLUDE): cv.boolean
+})
+
+# last_update is not a device data field, it has no changes to filter and can only be excluded
+EXCLUDE_ONLY_POLICY_SCHEMA = vol.Schema({
+    vol.Optional(CONF_EXCLUDE): cv.boolean
+})
+
+ATTRIBUTES_POLICY_SCHEMA = vol.Schema({
+    vol.Optional(CONF_LAST_UPDATE): EXCLUDE_ONLY_POLICY_SCHEMA,
+    vol.Optional(CONF_TIME_LEFT): ATTRIBUTE_POLICY_SCHEMA,
+    vol.Optional(CONF_CURRENT_POWER_CONSUMPTIOMN): ATTRIBUTE_POLICY_SCHEMA,
+    vol.Optional(CONF_ELECTRIC_CURRENT): ATTRIBUTE_POLICY_SCHEMA
+})
+
 CONFIG_SCHEMA = vol.Schema({
-    DOMAIN: vol.Schema({
-        vol.Required(CONF_PHONE_ID): cv.string,
-        vol.Required(CONF_DEVICE_PASSWORD): cv.string,
-        vol.Required(CONF_DEVICE_ID): cv.string,
+    DOMAIN: vol.All(vol.Schema({
+        vol.Optional(CONF_PHONE_ID): PHONE_ID_SCHEMA,
+        vol.Optional(CONF_DEVICE_PASSWORD): DEVICE_PASSWORD_SCHEMA,
+        vol.Optional(CONF_DEVICE_ID): DEVICE_ID_SCHEMA,
+        vol.Optional(CONF_DEVICES): vol.All(cv.ensure_list, [DEVICE_SCHEMA]),
         vol.Optional(CONF_CREATE_VIEW, default=DEFAULT_CREATE_VIEW): cv.boolean,
         vol.Optional(CONF_CREATE_GROUPS, default=DEFAULT_CREATE_GROUPS): cv.boolean,
-        vol.Optional(CONF_SCHEDULE_SCAN_INTERVAL, default=DEFAULT_SCHEDULES_SCAN_INTERVAL): vol.All(cv.time_period, cv.positive_timedelta)
-        })
+        vol.Optional(CONF_LEAN, default=DEFAULT_LEAN): cv.boolean,
+        vol.Optional(CONF_CAPTURE_FILE): cv.string,
+        vol.Optional(CONF_WARM_SESSIONS, default=DEFAULT_WARM_SESSIONS): cv.boolean,
+        vol.Optional(CONF_SCHEDULE_SCAN_INTERVAL, default=DEFAULT_SCHEDULES_SCAN_INTERVAL): vol.All(cv.time_period, cv.positive_timedelta),
+        vol.Optional(CONF_HEARTBEAT_INTERVAL, default=DEFAULT_HEARTBEAT_INTERVAL): vol.All(cv.time_period, cv.positive_timedelta),
+        vol.Optional(CONF_SILENCE_WINDOW, default=DEFAULT_SILENCE_WINDOW): vol.All(cv.time_period, cv.positive_timedelta),
+        vol.Optional(CONF_ATTRIBUTES_POLICY, default={}): ATTRIBUTES_POLICY_SCHEMA
+        }), cv.has_at_least_one_key(CONF_DEVICE_ID, CONF_DEVICES))
 }, extra=vol.ALLOW_EXTRA)
 
 TURN_ONOFF_SERVICE_SCHEMA = vol.Schema({
     vol.Required(CONF_ENTITY_ID): cv.entity_ids,
 })
 
+TURN_ON_TIMER_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string
+})
+
 SET_AUTO_OFF_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
     vol.Required(CONF_AUTO_OFF): cv.time_period_str
 })
 
 UPDATE_DEVICE_NAME_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
     vol.Required(CONF_NAME): cv.string
 })
 
+DUMP_IO_METRICS_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string
+})
+
+TELEMETRY_STATS_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
+    vol.Optional(CONF_WINDOW, default=DEFAULT_TELEMETRY_WINDOW): vol.All(cv.time_period, cv.positive_timedelta),
+    vol.Optional(CONF_RESOLUTION): vol.In(list(TELEMETRY_RESOLUTIONS)),
+    vol.Optional(CONF_VIEW, default=DEFAULT_TELEMETRY_VIEW): cv.boolean
+})
+
 MANAGE_SCHEDULE_SERVICE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
     vol.Required(CONF_SCHEDULE_ID): vol.All(cv.positive_int, vol.Range(min=0, max=7))
 })
 
 CREATE_RECURRING_SCHEDULE_SERVICE_SCHEMA = vol.All(vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
     vol.Required(CONF_START_TIME): cv.time_period_str,
     vol.Required(CONF_END_TIME): cv.time_period_str,
     vol.Required(CONF_RECURRING): vol.All(cv.boolean, True),
@@ -171,6 +306,7 @@ CREATE_RECURRING_SCHEDULE_SERVICE_SCHEMA = vol.All(vol.Schema({
 )
 
 CREATE_NON_RECURRING_SCHEDULE_SERVICE_SCHEMA = vol.All(vol.Schema({
+    vol.Optional(CONF_DEVICE_ID): cv.string,
     vol.Required(CONF_START_TIME): cv.time_period_str,
     vol.Required(CONF_END_TIME): cv.time_period_str,
     vol.Required(CONF_RECURRING): vol.All(cv.boolean, False),
@@ -187,6 +323,8 @@ CREATE_SCHEDULE_SERVICE_SCHEMA = vol.Any(
 ######### Custom Events ##########
 ###############################"""
 EVENT_SWITCHER_DISCOVERY_DATA = "switcher_discovery_data"
+EVENT_SWITCHER_IO_METRICS = "switcher_io_metrics"
+EVENT_SWITCHER_TELEMETRY_STATS = "switcher_telemetry_stats"
 
 """###############################
 ######### Service Names ##########
@@ -201,6 +339,8 @@ SERVICE_DELETE_SCHEDULE = "delete_schedule"
 SERVICE_ENABLE_SCHEDULE = "enable_schedule"
 SERVICE_DISABLE_SCHEDULE = "disable_schedule"
 SERVICE_CREATE_SCHEDULE = "create_schedule"
+SERVICE_DUMP_IO_METRICS = "dump_io_metrics"
+SERVICE_TELEMETRY_STATS = "telemetry_stats"
 
 """###############################
 ######## Entities Config #########
@@ -209,35 +349,67 @@ ENTITY_CONTROL_TYPE = "type_control"
 ENTITY_CONTROL_CONFIG = {
     CONF_TYPE: ENTITY_CONTROL_TYPE,
     CONF_CARD: "state-card-toggle",
-    CONF_ICON: "mdi:thermostat-box"
+    CONF_ICON: "mdi:thermostat-box",
+    CONF_WATCHED_FIELDS: frozenset([CONF_IP_ADDRESS, CONF_DEVICE_NAME, CONF_STATE, CONF_TIME_LEFT, CONF_AUTO_OFF, CONF_CURRENT_POWER_CONSUMPTIOMN, CONF_ELECTRIC_CURRENT, CONF_LAST_STATE_CHANGE])
 }
 
 ENTITY_TIME_LEFT_TYPE = "type_time_left"
 ENTITY_TIME_LEFT_CONFIG = {
     CONF_TYPE: ENTITY_TIME_LEFT_TYPE,
     CONF_CARD: "state-card-display",
-    CONF_ICON: "mdi:timelapse"
+    CONF_ICON: "mdi:timelapse",
+    CONF_WATCHED_FIELDS: frozenset([CONF_TIME_LEFT])
 }
 
 ENTITY_AUTO_OFF_TYPE = "type_auto_off"
 ENTITY_AUTO_OFF_CONFIG = {
     CONF_TYPE: ENTITY_AUTO_OFF_TYPE,
     CONF_CARD: "state-card-display",
-    CONF_ICON: "mdi:timer"
+    CONF_ICON: "mdi:timer",
+    CONF_WATCHED_FIELDS: frozenset([CONF_AUTO_OFF])
 }
 
 ENTITY_ELECTRIC_CURRENT_TYPE = "type_electric_current"
 ENTITY_ELECTRIC_CURRENT_CONFIG = {
     CONF_TYPE: ENTITY_ELECTRIC_CURRENT_TYPE,
     CONF_CARD: "state-card-display",
-    CONF_ICON: "mdi:flash-circle"
+    CONF_ICON: "mdi:flash-circle",
+    CONF_WATCHED_FIELDS: frozenset([CONF_ELECTRIC_CURRENT])
 }
 
 ENTITY_DEVICE_NAME_TYPE = "type_device_name"
 ENTITY_DEVICE_NAME_CONFIG = {
     CONF_TYPE: ENTITY_DEVICE_NAME_TYPE,
     CONF_CARD: "state-card-display",
-    CONF_ICON: "mdi:settings-box"
+    CONF_ICON: "mdi:settings-box",
+    CONF_WATCHED_FIELDS: frozenset([CONF_DEVICE_NAME])
+}
+
+ENTITY_IO_LATENCY_TYPE = "type_io_latency"
+ENTITY_IO_LATENCY_CONFIG = {
+    CONF_TYPE: ENTITY_IO_LATENCY_TYPE,
+    CONF_CARD: "state-card-display",
+    CONF_ICON: "mdi:chart-histogram",
+    CONF_UNIT_OF_MEASUREMENT: "ms",
+    CONF_WATCHED_FIELDS: frozenset()
+}
+
+ENTITY_DAILY_ENERGY_TYPE = "type_daily_energy"
+ENTITY_DAILY_ENERGY_CONFIG = {
+    CONF_TYPE: ENTITY_DAILY_ENERGY_TYPE,
+    CONF_CARD: "state-card-display",
+    CONF_ICON: "mdi:flash",
+    CONF_UNIT_OF_MEASUREMENT: "kWh",
+    CONF_WATCHED_FIELDS: frozenset([CONF_DAILY_ENERGY])
+}
+
+ENTITY_MONTHLY_ENERGY_TYPE = "type_monthly_energy"
+ENTITY_MONTHLY_ENERGY_CONFIG = {
+    CONF_TYPE: ENTITY_MONTHLY_ENERGY_TYPE,
+    CONF_CARD: "state-card-display",
+    CONF_ICON: "mdi:calendar-month",
+    CONF_UNIT_OF_MEASUREMENT: "kWh",
+    CONF_WATCHED_FIELDS: frozenset([CONF_MONTHLY_ENERGY])
 }
 
 HOURS_SLIDER_UNIT = "Hours"
@@ -321,6 +493,7 @@ SCHEDULE_SELECT_ACTION_ENABLE = "Enable"
 SCHEDULE_SELECT_ACTION_DISABLE = "Disable"
 SCHEDULE_SELECT_ACTION_DELETE = "Delete"
 SCHEDULE_SELECT_ACTION_OPTIONS = [SCHEDULE_SELECT_ACTION_NONE, SCHEDULE_SELECT_ACTION_ENABLE, SCHEDULE_SELECT_ACTION_DISABLE, SCHEDULE_SELECT_ACTION_DELETE]
+SCHEDULE_SELECT_ACTION_SERVICES = {SCHEDULE_SELECT_ACTION_ENABLE: SERVICE_ENABLE_SCHEDULE, SCHEDULE_SELECT_ACTION_DISABLE: SERVICE_DISABLE_SCHEDULE, SCHEDULE_SELECT_ACTION_DELETE: SERVICE_DELETE_SCHEDULE}
 ENTITY_SCHEDULE_ACTION_SELECT_TYPE = "type_schedule_action_select"
 ENTITY_SCHEDULE_ACTION_SELECT_CONFIG = {
     CONF_TYPE: ENTITY_SCHEDULE_ACTION_SELECT_TYPE,
@@ -399,6 +572,15 @@ ELECTRIC_CURRENT_SENSOR_SLUG_ID = "electric_current_sensor"
 AUTO_OFF_SENSOR_NAME = "Auto Off"
 AUTO_OFF_SENSOR_SLUG_ID = "auto_off_sensor"
 
+IO_LATENCY_SENSOR_NAME = "I/O Latency"
+IO_LATENCY_SENSOR_SLUG_ID = "io_latency_sensor"
+
+DAILY_ENERGY_SENSOR_NAME = "Energy Today"
+DAILY_ENERGY_SENSOR_SLUG_ID = "daily_energy_sensor"
+
+MONTHLY_ENERGY_SENSOR_NAME = "Energy This Month"
+MONTHLY_ENERGY_SENSOR_SLUG_ID = "monthly_energy_sensor"
+
 CONTROL_SWITCH_NAME = "Control Device"
 CONTROL_SWITCH_SLUG_ID = "control_device_switch"
 
@@ -479,41 +661,129 @@ TIMER_TURN_OFF_NOTIFICATION_DATA = {
 ###### SwitcherV2 Constants ######
 ###############################"""
 ENCODING_CODEC = "utf-8"
-REMOTE_SESSION_ID = "00000000"
 REMOTE_KEY = b"00000000000000000000000000000000"
 SOCKET_PORT = 9957
+SOCKET_CONNECT_TIMEOUT = 5
+SOCKET_OPERATION_TIMEOUT = 5
+SESSION_IDLE_EXPIRY = 60
+# seconds a whole request over a session may take, logins and retries included, bounding how long the device queue is held
+SESSION_REQUEST_TIMEOUT = 15
+# seconds between the warm ups of a session, doubled on every failed warm up to bound the login attempts to an unreachable device
+SESSION_WARM_UP_RETRY = 30
+SESSION_WARM_UP_MAX_RETRY = 1800
+# seconds without requests after which a warm session is kept alive with a state packet, ahead of the idle expiry
+SESSION_KEEP_ALIVE = 45
+# pending requests sharing a coalesce key are superseded by the latest one
+QUEUE_KEY_CONTROL = "control"
+QUEUE_KEY_AUTO_OFF = "auto_off"
+QUEUE_KEY_DEVICE_NAME = "device_name"
+QUEUE_KEY_GET_SCHEDULES = "get_schedules"
+REQUEST_SUPERSEDED = "superseded"
+# io phases timed by the session, the upper bounds of the latency histograms buckets in milliseconds
+IO_PHASE_CONNECT = "connect"
+IO_PHASE_LOGIN = "login"
+IO_PHASE_GET_STATE = "get_state"
+IO_PHASE_CONTROL = "control"
+IO_PHASE_SET_AUTO_OFF = "set_auto_off"
+IO_PHASE_UPDATE_NAME = "update_name"
+IO_PHASE_GET_SCHEDULES = "get_schedules"
+IO_PHASE_DISABLE_ENABLE_SCHEDULE = "disable_enable_schedule"
+IO_PHASE_DELETE_SCHEDULE = "delete_schedule"
+IO_PHASE_CREATE_SCHEDULE = "create_schedule"
+IO_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# seconds around a state change in which a control request, a timer expiry or a schedule explains it
+STATE_CHANGE_EXPLAIN_WINDOW = 120
+MAX_SCHEDULES = 8
+# the raw 16 bytes schedule records are compared to skip unchanged schedule slots, no record is empty
+SCHEDULE_RECORD_UNKNOWN = b""
 SOCKET_BIND_TUP = ("0.0.0.0", 20002)
+# the last known devices data and schedules, restored on startup until the first live broadcast
+STORAGE_KEY = DOMAIN + ".snapshot"
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 10
+# the broadcasts capture file, a magic header followed by a record per datagram: the receive time, the length and the raw datagram
+CAPTURE_FILE_MAGIC = b"SWV2CAP1"
+CAPTURE_RECORD_STRUCT = Struct("<dH")
+# the records are buffered on the event loop and written in the executor every flush records, the capture stops at the max bytes
+CAPTURE_FLUSH_RECORDS = 32
+CAPTURE_MAX_BYTES = 100 * 1024 * 1024
+# the devices silent for the silence window are unavailable, checked by a single timer wheel ticking for all the devices
+LIVENESS_WHEEL_TICK = datetime.timedelta(seconds=5)
+SNAPSHOT_SAVE_FIELDS = frozenset((CONF_IP_ADDRESS, CONF_DEVICE_NAME, CONF_STATE, CONF_AUTO_OFF))
+# the device data fields in the order of the device data fingerprint
+DEVICE_DATA_FIELDS = (CONF_IP_ADDRESS, CONF_DEVICE_NAME, CONF_STATE, CONF_TIME_LEFT, CONF_AUTO_OFF, CONF_CURRENT_POWER_CONSUMPTIOMN, CONF_ELECTRIC_CURRENT, CONF_LAST_STATE_CHANGE)
+DEVICE_DATA_STATE_IDX = DEVICE_DATA_FIELDS.index(CONF_STATE)
+# the power of successive broadcasts is integrated into kWh, a longer gap between broadcasts is not integrated
+ENERGY_MAX_SAMPLE_GAP = datetime.timedelta(seconds=60)
+ENERGY_DISPLAY_DIGITS = 2
+ENERGY_FIELDS = frozenset((CONF_DAILY_ENERGY, CONF_MONTHLY_ENERGY))
+# the broadcasts history rings slots by resolution, covering the last hour, day and week
+TELEMETRY_RING_SLOTS = {1: 3600, 60: 1440, 900: 672}
+TELEMETRY_EMPTY_SLOT = -1
 STATE_RESPONSE_ON = "0100"
 STATE_RESPONSE_OFF = "0000"
-COMMAND_ON = "1"
-COMMAND_OFF = "0"
-NO_TIMER_REQUESTED = "00000000"
-ENABLE_SCHEDULE = "01"
-DISABLE_SCHEDULE = "00"
+COMMAND_ON = 0x01
+COMMAND_OFF = 0x00
+NO_TIMER_REQUESTED = 0
+ENABLE_SCHEDULE = 0x01
+DISABLE_SCHEDULE = 0x00
+MAC_ADDRESS_FORMAT = "%02X:%02X:%02X:%02X:%02X:%02X"
+ISO_TIME_FORMAT = "%02d:%02d:%02d"
 DAYS_HEX_DICT = {0x02:MONDAY, 0x04:TUESDAY, 0x08:WEDNESDAY, 0x10:THURSDAY, 0x20:FRIDAY, 0x40:SATURDAY, 0x80:SUNDAY}
 DAYS_INT_DICT = {MONDAY: 2, TUESDAY: 4, WEDNESDAY: 8, THURSDAY: 16, FRIDAY:32, SATURDAY:64, SUNDAY: 128}
 
 """###############################
-######### Packet Formats #########
+######### Packet Layouts #########
+###############################"""
+# request frames with every variable field zeroed, the last four bytes are reserved for the crc signature
+# remote session id @8, timestamp @24, phone id @42, device password @46
+LOGIN_PACKET = ba.unhexlify("fef052000232a100{}340001000000000000000000{}00000000000000000000f0fe1c00{}0000{}00000000000000000000000000000000000000000000000000000000".format("00" * 4, "00" * 4, "00" * 2, "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40
+GET_STATE_PACKET = ba.unhexlify("fef0300002320103{}340001000000000000000000{}00000000000000000000f0fe{}00".format("00" * 4, "00" * 4, "00" * 3) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, command (1/0) @83, timer @85
+SEND_CONTROL_PACKET = ba.unhexlify("fef05d0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000106000{}00{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "0", "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, auto-off seconds @83
+SET_AUTO_OFF_PACKET = ba.unhexlify("fef05b0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000040400{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, name @80
+UPDATE_DEVICE_NAME_PACKET = ba.unhexlify("fef0740002320202{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "00" * 32) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48
+GET_SCHEDULES_PACKET = ba.unhexlify("fef0570002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000060000".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, schedule id @83
+DELETE_SCHEDULE_PACKET = ba.unhexlify("fef0580002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000801000{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "0") + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, schedule data @83 (time_id + on_off + week + timstate + start_time + end_time)
+DISABLE_ENABLE_SCHEDULE_PACKET = ba.unhexlify("fef0630002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000070c00{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "00" * 12) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, schedule data @84 (on_off + week + timstate + start_time + end_time)
+CREATE_SCHEDULE_PACKET = ba.unhexlify("fef0630002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000030c00ff{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "00" * 11) + "00" * 4)
+
+PACKET_CRC_LENGTH = 4
+SESSION_ID_STRUCT = Struct("<4s")
+SESSION_ID_OFFSET = 8
+TIMESTAMP_STRUCT = Struct("<I")
+TIMESTAMP_OFFSET = 24
+PACKET_DEVICE_STRUCT = Struct("<3sx2s2x4s")
+PACKET_DEVICE_OFFSET = 40
+PACKET_PAYLOAD_OFFSET = 83
+LOGIN_CREDENTIALS_STRUCT = Struct("<2s2x4s")
+LOGIN_CREDENTIALS_OFFSET = 42
+STATE_DEVICE_ID_STRUCT = Struct("<3s")
+CONTROL_STRUCT = Struct("<BxI")
+AUTO_OFF_STRUCT = Struct("<I")
+DEVICE_NAME_STRUCT = Struct("<32s")
+DEVICE_NAME_OFFSET = 80
+SCHEDULE_ID_STRUCT = Struct("<B")
+SCHEDULE_STRUCT = Struct("<BBBBII")
+CREATE_SCHEDULE_STRUCT = Struct("<BBBII")
+CREATE_SCHEDULE_OFFSET = 84
+CRC_STRUCT = Struct("<H")
+
+"""###############################
+####### Broadcast Layout #########
 ###############################"""
-# remote session id, timestamp, phone id, device password
-LOGIN_PACKET = "fef052000232a100{}340001000000000000000000{}00000000000000000000f0fe1c00{}0000{}00000000000000000000000000000000000000000000000000000000"
-# local session id, timestamp, device id
-GET_STATE_PACKET = "fef0300002320103{}340001000000000000000000{}00000000000000000000f0fe{}00"
-# local session id, timestamp, device id, phone id, device password, command (1/0), timer
-SEND_CONTROL_PACKET = "fef05d0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000106000{}00{}"
-# local session id, timestamp, device id, phone id, device password, auto-off seconds
-SET_AUTO_OFF_PACKET = "fef05b0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000040400{}"
-# local session id, timestamp, device id, phone id, device password, name
-UPDATE_DEVICE_NAME_PACKET = "fef0740002320202{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000{}"
-# local session id, timestamp, device id, phone id, device password
-GET_SCHEDULES_PACKET = "fef0570002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000060000"
-# local session id, timestamp, device id, phone id, device password, schedule id
-DELETE_SCHEDULE_PACKET = "fef0580002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000801000{}"
-# local session id, timestamp, device id, phone id, device password, schedule data (time_id + on_off + week + timstate + start_time + end_time)
-DISABLE_ENABLE_SCHEDULE_PACKET = "fef0630002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000070c00{}"
-# local session id, timestamp, device id, phone id, device password, schedule data (on_off + week + timstate + start_time + end_time)
-CREATE_SCHEDULE_PACKET = "fef0630002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000030c00ff{}"
+BROADCAST_MSG_LENGTH = 165
+BROADCAST_MSG_MAGIC = b"\xfe\xf0"
+BROADCAST_STATE_ON = 0x0001
+# device id, name, ip address, mac address, state, power (watts), time left (seconds), auto-off (seconds)
+BROADCAST_MSG_STRUCT = Struct("<18x3s21x32s2x4s6s47xHH10xI4xI")
 
 """###############################
 #### Tools Parsers Converters ####
@@ -526,66 +796,111 @@ def convert_seconds_to_iso_time(all_seconds):
     try:
         minutes, seconds = divmod(int(all_seconds), 60)
         hours, minutes = divmod(minutes, 60)
-        return datetime.time(hour=hours, minute=minutes, second=seconds).isoformat()
+        if not 0 <= hours < 24:
+            raise ValueError('hour must be in 0..23')
+        return ISO_TIME_FORMAT % (hours, minutes, seconds)
     except Exception:
         _LOGGER.exception('failed to create iso time from ' + str(all_seconds) + ' seconds')
         raise
 
 
 @callback
-def crc_sign_full_packet_com_key(data):
-    """CRC calculation"""
+def convert_iso_time_to_seconds(iso_time):
+    """convert iso time (%H:%M:%S) to seconds"""
+    hours, minutes, seconds = iso_time.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+@callback
+def crc_sign_packet(packet):
+    """CRC calculation, signs the packet in place over the last four bytes reserved for it"""
     try:
-        crc = ba.hexlify(pack('>I', ba.crc_hqx(ba.unhexlify(data), 0x1021))).decode(ENCODING_CODEC)
-        data = data + crc[6:8] + crc[4:6]
-        crc = crc[6:8] + crc[4:6] + (ba.hexlify(REMOTE_KEY)).decode(ENCODING_CODEC)
-        crc = ba.hexlify(pack('>I', ba.crc_hqx(ba.unhexlify(crc), 0x1021))).decode(ENCODING_CODEC)
-        data = data + crc[6:8] + crc[4:6]
-        return data
+        crc_offset = len(packet) - PACKET_CRC_LENGTH
+        CRC_STRUCT.pack_into(packet, crc_offset, ba.crc_hqx(memoryview(packet)[:crc_offset], 0x1021))
+        CRC_STRUCT.pack_into(packet, crc_offset + 2, ba.crc_hqx(REMOTE_KEY, ba.crc_hqx(memoryview(packet)[crc_offset:crc_offset + 2], 0x1021)))
+        return packet
     except:
         _LOGGER.exception('failed to sign crc ' + traceback.format_exc())
         raise
 
 
+@callback
+def get_devices_credentials(config):
+    """Return the configured devices credentials (phone id, device password) keyed by the lower cased device id"""
+    devices = list(config.get(CONF_DEVICES, []))
+    if CONF_DEVICE_ID in config:
+        devices.insert(0, {CONF_DEVICE_ID: config[CONF_DEVICE_ID]})
+
+    credentials = {}
+    for device in devices:
+        phone_id = device.get(CONF_PHONE_ID, config.get(CONF_PHONE_ID))
+        device_password = device.get(CONF_DEVICE_PASSWORD, config.get(CONF_DEVICE_PASSWORD))
+        if phone_id is None or device_password is None:
+            _LOGGER.error("missing phone id or device password for device " + device[CONF_DEVICE_ID] + ", the device will be ignored")
+            continue
+        credentials[device[CONF_DEVICE_ID].lower()] = (phone_id.lower(), device_password.lower())
+
+    return credentials
+
+@callback
+def get_attributes_policy(config):
+    """Return the attributes policy, the configured policy of an attribute overrides its default policy"""
+    attributes_policy = {}
+    for attribute, default_policy in DEFAULT_ATTRIBUTES_POLICY.items():
+        attributes_policy[attribute] = dict(default_policy, **config.get(CONF_ATTRIBUTES_POLICY, {}).get(attribute, {}))
+
+    return attributes_policy
+
 @callback
 def get_timestamp():
     """Generate timestamp"""
     try:
-        return ba.hexlify(pack('<I', int(round(time.time())))).decode(ENCODING_CODEC)
+        return int(round(time.time()))
     except Exception:
         _LOGGER.exception('failed to generate timestamp')
         raise
 
 
-@callback
-def get_socket(ip_addr):
-    """Connect to socket"""
+@asyncio.coroutine
+def async_get_connection(ip_addr):
+    """Open a stream connection to the device"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((ip_addr, SOCKET_PORT))
+        conn = yield from asyncio.wait_for(asyncio.open_connection(ip_addr, SOCKET_PORT), SOCKET_CONNECT_TIMEOUT)
         _LOGGER.debug('connected socket to ' + ip_addr)
-        return sock
+        return conn
     except Exception:
         _LOGGER.exception('failed to connect socket to ' + ip_addr + traceback.format_exc())
         raise
 
 
 @callback
-def close_socket_connection(sock, ip_addr):
-    """Close socket"""
+def close_connection(conn, ip_addr):
+    """Close stream connection"""
     try:
-        sock.close()
+        conn[1].close()
         _LOGGER.debug('closed socket connection to ' + ip_addr)
     except Exception:
         _LOGGER.exception('socket to '+ ip_addr + ' is not closable')
         pass
 
 
+@asyncio.coroutine
+def async_send_packet(conn, packet):
+    """Write packet to the device and read the response, each operation bound by its own deadline"""
+    reader, writer = conn
+    writer.write(packet)
+    yield from asyncio.wait_for(writer.drain(), SOCKET_OPERATION_TIMEOUT)
+    response = yield from asyncio.wait_for(reader.read(1024), SOCKET_OPERATION_TIMEOUT)
+    if not response:
+        raise ConnectionError('connection closed by the device')
+    return response
+
+
 @callback
 def convert_minutes_to_timer(minutes):
-    """convert minutes to hex for timer"""
+    """convert minutes to seconds for timer"""
     try:
-        return ba.hexlify(pack('<I', int(minutes) * 60)).decode(ENCODING_CODEC)
+        return int(minutes) * 60
     except Exception:
         _LOGGER.exception('failed to create timer from ' + str(minutes) + ' minutes')
         raise
@@ -593,13 +908,13 @@ def convert_minutes_to_timer(minutes):
 
 @callback
 def convert_timedelta_to_auto_off(full_time):
-    """convert timedelta seconds to hex for auto-off"""
+    """convert timedelta to seconds for auto-off"""
     try:
         minutes = full_time.total_seconds() / 60
         hours, minutes = divmod(minutes, 60)
         seconds = int(hours) * 3600 + int(minutes) * 60
         if seconds > 3599 and seconds < 86341:
-            return ba.hexlify(pack('<I', int(seconds))).decode(ENCODING_CODEC)
+            return seconds
     except Exception:
         _LOGGER.exception('failed to create auto-off from' + str(full_time) + 'timedelta')
         raise
@@ -609,7 +924,7 @@ def convert_timedelta_to_auto_off(full_time):
 def convert_string_to_device_name(name):
     """convert string to device name"""
     try:
-        return (ba.hexlify(name.encode(ENCODING_CODEC)) + ((32-len(name))*"00").encode(ENCODING_CODEC)).decode(ENCODING_CODEC)
+        return name.encode(ENCODING_CODEC)
     except Exception:
         _LOGGER.exception('failed to convert ' + name + ' to device name')
         raise
@@ -646,7 +961,7 @@ def convert_timedelta_to_schedule_time(time_value):
     """convert timedelta to schedule start/end time"""
     try:
         return_time = time.mktime(time.strptime(time.strftime("%d/%m/%Y") + " " + str(time_value).split(":")[0] + ":" + str(time_value).split(":")[1], "%d/%m/%Y %H:%M"))  
-        return ba.hexlify(pack('<I', int(return_time))).decode(ENCODING_CODEC)
+        return int(return_time)
     except Exception:
         _LOGGER.exception("failed to convert time value to schedule time")
         raise
@@ -658,332 +973,234 @@ def convert_timedelta_to_schedule_time(time_value):
 
 
 @asyncio.coroutine
-def async_send_login_packet(phone_id, device_password, sock, ts, retry=3):
-    """Send login packet"""
+def async_send_login_packet(session):
+    """Send login packet, not retried over the same connection as a late response would be read as the response of the retry"""
     try:
-        packet = crc_sign_full_packet_com_key(LOGIN_PACKET.format(REMOTE_SESSION_ID, ts, phone_id, device_password))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2LoginResponseMSG(sock.recv(1024))
+        packet = session.encoder.login(session.ts)
+        return SwitcherV2LoginResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
-        if retry > 0:
-            _LOGGER.warning('failed to send login packet, retrying')
-            return async_send_login_packet(phone_id, device_password, sock, ts, retry - 1)
-        else:
-            _LOGGER.error('failed to send login packet ' + traceback.format_exc())
-            raise
+        _LOGGER.error('failed to send login packet ' + traceback.format_exc())
+        raise
 
 
 @asyncio.coroutine
-def async_send_get_state_packet(device_id, sock, ts, session_id):
+def async_send_get_state_packet(session):
     """Send get state packet"""
     try:
-        packet = crc_sign_full_packet_com_key(GET_STATE_PACKET.format(session_id, ts, device_id))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2StateResponseMSG(sock.recv(1024))
+        packet = session.encoder.get_state(session.session_id, session.ts)
+        return SwitcherV2StateResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send state packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_control_packet(device_id, phone_id, device_password, sock, ts, session_id, cmd, timer=None):
+def async_send_control_packet(session, cmd, timer=None):
     """Send control packet"""
     try:
         if timer is None:
             """No timer requested"""
-            packet = crc_sign_full_packet_com_key(SEND_CONTROL_PACKET.format(session_id, ts, device_id, phone_id, device_password, cmd, NO_TIMER_REQUESTED))
+            packet = session.encoder.control(session.session_id, session.ts, cmd, NO_TIMER_REQUESTED)
         else:
             """Incorporate timer in packet"""
             _LOGGER.debug('incorporating timer for ' + timer + ' minutes')
-            packet = crc_sign_full_packet_com_key(SEND_CONTROL_PACKET.format(session_id, ts, device_id, phone_id, device_password, cmd, convert_minutes_to_timer(timer)))
+            packet = session.encoder.control(session.session_id, session.ts, cmd, convert_minutes_to_timer(timer))
 
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2ControlResponseMSG(sock.recv(1024))
+        return SwitcherV2ControlResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send control packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_set_auto_off_packet(device_id, phone_id, device_password, full_time, sock, ts, session_id):
+def async_send_set_auto_off_packet(session, full_time):
     """Send set auto-off packet"""
     try:
-        packet = crc_sign_full_packet_com_key(SET_AUTO_OFF_PACKET.format(session_id, ts, device_id, phone_id, device_password, convert_timedelta_to_auto_off(full_time)))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2SetAutoOffResponseMSG(sock.recv(1024))
+        packet = session.encoder.set_auto_off(session.session_id, session.ts, convert_timedelta_to_auto_off(full_time))
+        return SwitcherV2SetAutoOffResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send set auto-off packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_update_name_packet(device_id, phone_id, device_password, name, sock, ts, session_id):
+def async_send_update_name_packet(session, name):
     """Send set auto-off packet"""
     try:
-        packet = crc_sign_full_packet_com_key(UPDATE_DEVICE_NAME_PACKET.format(session_id, ts, device_id, phone_id, device_password, convert_string_to_device_name(name)))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2UpdateNameResponseMSG(sock.recv(1024))
+        packet = session.encoder.update_name(session.session_id, session.ts, convert_string_to_device_name(name))
+        return SwitcherV2UpdateNameResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send update name packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_get_schedules_packet(device_id, phone_id, device_password, sock, ts, session_id):
+def async_send_get_schedules_packet(session):
     """Send get schedule packet"""
     try:
-        packet = crc_sign_full_packet_com_key(GET_SCHEDULES_PACKET.format(session_id, ts, device_id, phone_id, device_password))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2GetScheduleResponseMSG(sock.recv(1024))
+        packet = session.encoder.get_schedules(session.session_id, session.ts)
+        return SwitcherV2GetScheduleResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send get schedules packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_disable_enable_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_data):
+def async_send_disable_enable_schedule_packet(session, schedule_data):
     """Send get schedule packet"""
     try:
-        packet = crc_sign_full_packet_com_key(DISABLE_ENABLE_SCHEDULE_PACKET.format(session_id, ts, device_id, phone_id, device_password, schedule_data))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2DisableEnableScheduleResponseMSG(sock.recv(1024))
+        packet = session.encoder.disable_enable_schedule(session.session_id, session.ts, schedule_data)
+        return SwitcherV2DisableEnableScheduleResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send disable enable schedule packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_delete_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_id):
+def async_send_delete_schedule_packet(session, schedule_id):
     """Send delete schedule packet"""
     try:
-        packet = crc_sign_full_packet_com_key(DELETE_SCHEDULE_PACKET.format(session_id, ts, device_id, phone_id, device_password, schedule_id))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2DeleteScheduleResponseMSG(sock.recv(1024))
+        packet = session.encoder.delete_schedule(session.session_id, session.ts, int(schedule_id))
+        return SwitcherV2DeleteScheduleResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send delete schedule packet ' + traceback.format_exc())
         raise
 
 
 @asyncio.coroutine
-def async_send_create_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_data):
+def async_send_create_schedule_packet(session, schedule_data):
     """Send create schedule packet"""
     try:
-        packet = crc_sign_full_packet_com_key(CREATE_SCHEDULE_PACKET.format(session_id, ts, device_id, phone_id, device_password, schedule_data))
-        sock.send(ba.unhexlify(packet))
-        return SwitcherV2CreateScheduleResponseMSG(sock.recv(1024))
+        packet = session.encoder.create_schedule(session.session_id, session.ts, schedule_data)
+        return SwitcherV2CreateScheduleResponseMSG((yield from async_send_packet(session.conn, packet)))
     except Exception:
         _LOGGER.error('failed to send create schedule packet ' + traceback.format_exc())
         raise
 
 
+PACKET_HANDLER_PHASES = {
+    async_send_get_state_packet: IO_PHASE_GET_STATE,
+    async_send_control_packet: IO_PHASE_CONTROL,
+    async_send_set_auto_off_packet: IO_PHASE_SET_AUTO_OFF,
+    async_send_update_name_packet: IO_PHASE_UPDATE_NAME,
+    async_send_get_schedules_packet: IO_PHASE_GET_SCHEDULES,
+    async_send_disable_enable_schedule_packet: IO_PHASE_DISABLE_ENABLE_SCHEDULE,
+    async_send_delete_schedule_packet: IO_PHASE_DELETE_SCHEDULE,
+    async_send_create_schedule_packet: IO_PHASE_CREATE_SCHEDULE
+}
+# requests the device may have executed when their response is lost, sending them again could run them twice
+NON_IDEMPOTENT_PACKET_HANDLERS = frozenset([async_send_create_schedule_packet, async_send_delete_schedule_packet])
+
 """############################
 ###### Request Handlers #######
 ############################"""
 
 
 @asyncio.coroutine
-def async_send_command_to_device(ip_address, phone_id, device_id, device_password, cmd, timer=None):
+def async_send_command_to_device(session, cmd, timer=None):
     """Handles control requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending control packet")
-                    response = yield from async_send_control_packet(device_id, phone_id, device_password, sock, ts, session_id, cmd, timer)
-                    if response.successful:
-                        _LOGGER.debug("control packet successful")
-
-            return response.successful  
+        _LOGGER.debug("sending control packet")
+        response = yield from session.async_request(async_send_control_packet, cmd, timer)
+        if response.successful:
+            _LOGGER.debug("control packet successful")
+
+        return response.successful
     except:
         _LOGGER.error('failed to control the device ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False
 
 
 @asyncio.coroutine
-def async_set_auto_off_to_device(ip_address, phone_id, device_id, device_password, full_time):
+def async_set_auto_off_to_device(session, full_time):
     """Handles set auto-off requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending auto-off config packet")
-                    response = yield from async_send_set_auto_off_packet(device_id, phone_id, device_password, full_time, sock, ts, session_id)
-                    if response.successful:
-                        _LOGGER.debug("auto-off config packet successful")
-
-            return response.successful
+        _LOGGER.debug("sending auto-off config packet")
+        response = yield from session.async_request(async_send_set_auto_off_packet, full_time)
+        if response.successful:
+            _LOGGER.debug("auto-off config packet successful")
+
+        return response.successful
     except:
         _LOGGER.error('failed to set auto-off for the device ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False
 
 
 @asyncio.coroutine
-def async_update_name_of_device(ip_address, phone_id, device_id, device_password, name):
+def async_update_name_of_device(session, name):
     """Handles update device name requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending name update packet")
-                    response = yield from async_send_update_name_packet(device_id, phone_id, device_password, name, sock, ts, session_id)
-                    if response.successful:
-                        _LOGGER.debug("name update packet successful")
-
-            return response.successful
+        _LOGGER.debug("sending name update packet")
+        response = yield from session.async_request(async_send_update_name_packet, name)
+        if response.successful:
+            _LOGGER.debug("name update packet successful")
+
+        return response.successful
     except:
         _LOGGER.error('failed to update the name of the device ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False
 
 
 @asyncio.coroutine
-def async_get_schedules(ip_address, phone_id, device_id, device_password):
+def async_get_schedules(session):
     """Handles get schedules requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending get schedule packet")
-                    response = yield from async_send_get_schedules_packet(device_id, phone_id, device_password, sock, ts, session_id)
-                    if response.successful:
-                        _LOGGER.debug("get schedule packet successful")
-
-            return response.successful, response
+        _LOGGER.debug("sending get schedule packet")
+        response = yield from session.async_request(async_send_get_schedules_packet)
+        if response.successful:
+            _LOGGER.debug("get schedule packet successful")
+
+        return response.successful, response
     except:
         _LOGGER.error('failed to get schedules from the device ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False, None
 
 
 @asyncio.coroutine
-def async_disable_enable_schedule(ip_address, phone_id, device_id, device_password, schedule_data):
+def async_disable_enable_schedule(session, schedule_data):
     """Handles disable enable schedule requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending disable enable schedule packet")
-                    response = yield from async_send_disable_enable_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_data)
-                    if response.successful:
-                        _LOGGER.debug("disable enable schedule packet successful")
-
-            return response.successful
+        _LOGGER.debug("sending disable enable schedule packet")
+        response = yield from session.async_request(async_send_disable_enable_schedule_packet, schedule_data)
+        if response.successful:
+            _LOGGER.debug("disable enable schedule packet successful")
+
+        return response.successful
     except:
         _LOGGER.error('failed to disable enable the schedule ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False
 
 
 @asyncio.coroutine
-def async_delete_schedule(ip_address, phone_id, device_id, device_password, schedule_id):
+def async_delete_schedule(session, schedule_id):
     """Handles delete schedule requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
-            if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending delete schedule packet")
-                    response = yield from async_send_delete_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_id)
-                    if response.successful:
-                        _LOGGER.debug("delete schedule packet successful")
-
-            return response.successful
+        _LOGGER.debug("sending delete schedule packet")
+        response = yield from session.async_request(async_send_delete_schedule_packet, schedule_id)
+        if response.successful:
+            _LOGGER.debug("delete schedule packet successful")
+
+        return response.successful
     except:
         _LOGGER.error('failed to delete the schedule ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False
 
 
 @asyncio.coroutine
-def async_create_schedule(ip_address, phone_id, device_id, device_password, schedule_data):
+def async_create_schedule(session, schedule_data):
     """Handles create schedule requests"""
-    sock = None
     try:
-        sock = get_socket(ip_address)
-        if not sock is None:
-            ts = get_timestamp()
-            _LOGGER.debug("sending login packet")
-            response = yield from async_send_login_packet(phone_id, device_password, sock, ts)
+        _LOGGER.debug("sending create schedule packet")
+        response = yield from session.async_request(async_send_create_schedule_packet, schedule_data)
+        if response.successful:
+            _LOGGER.debug("create schedule packet successful, sending get schedule packet")
+            response = yield from session.async_request(async_send_get_schedules_packet)
             if response.successful:
-                session_id = response.session_id
-                _LOGGER.debug("login packet successful retreived session id: " + session_id + ", sending state packet")
-                response = yield from async_send_get_state_packet(device_id, sock, ts, session_id)
-                if response.successful:
-                    _LOGGER.debug("state packet successful, sending create schedule packet")
-                    response = yield from async_send_create_schedule_packet(device_id, phone_id, device_password, sock, ts, session_id, schedule_data)
-                    if response.successful:
-                        _LOGGER.debug("create schedule packet successful, sending get schedule packet")
-                        response = yield from async_send_get_schedules_packet(device_id, phone_id, device_password, sock, ts, session_id)
-                        if response.successful:
-                            _LOGGER.debug("get schedule packet successful")
-
-            return response.successful, response
+                _LOGGER.debug("get schedule packet successful")
+
+        return response.successful, response
     except:
         _LOGGER.error('failed to create the schedule ' + traceback.format_exc())
-    finally:
-        if sock is not None:
-            close_socket_connection(sock, ip_address)
     return False, None
 
 """###########################
@@ -998,7 +1215,15 @@ def async_setup(hass, config):
     def discover_devices(event):
         """handle discovery response"""
         discoverd_device = event.data[CONF_DEVICE]
-        _LOGGER.debug("discoverd switcher version 2 device at " + discoverd_device.ip)
+        _LOGGER.debug("discoverd switcher version 2 device " + discoverd_device.device_id + " at " + discoverd_device.ip)
+        setup_started = time.monotonic()
+
+        """Suffix the entities and groups of each device when managing more then one device"""
+        if multiple_devices:
+            slug_suffix = "_" + discoverd_device.device_id
+            name_suffix = " " + discoverd_device.device_id
+        else:
+            slug_suffix = name_suffix = ""
 
         """Create calls and services functions"""
         @asyncio.coroutine
@@ -1011,7 +1236,7 @@ def async_setup(hass, config):
                 else:
                     func_name = "async_turn_off"
                 for entity_id in service.data["entity_id"]:
-                    for entity in [control_switch, select_schedule_sunday, select_schedule_monday, select_schedule_tuesday, select_schedule_wednesday, select_schedule_thursday, select_schedule_friday, select_schedule_saturday]:
+                    for entity in switch_entities:
                         if entity.entity_id == entity_id:
                             yield from hass.async_add_job(getattr(entity, func_name)())
             else:
@@ -1021,54 +1246,64 @@ def async_setup(hass, config):
         def async_set_auto_off_service(service):
             """Function to handle set auto off service calls"""
             _LOGGER.debug("received: " + service.service + " value passed is: " + str(service.data[CONF_AUTO_OFF]))
-            device = switcher_conn.get_device()
-            yield from async_set_auto_off_to_device(device.ip, device.phone_id, device.device_id, device.device_password, service.data[CONF_AUTO_OFF])
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            yield from device.command_queue.async_enqueue(async_set_auto_off_to_device, service.data[CONF_AUTO_OFF], coalesce_key=QUEUE_KEY_AUTO_OFF)
 
         @asyncio.coroutine
         def async_update_device_name_service(service):
             """Function to handle update device name service calls"""
             _LOGGER.debug("received: " + service.service + " value passed is: " + service.data[CONF_NAME])
-            device = switcher_conn.get_device()
-            yield from async_update_name_of_device(device.ip, device.phone_id, device.device_id, device.device_password, service.data[CONF_NAME])
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            yield from device.command_queue.async_enqueue(async_update_name_of_device, service.data[CONF_NAME], coalesce_key=QUEUE_KEY_DEVICE_NAME)
+
+        @asyncio.coroutine
+        def async_dump_io_metrics_service(service):
+            """Function to handle dump io metrics service calls"""
+            _LOGGER.debug("received: " + service.service)
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            metrics = device.session.metrics.dump()
+            _LOGGER.info("io metrics of device " + device.device_id + ": " + str(metrics))
+            hass.bus.async_fire(EVENT_SWITCHER_IO_METRICS, {CONF_DEVICE_ID: device.device_id, CONF_METRICS: metrics})
+
+        @asyncio.coroutine
+        def async_telemetry_stats_service(service):
+            """Function to handle telemetry stats service calls"""
+            _LOGGER.debug("received: " + service.service)
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            stats = device.telemetry.stats(service.data[CONF_WINDOW], TELEMETRY_RESOLUTIONS.get(service.data.get(CONF_RESOLUTION)), service.data[CONF_VIEW])
+            _LOGGER.info("telemetry stats of device " + device.device_id + ": " + str(stats))
+            hass.bus.async_fire(EVENT_SWITCHER_TELEMETRY_STATS, {CONF_DEVICE_ID: device.device_id, CONF_TELEMETRY: stats})
 
         @asyncio.coroutine
         def async_parse_retrieved_schedules(response):
             """Function to parse schedules response from get or create schedule requests"""
-            if response.found_schedules:
-                updated_schedules = []
-                _LOGGER.debug("got schedules from device, updating entities")
-                for schedule in response.get_schedules:
-                    _LOGGER.debug("updating schedule id " + schedule.schedule_id)
-                    if schedule.schedule_id == "0":
-                        updated_schedules.append(schedule_id0_sensor)
-                        yield from hass.async_add_job(schedule_id0_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "1":
-                        updated_schedules.append(schedule_id1_sensor)
-                        yield from hass.async_add_job(schedule_id1_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "2":
-                        updated_schedules.append(schedule_id2_sensor)
-                        yield from hass.async_add_job(schedule_id2_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "3":
-                        updated_schedules.append(schedule_id3_sensor)
-                        yield from hass.async_add_job(schedule_id3_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "4":
-                        updated_schedules.append(schedule_id4_sensor)
-                        yield from hass.async_add_job(schedule_id4_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "5":
-                        updated_schedules.append(schedule_id5_sensor)
-                        yield from hass.async_add_job(schedule_id5_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "6":
-                        updated_schedules.append(schedule_id6_sensor)
-                        yield from hass.async_add_job(schedule_id6_sensor.async_update_received(schedule))
-                    elif schedule.schedule_id == "7":
-                        updated_schedules.append(schedule_id7_sensor)
-                        yield from hass.async_add_job(schedule_id7_sensor.async_update_received(schedule))
-
-                for schedule_sens in schedule_sensor_list:
-                    if schedule_sens not in updated_schedules:
-                        yield from schedule_sens.async_deconfigure()
-            else:
+            switcher_conn.get_device(discoverd_device.device_id).update_schedules(response.get_schedules)
+            switcher_conn.save_snapshot()
+            if not response.found_schedules:
                 _LOGGER.debug("no schedules set on device")
+            yield from async_apply_schedules(response.get_schedules)
+
+        @asyncio.coroutine
+        def async_apply_schedules(schedules):
+            """Function to apply schedules to the schedule sensors, only the slots whose record changed are updated"""
+            if lean:
+                return
+
+            retrieved_schedules = [None] * MAX_SCHEDULES
+            for schedule in schedules:
+                if schedule.schedule_id is not None and int(schedule.schedule_id) < MAX_SCHEDULES:
+                    retrieved_schedules[int(schedule.schedule_id)] = schedule
+
+            for slot, schedule in enumerate(retrieved_schedules):
+                record = None if schedule is None else schedule.record
+                if record == schedule_records[slot]:
+                    continue
+                schedule_records[slot] = record
+                if schedule is None:
+                    yield from schedule_sensors[slot].async_deconfigure()
+                else:
+                    _LOGGER.debug("updating schedule id " + schedule.schedule_id)
+                    yield from hass.async_add_job(schedule_sensors[slot].async_update_received(schedule))
 
         @asyncio.coroutine
         def async_update_schedules_call(call=None):
@@ -1077,11 +1312,31 @@ def async_setup(hass, config):
                 _LOGGER.debug("received schedule update call: " + str(call))
             else:
                 _LOGGER.debug("initiated intervaled updates of schedule")
-            device = switcher_conn.get_device()
-            successful, response = yield from async_get_schedules(device.ip, device.phone_id, device.device_id, device.device_password)
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            result = yield from device.command_queue.async_enqueue(async_get_schedules, coalesce_key=QUEUE_KEY_GET_SCHEDULES)
+            if result == REQUEST_SUPERSEDED:
+                _LOGGER.debug("schedules update superseded by a pending schedules update")
+                return
+            successful, response = result
             if successful:
                 yield from async_parse_retrieved_schedules(response)
 
+        @asyncio.coroutine
+        def async_manage_device_schedule(device, service, schedule_id):
+            """Function to enable, disable or delete a schedule using the device schedules, used when the schedule sensors are not created"""
+            schedule = device.schedules.get(str(schedule_id))
+            if schedule is None:
+                _LOGGER.warning("schedule " + str(schedule_id) + " is not configured")
+            elif service == SERVICE_DELETE_SCHEDULE:
+                if not (yield from device.command_queue.async_enqueue(async_delete_schedule, schedule.schedule_id)):
+                    _LOGGER.error("failed to delete schedule " + schedule.schedule_id)
+            elif schedule.enabled == (service == SERVICE_ENABLE_SCHEDULE):
+                _LOGGER.warning("schedule " + schedule.schedule_id + " is already " + ("enabled" if schedule.enabled else "disabled"))
+            else:
+                schedule_data = schedule.schedule_data[0:1] + bytes((ENABLE_SCHEDULE if service == SERVICE_ENABLE_SCHEDULE else DISABLE_SCHEDULE,)) + schedule.schedule_data[2:]
+                if not (yield from device.command_queue.async_enqueue(async_disable_enable_schedule, schedule_data)):
+                    _LOGGER.error("failed to " + service.split("_")[0] + " schedule " + schedule.schedule_id)
+
         @asyncio.coroutine
         def async_manage_schedules_service(service):
             """Function to handle schedule managment (enable, disable, delete)"""
@@ -1094,24 +1349,13 @@ def async_setup(hass, config):
             else:
                 func_name = "async_delete"
 
-            device = switcher_conn.get_device()
-
-            if schedule_id == 0:
-                yield from getattr(schedule_id0_sensor, func_name)(device)
-            elif schedule_id == 1:
-                yield from getattr(schedule_id1_sensor, func_name)(device)
-            elif schedule_id == 2:
-                yield from getattr(schedule_id2_sensor, func_name)(device)
-            elif schedule_id == 3:
-                yield from getattr(schedule_id3_sensor, func_name)(device)
-            elif schedule_id == 4:
-                yield from getattr(schedule_id4_sensor, func_name)(device)
-            elif schedule_id == 5:
-                yield from getattr(schedule_id5_sensor, func_name)(device)
-            elif schedule_id == 6:
-                yield from getattr(schedule_id6_sensor, func_name)(device)
-            elif schedule_id == 7:
-                yield from getattr(schedule_id7_sensor, func_name)(device)
+            device = switcher_conn.get_device(discoverd_device.device_id)
+            if lean:
+                yield from async_manage_device_schedule(device, service.service, schedule_id)
+            else:
+                yield from getattr(schedule_sensors[schedule_id], func_name)(device)
+
+            yield from async_update_schedules_call(service.service)
 
         @asyncio.coroutine
         def async_create_schedule_service(service):
@@ -1125,288 +1369,345 @@ def async_setup(hass, config):
                     for day in service.data[CONF_DAYS]:
                         requested_days.append(DAYS_INT_DICT[day])
 
-                weekdays = "%02x" % (int(sum(requested_days)))
+                weekdays = int(sum(requested_days))
 
                 start_time = convert_timedelta_to_schedule_time(service.data[CONF_START_TIME])
                 end_time = convert_timedelta_to_schedule_time(service.data[CONF_END_TIME])
 
-                schedule_data = ENABLE_SCHEDULE + weekdays + "01" + str(start_time) + str(end_time)
+                schedule_data = CREATE_SCHEDULE_STRUCT.pack(ENABLE_SCHEDULE, weekdays, 0x01, start_time, end_time)
 
-                device = switcher_conn.get_device()
+                device = switcher_conn.get_device(discoverd_device.device_id)
 
-                successful, response = yield from async_create_schedule(device.ip, device.phone_id, device.device_id, device.device_password, schedule_data)
+                successful, response = yield from device.command_queue.async_enqueue(async_create_schedule, schedule_data)
                 if successful:
                     yield from async_parse_retrieved_schedules(response)
 
 
+        """Create the entities, their registrations and the groups creation are gathered once all are created"""
+        registration_tasks = []
+
         """Create the sensor entities"""
-        device_name_sensor = SwitcherSensor(hass, DEVICE_NAME_SENSOR_SLUG_ID, DEVICE_NAME_SENSOR_NAME, discoverd_device, ENTITY_DEVICE_NAME_CONFIG)
-        time_left_sensor = SwitcherSensor(hass, TIME_LEFT_SENSOR_SLUG_ID, TIME_LEFT_SENSOR_NAME, discoverd_device, ENTITY_TIME_LEFT_CONFIG)
-        electric_current_sensor = SwitcherSensor(hass, ELECTRIC_CURRENT_SENSOR_SLUG_ID, ELECTRIC_CURRENT_SENSOR_NAME, discoverd_device, ENTITY_ELECTRIC_CURRENT_CONFIG)
-        auto_off_sensor = SwitcherSensor(hass, AUTO_OFF_SENSOR_SLUG_ID, AUTO_OFF_SENSOR_NAME, discoverd_device, ENTITY_AUTO_OFF_CONFIG)
-
-        sensor_tasks = [sensor.async_update_ha_state() for sensor in [device_name_sensor, time_left_sensor, electric_current_sensor, auto_off_sensor]]
- 
-        yield from asyncio.wait(sensor_tasks, loop=hass.loop)
-
-        """Create the schedule sensor entities"""
-        schedule_id0_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("0"), SCHEDULE_SENSOR_NAME.format("0"), "0", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id1_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("1"), SCHEDULE_SENSOR_NAME.format("1"), "1", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id2_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("2"), SCHEDULE_SENSOR_NAME.format("2"), "2", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id3_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("3"), SCHEDULE_SENSOR_NAME.format("3"), "3", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id4_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("4"), SCHEDULE_SENSOR_NAME.format("4"), "4", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id5_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("5"), SCHEDULE_SENSOR_NAME.format("5"), "5", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id6_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("6"), SCHEDULE_SENSOR_NAME.format("6"), "6", ENTITY_SCHEDULE_SENSOR_CONFIG)
-        schedule_id7_sensor = SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format("7"), SCHEDULE_SENSOR_NAME.format("7"), "7", ENTITY_SCHEDULE_SENSOR_CONFIG)
-
-        schedule_sensor_list = [schedule_id0_sensor, schedule_id1_sensor, schedule_id2_sensor, schedule_id3_sensor, schedule_id4_sensor, schedule_id5_sensor, schedule_id6_sensor, schedule_id7_sensor]
-        schedule_sensor_tasks = [schedule_sensor.async_update_ha_state() for schedule_sensor in schedule_sensor_list]
-
-        yield from asyncio.wait(schedule_sensor_tasks, loop=hass.loop)
-
-        """Create the input number entities"""
-        current_hours = int(auto_off_sensor.state.split(':')[0])
-        auto_off_hours_slider = SwitcherSlider(hass, AUTO_OFF_HOURS_SLIDER_SLUG_ID, AUTO_OFF_HOURS_SLIDER_NAME, current_hours, 1, 23, 1, None, HOURS_SLIDER_UNIT, MODE_SLIDER, ENTITY_HOURS_SLIDER_CONFIG)
-        current_minutes = int(auto_off_sensor.state.split(':')[1])
-        auto_off_minutes_slider = SwitcherSlider(hass, AUTO_OFF_MINUTES_SLIDER_SLUG_ID, AUTO_OFF_MINUTES_SLIDER_NAME, current_minutes, 0, 59, 1, None, MINUTES_SLIDER_UNIT, MODE_SLIDER, ENTITY_MINUTES_SLIDER_CONFIG)
-
-        input_number_tasks = [input_number.async_update_ha_state() for input_number in [auto_off_hours_slider, auto_off_minutes_slider]]
- 
-        yield from asyncio.wait(input_number_tasks, loop=hass.loop)
-
-        """Create the input select entities"""
-        services_dict = hass.services.async_services()
-        if NOTIFY_DOMAIN in services_dict:
-            for service_name in services_dict[NOTIFY_DOMAIN]:
-                if not service_name == NOTIFY_DOMAIN:
-                    NOTIFICATION_SELECT_OPTIONS.append(service_name)
-
-        select_timer_input = SwitcherSelect(hass, TURN_ON_TIMER_SELECT_SLUG_ID, TURN_ON_TIMER_SELECT_NAME, TURN_ON_TIMER_SELECT_OPTIONS, ENTITY_TURN_ON_TIMER_SELECT_CONFIG)
-        select_notification_input = SwitcherSelect(hass, NOTIFICATION_SELECT_SLUG_ID, NOTIFICATION_SELECT_NAME, NOTIFICATION_SELECT_OPTIONS, ENTITY_NOTIFICATION_SELECT_CONFIG)
-        select_schedule_input = SwitcherSelect(hass, SCHEDULE_SELECT_SLUG_ID, SCHEDULE_SELECT_NAME, SCHEDULE_SELECT_OPTIONS, ENTITY_SCHEDULE_SELECT_CONFIG, "0")
-        select_schedule_action_input = SwitcherSelect(hass, SCHEDULE_ACTION_SELECT_SLUG_ID, SCHEDULE_ACTION_SELECT_NAME, SCHEDULE_SELECT_ACTION_OPTIONS, ENTITY_SCHEDULE_ACTION_SELECT_CONFIG, SCHEDULE_SELECT_ACTION_NONE)
-
-        input_select_tasks = [input_select.async_update_ha_state() for input_select in [select_timer_input, select_notification_input, select_schedule_input, select_schedule_action_input]]
-
-        yield from asyncio.wait(input_select_tasks, loop=hass.loop)
-
-        """Create input text entities"""
-        set_name_of_device_input = SwitcherText(hass, SET_NAME_OF_DEVICE_TEXT_SLUG_ID, SET_NAME_OF_DEVICE_TEXT_NAME, device_name_sensor.state, 2, 32, None, MODE_TEXT, ENTITY_SET_NAME_OF_DEVICE_TEXT_CONFIG)
-        set_schedule_start_time_input = SwitcherText(hass, SET_SCHEDULE_START_TIME_TEXT_SLUG_ID, SET_SCHEDULE_START_TIME_TEXT_NAME, "17:30", 4, 5, None, MODE_TEXT, ENTITY_SCHEDULE_START_TIME_TEXT_CONFIG)
-        set_schedule_end_time_input = SwitcherText(hass, SET_SCHEDULE_END_TIME_TEXT_SLUG_ID, SET_SCHEDULE_END_TIME_TEXT_NAME, "18:00", 4, 5, None, MODE_TEXT, ENTITY_SCHEDULE_END_TIME_TEXT_CONFIG)
-
-        input_text_tasks = [input_text.async_update_ha_state() for input_text in [set_name_of_device_input, set_schedule_start_time_input, set_schedule_end_time_input]]
-
-        yield from asyncio.wait(input_text_tasks, loop=hass.loop)
-
-        """Create the input boolean entities"""
-        select_schedule_sunday = SwitcherBoolean(hass, SUNDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, SUNDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_monday = SwitcherBoolean(hass, MONDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, MONDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_tuesday = SwitcherBoolean(hass, TUESDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, TUESDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_wednesday = SwitcherBoolean(hass, WEDNESDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, WEDNESDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_thursday = SwitcherBoolean(hass, THURSDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, THURSDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_friday = SwitcherBoolean(hass, FRIDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, FRIDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-        select_schedule_saturday = SwitcherBoolean(hass, SATURDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID, SATURDAY_CONTROL_INPUT_BOOLEAN_NAME, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
-
-        input_boolean_tasks = [input_boolean.async_update_ha_state() for input_boolean in [select_schedule_sunday, select_schedule_monday, select_schedule_tuesday, select_schedule_wednesday, select_schedule_thursday, select_schedule_friday, select_schedule_saturday]]
-
-        yield from asyncio.wait(input_boolean_tasks, loop=hass.loop)
-
-        """Create the script templates"""
-        auto_off_template = template_helper.Template("{{ ('0' + states." + auto_off_hours_slider.entity_id + ".state | int | string )[-2:] + ':' + ('0' + states." + auto_off_minutes_slider.entity_id + ".state | int | string )[-2:]}}", hass)
-
-        turn_on_timer_template = template_helper.Template("{% if states." + select_timer_input.entity_id + ".state | int == 15 %}" + ENTITY_ID_FORMAT.format(SERVICE_TURN_ON_15) +
-            "{% elif states." + select_timer_input.entity_id + ".state | int == 30 %}" + ENTITY_ID_FORMAT.format(SERVICE_TURN_ON_30) +
-            "{% elif states." + select_timer_input.entity_id + ".state | int == 45 %}" + ENTITY_ID_FORMAT.format(SERVICE_TURN_ON_45) +
-            "{% elif states." + select_timer_input.entity_id + ".state | int == 60 %}" + ENTITY_ID_FORMAT.format(SERVICE_TURN_ON_60) +
-            "{% endif %}", hass)
-
-        update_device_name_template = template_helper.Template("{{ states." + set_name_of_device_input.entity_id + ".state }}", hass)
-
-        perform_schedule_action_service_template = template_helper.Template("{% set selected_action = states('" + select_schedule_action_input.entity_id + "') %}" + 
-            "{% if selected_action == '" + SCHEDULE_SELECT_ACTION_ENABLE + "' %}" + ENTITY_ID_FORMAT.format(SERVICE_ENABLE_SCHEDULE) +
-            "{% elif selected_action == '" + SCHEDULE_SELECT_ACTION_DISABLE + "' %}" + ENTITY_ID_FORMAT.format(SERVICE_DISABLE_SCHEDULE) + 
-            "{% elif selected_action == '" + SCHEDULE_SELECT_ACTION_DELETE + "' %}" + ENTITY_ID_FORMAT.format(SERVICE_DELETE_SCHEDULE)  +
-            "{% else %}{{ selected_action }}{% endif %}", hass)
-
-        perform_schedule_action_data_template = template_helper.Template("{{ states('" + select_schedule_input.entity_id + "') | int }}" , hass)
-
-        create_schedule_start_time_template = template_helper.Template("{{ states('" + set_schedule_start_time_input.entity_id + "') }}", hass)
-
-        create_schedule_end_time_template = template_helper.Template("{{ states('" + set_schedule_end_time_input.entity_id + "') }}", hass)
-
-        create_schedule_recurring_template = template_helper.Template("{% if is_state('" + select_schedule_sunday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_monday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_tuesday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_wednesday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_thursday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_friday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% elif is_state('" + select_schedule_saturday.entity_id + "', '" + STATE_ON + "') %}true" +
-            "{% else %}false{% endif%}", hass)
-
-        create_schedule_days_template = template_helper.Template("{% set days_string = '' %}" +
-            "{% if is_state('" + select_schedule_sunday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + SUNDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_monday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + MONDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_tuesday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + TUESDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_wednesday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + WEDNESDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_thursday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + THURSDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_friday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + FRIDAY + ",' %}{% endif %}" +
-            "{% if is_state('" + select_schedule_saturday.entity_id + "', '" + STATE_ON + "') %}{% set days_string = days_string + '" + SATURDAY + ",' %}{% endif %}" +
-            "{% if days_string | length > 1 %}{{ days_string[:-1] }}{% endif %}", hass)
-
-        """Create the script config schemas"""
-        auto_off_config_data = {
-            ATTR_SERVICE: ENTITY_ID_FORMAT.format(SERVICE_SET_AUTO_OFF),
-            CONF_DATA_TEMPLATE: {
-                CONF_AUTO_OFF: auto_off_template
-            }
-        }
+        device_name_sensor = SwitcherSensor(hass, DEVICE_NAME_SENSOR_SLUG_ID + slug_suffix, DEVICE_NAME_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_DEVICE_NAME_CONFIG)
+        time_left_sensor = SwitcherSensor(hass, TIME_LEFT_SENSOR_SLUG_ID + slug_suffix, TIME_LEFT_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_TIME_LEFT_CONFIG)
+        electric_current_sensor = SwitcherSensor(hass, ELECTRIC_CURRENT_SENSOR_SLUG_ID + slug_suffix, ELECTRIC_CURRENT_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_ELECTRIC_CURRENT_CONFIG)
+        auto_off_sensor = SwitcherSensor(hass, AUTO_OFF_SENSOR_SLUG_ID + slug_suffix, AUTO_OFF_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_AUTO_OFF_CONFIG)
+        io_latency_sensor = SwitcherSensor(hass, IO_LATENCY_SENSOR_SLUG_ID + slug_suffix, IO_LATENCY_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_IO_LATENCY_CONFIG)
+        daily_energy_sensor = SwitcherSensor(hass, DAILY_ENERGY_SENSOR_SLUG_ID + slug_suffix, DAILY_ENERGY_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_DAILY_ENERGY_CONFIG)
+        monthly_energy_sensor = SwitcherSensor(hass, MONTHLY_ENERGY_SENSOR_SLUG_ID + slug_suffix, MONTHLY_ENERGY_SENSOR_NAME + name_suffix, discoverd_device, ENTITY_MONTHLY_ENERGY_CONFIG)
 
-        turn_on_timer_config_data = {
-            CONF_SERVICE_TEMPLATE: turn_on_timer_template
-        }
+        registration_tasks.extend(sensor.async_update_ha_state() for sensor in [device_name_sensor, time_left_sensor, electric_current_sensor, auto_off_sensor, io_latency_sensor, daily_energy_sensor, monthly_energy_sensor])
 
-        update_device_name_config_data = {
-            ATTR_SERVICE: ENTITY_ID_FORMAT.format(SERVICE_UPDATE_DEVICE_NAME),
-            CONF_DATA_TEMPLATE: {
-                CONF_NAME: update_device_name_template
-            }
-        }
+        """Create the switch entities"""
+        control_switch = SwitcherControl(hass, CONTROL_SWITCH_SLUG_ID + slug_suffix, CONTROL_SWITCH_NAME + name_suffix, discoverd_device, ENTITY_CONTROL_CONFIG)
+        registration_tasks.append(control_switch.async_update_ha_state())
 
-        perform_schedule_action_config = {
-            CONF_SERVICE_TEMPLATE: perform_schedule_action_service_template,
-            CONF_DATA_TEMPLATE: {
-                CONF_SCHEDULE_ID: perform_schedule_action_data_template
-            }
-        }
+        """Register entities for actions by device"""
+        device_entities = [device_name_sensor, time_left_sensor, electric_current_sensor, auto_off_sensor, io_latency_sensor, daily_energy_sensor, monthly_energy_sensor, control_switch]
+        switcher_conn.register_state_entities(discoverd_device.device_id, list(device_entities))
+        switch_entities = [control_switch]
+        groups_count = 0
+
+        """The helper entities, groups and view are skipped in lean mode, leaving the device to the services"""
+        if not lean:
+            """Create the schedule sensor entities"""
+            schedule_sensors = [SwitcherScheduleSensor(hass, SCHEDULE_SENSOR_SLUG_ID.format(slot) + slug_suffix, SCHEDULE_SENSOR_NAME.format(slot) + name_suffix, str(slot), ENTITY_SCHEDULE_SENSOR_CONFIG) for slot in range(MAX_SCHEDULES)]
+            """The schedule records last applied to the sensors by slot, None for empty slots"""
+            schedule_records = [SCHEDULE_RECORD_UNKNOWN] * MAX_SCHEDULES
+            registration_tasks.extend(schedule_sensor.async_update_ha_state() for schedule_sensor in schedule_sensors)
+
+            """Create the input number entities"""
+            current_hours = int(auto_off_sensor.state.split(':')[0])
+            auto_off_hours_slider = SwitcherSlider(hass, AUTO_OFF_HOURS_SLIDER_SLUG_ID + slug_suffix, AUTO_OFF_HOURS_SLIDER_NAME + name_suffix, current_hours, 1, 23, 1, None, HOURS_SLIDER_UNIT, MODE_SLIDER, ENTITY_HOURS_SLIDER_CONFIG)
+            current_minutes = int(auto_off_sensor.state.split(':')[1])
+            auto_off_minutes_slider = SwitcherSlider(hass, AUTO_OFF_MINUTES_SLIDER_SLUG_ID + slug_suffix, AUTO_OFF_MINUTES_SLIDER_NAME + name_suffix, current_minutes, 0, 59, 1, None, MINUTES_SLIDER_UNIT, MODE_SLIDER, ENTITY_MINUTES_SLIDER_CONFIG)
+
+            registration_tasks.extend(input_number.async_update_ha_state() for input_number in [auto_off_hours_slider, auto_off_minutes_slider])
+
+            """Create the input select entities"""
+            notification_select_options = list(NOTIFICATION_SELECT_OPTIONS)
+            services_dict = hass.services.async_services()
+            if NOTIFY_DOMAIN in services_dict:
+                for service_name in services_dict[NOTIFY_DOMAIN]:
+                    if not service_name == NOTIFY_DOMAIN:
+                        notification_select_options.append(service_name)
+
+            select_timer_input = SwitcherSelect(hass, TURN_ON_TIMER_SELECT_SLUG_ID + slug_suffix, TURN_ON_TIMER_SELECT_NAME + name_suffix, TURN_ON_TIMER_SELECT_OPTIONS, ENTITY_TURN_ON_TIMER_SELECT_CONFIG)
+            select_notification_input = SwitcherSelect(hass, NOTIFICATION_SELECT_SLUG_ID + slug_suffix, NOTIFICATION_SELECT_NAME + name_suffix, notification_select_options, ENTITY_NOTIFICATION_SELECT_CONFIG)
+            select_schedule_input = SwitcherSelect(hass, SCHEDULE_SELECT_SLUG_ID + slug_suffix, SCHEDULE_SELECT_NAME + name_suffix, SCHEDULE_SELECT_OPTIONS, ENTITY_SCHEDULE_SELECT_CONFIG, "0")
+            select_schedule_action_input = SwitcherSelect(hass, SCHEDULE_ACTION_SELECT_SLUG_ID + slug_suffix, SCHEDULE_ACTION_SELECT_NAME + name_suffix, SCHEDULE_SELECT_ACTION_OPTIONS, ENTITY_SCHEDULE_ACTION_SELECT_CONFIG, SCHEDULE_SELECT_ACTION_NONE)
+
+            registration_tasks.extend(input_select.async_update_ha_state() for input_select in [select_timer_input, select_notification_input, select_schedule_input, select_schedule_action_input])
+
+            """Create input text entities"""
+            set_name_of_device_input = SwitcherText(hass, SET_NAME_OF_DEVICE_TEXT_SLUG_ID + slug_suffix, SET_NAME_OF_DEVICE_TEXT_NAME + name_suffix, device_name_sensor.state, 2, 32, None, MODE_TEXT, ENTITY_SET_NAME_OF_DEVICE_TEXT_CONFIG)
+            set_schedule_start_time_input = SwitcherText(hass, SET_SCHEDULE_START_TIME_TEXT_SLUG_ID + slug_suffix, SET_SCHEDULE_START_TIME_TEXT_NAME + name_suffix, "17:30", 4, 5, None, MODE_TEXT, ENTITY_SCHEDULE_START_TIME_TEXT_CONFIG)
+            set_schedule_end_time_input = SwitcherText(hass, SET_SCHEDULE_END_TIME_TEXT_SLUG_ID + slug_suffix, SET_SCHEDULE_END_TIME_TEXT_NAME + name_suffix, "18:00", 4, 5, None, MODE_TEXT, ENTITY_SCHEDULE_END_TIME_TEXT_CONFIG)
+
+            registration_tasks.extend(input_text.async_update_ha_state() for input_text in [set_name_of_device_input, set_schedule_start_time_input, set_schedule_end_time_input])
+
+            """Create the input boolean entities"""
+            select_schedule_sunday = SwitcherBoolean(hass, SUNDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, SUNDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_monday = SwitcherBoolean(hass, MONDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, MONDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_tuesday = SwitcherBoolean(hass, TUESDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, TUESDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_wednesday = SwitcherBoolean(hass, WEDNESDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, WEDNESDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_thursday = SwitcherBoolean(hass, THURSDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, THURSDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_friday = SwitcherBoolean(hass, FRIDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, FRIDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+            select_schedule_saturday = SwitcherBoolean(hass, SATURDAY_CONTROL_INPUT_BOOLEAN_SLUG_ID + slug_suffix, SATURDAY_CONTROL_INPUT_BOOLEAN_NAME + name_suffix, False, ENTITY_SCHEDULE_DAYS_CONTROL_CONFIG)
+
+            registration_tasks.extend(input_boolean.async_update_ha_state() for input_boolean in [select_schedule_sunday, select_schedule_monday, select_schedule_tuesday, select_schedule_wednesday, select_schedule_thursday, select_schedule_friday, select_schedule_saturday])
+            switch_entities.extend([select_schedule_sunday, select_schedule_monday, select_schedule_tuesday, select_schedule_wednesday, select_schedule_thursday, select_schedule_friday, select_schedule_saturday])
+
+            """Create the script actions, reading the helper entities and calling the device services handlers directly"""
+            @asyncio.coroutine
+            def async_call_device_service(service_handler, service, schema, data):
+                """Function to validate the data collected from the helper entities and pass it to a service handler"""
+                try:
+                    data = schema(data)
+                except vol.Invalid as ex:
+                    _LOGGER.error("invalid values collected for " + service + ": " + str(ex))
+                    return
+                yield from service_handler(ServiceCall(DOMAIN, service, data))
+
+            @asyncio.coroutine
+            def async_set_auto_off_action():
+                """Function to set the auto off from the hours and minutes sliders"""
+                auto_off = ("0" + str(int(auto_off_hours_slider.state)))[-2:] + ":" + ("0" + str(int(auto_off_minutes_slider.state)))[-2:]
+                yield from async_call_device_service(async_set_auto_off_service, SERVICE_SET_AUTO_OFF, SET_AUTO_OFF_SERVICE_SCHEMA, {CONF_AUTO_OFF: auto_off})
+
+            @asyncio.coroutine
+            def async_turn_on_timer_action():
+                """Function to turn on the device with the timer from the timer select"""
+                if select_timer_input.state in TURN_ON_TIMER_SELECT_OPTIONS:
+                    yield from control_switch.async_turn_on_with_timer(select_timer_input.state)
+                else:
+                    _LOGGER.error("invalid timer selected: " + str(select_timer_input.state))
+
+            @asyncio.coroutine
+            def async_update_device_name_action():
+                """Function to update the device name from the device name text"""
+                yield from async_call_device_service(async_update_device_name_service, SERVICE_UPDATE_DEVICE_NAME, UPDATE_DEVICE_NAME_SERVICE_SCHEMA, {CONF_NAME: set_name_of_device_input.state})
+
+            @asyncio.coroutine
+            def async_perform_schedule_action():
+                """Function to perform the selected action on the selected schedule"""
+                service = SCHEDULE_SELECT_ACTION_SERVICES.get(select_schedule_action_input.state)
+                if service is None:
+                    _LOGGER.error("no schedule action selected")
+                    return
+                yield from async_call_device_service(async_manage_schedules_service, service, MANAGE_SCHEDULE_SERVICE_SCHEMA, {CONF_SCHEDULE_ID: select_schedule_input.state})
+
+            @asyncio.coroutine
+            def async_create_schedule_action():
+                """Function to create a schedule from the start and end time texts and the selected days"""
+                days = [day for day, select_day in zip(WEEKDAY_TUP, [select_schedule_monday, select_schedule_tuesday, select_schedule_wednesday, select_schedule_thursday, select_schedule_friday, select_schedule_saturday, select_schedule_sunday]) if select_day.is_on]
+                data = {
+                    CONF_START_TIME: set_schedule_start_time_input.state,
+                    CONF_END_TIME: set_schedule_end_time_input.state,
+                    CONF_RECURRING: len(days) > 0,
+                    CONF_DAYS: days
+                }
+                yield from async_call_device_service(async_create_schedule_service, SERVICE_CREATE_SCHEDULE, CREATE_SCHEDULE_SERVICE_SCHEMA, data)
+
+            """Create the script entities"""
+            set_auto_off_script = SwitcherScript(hass, AUTO_OFF_SCRIPT_SLUG_ID + slug_suffix, AUTO_OFF_SCRIPT_NAME + name_suffix, async_set_auto_off_action, ENTITY_AUTO_OFF_SCRIPT_CONFIG)
+            turn_on_timer_script = SwitcherScript(hass, TURN_ON_TIMER_SCRIPT_SLUG_ID + slug_suffix, TURN_ON_TIMER_SCRIPT_NAME + name_suffix, async_turn_on_timer_action, ENTITY_TURN_ON_TIMER_SCRIPT_CONFIG)
+            update_device_name_script = SwitcherScript(hass, UPDATE_DEVICE_NAME_SCRIPT_SLUG_ID + slug_suffix, UPDATE_DEVICE_NAME_SCRIPT_NAME + name_suffix, async_update_device_name_action, ENTITY_UPDATE_DEVICE_NAME_SCRIPT_CONFIG)
+            perform_schedule_action_script = SwitcherScript(hass, PERFORM_SCHEDULE_ACTION_SCRIPT_SLUG_ID + slug_suffix, PERFORM_SCHEDULE_ACTION_SCRIPT_NAME + name_suffix, async_perform_schedule_action, ENTITY_PERFORM_SCHEDULE_ACTION_SCRIPT_CONFIG)
+            create_schedule_script = SwitcherScript(hass, CREATE_SCHEDULE_SCRIPT_SLUG_ID + slug_suffix, CREATE_SCHEDULE_SCRIPT_NAME + name_suffix, async_create_schedule_action, ENTITY_CREATE_SCHEDULE_SCRIPT_CONFIG)
+
+            registration_tasks.extend(script.async_update_ha_state() for script in [set_auto_off_script, turn_on_timer_script, update_device_name_script, perform_schedule_action_script, create_schedule_script])
+
+            """Register the helper entities handlers for the service calls dispatcher"""
+            for domain, entities in [(INPUT_NUMBER_DOMAIN, [auto_off_hours_slider, auto_off_minutes_slider]),
+                                     (INPUT_SELECT_DOMAIN, [select_timer_input, select_notification_input, select_schedule_input, select_schedule_action_input]),
+                                     (INPUT_TEXT_DOMAIN, [set_name_of_device_input, set_schedule_start_time_input, set_schedule_end_time_input]),
+                                     (SCRIPT_DOMAIN, [set_auto_off_script, turn_on_timer_script, update_device_name_script, perform_schedule_action_script, create_schedule_script])]:
+                for entity in entities:
+                    service_call_handlers[(domain, entity.entity_id)] = entity.async_service_call_event
+                device_entities.extend(entities)
+            device_entities.extend(schedule_sensors + switch_entities[1:])
+
+            """Register the notification select for the device state changes"""
+            switcher_conn.register_notify_select_entity(discoverd_device.device_id, select_notification_input)
+
+            """Set the entities order for the groups"""
+            if create_groups:
+                control_group_entities = [
+                    control_switch.entity_id,
+                    time_left_sensor.entity_id,
+                    electric_current_sensor.entity_id,
+                    daily_energy_sensor.entity_id,
+                    monthly_energy_sensor.entity_id,
+                    device_name_sensor.entity_id,
+                    auto_off_sensor.entity_id,
+                    select_timer_input.entity_id,
+                    turn_on_timer_script.entity_id
+                ]
 
-        create_schedule_config = {
-            ATTR_SERVICE: ENTITY_ID_FORMAT.format(SERVICE_CREATE_SCHEDULE),
-            CONF_DATA_TEMPLATE: {
-                CONF_START_TIME: create_schedule_start_time_template,
-                CONF_END_TIME: create_schedule_end_time_template,
-                CONF_RECURRING: create_schedule_recurring_template,
-                CONF_DAYS: create_schedule_days_template
-            }
-        }
+                config_group_entities = [
+                    select_notification_input.entity_id,
+                    auto_off_hours_slider.entity_id,
+                    auto_off_minutes_slider.entity_id,
+                    set_auto_off_script.entity_id,
+                    set_name_of_device_input.entity_id,
+                    update_device_name_script.entity_id,
+                    io_latency_sensor.entity_id
+                ]
 
-        """Create the script entities"""
-        set_auto_off_script = SwitcherScript(hass, AUTO_OFF_SCRIPT_SLUG_ID, AUTO_OFF_SCRIPT_NAME, [auto_off_config_data], ENTITY_AUTO_OFF_SCRIPT_CONFIG)
-        turn_on_timer_script = SwitcherScript(hass, TURN_ON_TIMER_SCRIPT_SLUG_ID, TURN_ON_TIMER_SCRIPT_NAME, [turn_on_timer_config_data], ENTITY_TURN_ON_TIMER_SCRIPT_CONFIG)
-        update_device_name_script = SwitcherScript(hass, UPDATE_DEVICE_NAME_SCRIPT_SLUG_ID, UPDATE_DEVICE_NAME_SCRIPT_NAME, [update_device_name_config_data], ENTITY_UPDATE_DEVICE_NAME_SCRIPT_CONFIG)
-        perform_schedule_action_script = SwitcherScript(hass, PERFORM_SCHEDULE_ACTION_SCRIPT_SLUG_ID, PERFORM_SCHEDULE_ACTION_SCRIPT_NAME, [perform_schedule_action_config], ENTITY_PERFORM_SCHEDULE_ACTION_SCRIPT_CONFIG)
-        create_schedule_script = SwitcherScript(hass, CREATE_SCHEDULE_SCRIPT_SLUG_ID, CREATE_SCHEDULE_SCRIPT_NAME, [create_schedule_config], ENTITY_CREATE_SCHEDULE_SCRIPT_CONFIG)
+                schedule_group_entities = [
+                    select_schedule_input.entity_id,
+                    select_schedule_action_input.entity_id,
+                    perform_schedule_action_script.entity_id
+                ] + [schedule_sensor.entity_id for schedule_sensor in schedule_sensors]
+
+                create_schedule_entities = [
+                    set_schedule_start_time_input.entity_id,
+                    set_schedule_end_time_input.entity_id,
+                    select_schedule_sunday.entity_id,
+                    select_schedule_monday.entity_id,
+                    select_schedule_tuesday.entity_id,
+                    select_schedule_wednesday.entity_id,
+                    select_schedule_thursday.entity_id,
+                    select_schedule_friday.entity_id,
+                    select_schedule_saturday.entity_id,
+                    create_schedule_script.entity_id
+                ]
 
-        script_tasks = [script.async_update_ha_state() for script in [set_auto_off_script, turn_on_timer_script, update_device_name_script, perform_schedule_action_script, create_schedule_script]]
+                """Create the groups"""
+                create_groups_tasks = []
+                create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CONTROL_NAME + name_suffix, control_group_entities, object_id=GROUP_CONTROL_ENTITY + slug_suffix, control=ATTR_HIDDEN))
+                create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CONFIG_NAME + name_suffix, config_group_entities, object_id=GROUP_CONFIG_ENTITY + slug_suffix, control=ATTR_HIDDEN))
+                create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_SCHEDULES_NAME + name_suffix, schedule_group_entities, object_id=GROUP_SCHEDULES_ENTITY + slug_suffix, control=ATTR_HIDDEN))
+                create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CREATE_SCHEDULE_NAME + name_suffix, create_schedule_entities, object_id=GROUP_CREATE_SCHEDULE_ENTITY + slug_suffix, control=ATTR_HIDDEN))
 
-        yield from asyncio.wait(script_tasks, loop=hass.loop)
+                if create_view:
+                    view_group_entities = [
+                        GROUP_ENTITY_ID_FORMAT.format(GROUP_CONTROL_ENTITY + slug_suffix),
+                        GROUP_ENTITY_ID_FORMAT.format(GROUP_CONFIG_ENTITY + slug_suffix),
+                        GROUP_ENTITY_ID_FORMAT.format(GROUP_SCHEDULES_ENTITY + slug_suffix),
+                        GROUP_ENTITY_ID_FORMAT.format(GROUP_CREATE_SCHEDULE_ENTITY + slug_suffix)
+                    ]
 
-        """Create the switch entities"""
-        control_switch = SwitcherControl(hass, CONTROL_SWITCH_SLUG_ID, CONTROL_SWITCH_NAME, discoverd_device, ENTITY_CONTROL_CONFIG)
-        switch_tasks = [switch.async_update_ha_state() for switch in [control_switch]]
+                    create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, VIEW_NAME + name_suffix, view_group_entities, view=True, object_id=VIEW_ENTITY + slug_suffix))
 
-        yield from asyncio.wait(switch_tasks, loop=hass.loop)
+                registration_tasks.extend(create_groups_tasks)
+                groups_count = len(create_groups_tasks)
 
-        """Register entities for actions by device"""
-        switcher_conn.register_state_entities([device_name_sensor, time_left_sensor, electric_current_sensor, auto_off_sensor, control_switch])
-        switcher_conn.register_notify_select_entity(select_notification_input)
-
-        """Set the entities order for the groups"""
-        if create_groups:
-            control_group_entities = [
-                control_switch.entity_id,
-                time_left_sensor.entity_id,
-                electric_current_sensor.entity_id,
-                device_name_sensor.entity_id,
-                auto_off_sensor.entity_id,
-                select_timer_input.entity_id,
-                turn_on_timer_script.entity_id
-            ]
-
-            config_group_entities = [
-                select_notification_input.entity_id,
-                auto_off_hours_slider.entity_id,
-                auto_off_minutes_slider.entity_id,
-                set_auto_off_script.entity_id,
-                set_name_of_device_input.entity_id,
-                update_device_name_script.entity_id
-            ]
-
-            schedule_group_entities = [
-                select_schedule_input.entity_id,
-                select_schedule_action_input.entity_id,
-                perform_schedule_action_script.entity_id,
-                schedule_id0_sensor.entity_id,
-                schedule_id1_sensor.entity_id,
-                schedule_id2_sensor.entity_id,
-                schedule_id3_sensor.entity_id,
-                schedule_id4_sensor.entity_id,
-                schedule_id5_sensor.entity_id,
-                schedule_id6_sensor.entity_id,
-                schedule_id7_sensor.entity_id
-            ]
-
-            create_schedule_entities = [
-                set_schedule_start_time_input.entity_id,
-                set_schedule_end_time_input.entity_id,
-                select_schedule_sunday.entity_id,
-                select_schedule_monday.entity_id,
-                select_schedule_tuesday.entity_id,
-                select_schedule_wednesday.entity_id,
-                select_schedule_thursday.entity_id,
-                select_schedule_friday.entity_id,
-                select_schedule_saturday.entity_id,
-                create_schedule_script.entity_id
-            ]
-
-            """Create the groups"""
-            create_groups_tasks = []
-            create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CONTROL_NAME, control_group_entities, object_id=GROUP_CONTROL_ENTITY, control=ATTR_HIDDEN))
-            create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CONFIG_NAME, config_group_entities, object_id=GROUP_CONFIG_ENTITY, control=ATTR_HIDDEN))
-            create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_SCHEDULES_NAME, schedule_group_entities, object_id=GROUP_SCHEDULES_ENTITY, control=ATTR_HIDDEN))
-            create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, GROUP_CREATE_SCHEDULE_NAME, create_schedule_entities, object_id=GROUP_CREATE_SCHEDULE_ENTITY, control=ATTR_HIDDEN))
-
-            if create_view:
-                view_group_entities = [
-                    GROUP_ENTITY_ID_FORMAT.format(GROUP_CONTROL_ENTITY),
-                    GROUP_ENTITY_ID_FORMAT.format(GROUP_CONFIG_ENTITY),
-                    GROUP_ENTITY_ID_FORMAT.format(GROUP_SCHEDULES_ENTITY),
-                    GROUP_ENTITY_ID_FORMAT.format(GROUP_CREATE_SCHEDULE_ENTITY)
-                ]
+        yield from asyncio.gather(*registration_tasks, loop=hass.loop)
 
-                create_groups_tasks.append(hass.components.group.Group.async_create_group(hass, VIEW_NAME, view_group_entities, view=True, object_id=VIEW_ENTITY))
+        """Register the device services handlers for the services dispatcher"""
+        device_services = {}
+        for service in [SERVICE_TURN_ON, SERVICE_TURN_OFF, SERVICE_TURN_ON_15, SERVICE_TURN_ON_30, SERVICE_TURN_ON_45, SERVICE_TURN_ON_60]:
+            device_services[service] = async_switcher_control
 
-            yield from asyncio.gather(*create_groups_tasks, loop=hass.loop)
+        device_services[SERVICE_SET_AUTO_OFF] = async_set_auto_off_service
+        device_services[SERVICE_UPDATE_DEVICE_NAME] = async_update_device_name_service
 
-        """Register the services"""
-        for service in [SERVICE_TURN_ON_15, SERVICE_TURN_ON_30, SERVICE_TURN_ON_45, SERVICE_TURN_ON_60]:
-            hass.services.async_register(DOMAIN, service, async_switcher_control, schema={})
-        
-        hass.services.async_register(DOMAIN, SERVICE_TURN_ON, async_switcher_control, schema=TURN_ONOFF_SERVICE_SCHEMA)
-        hass.services.async_register(DOMAIN, SERVICE_TURN_OFF, async_switcher_control, schema=TURN_ONOFF_SERVICE_SCHEMA)
-        hass.services.async_register(DOMAIN, SERVICE_SET_AUTO_OFF, async_set_auto_off_service, schema=SET_AUTO_OFF_SERVICE_SCHEMA)
-        hass.services.async_register(DOMAIN, SERVICE_UPDATE_DEVICE_NAME, async_update_device_name_service, schema=UPDATE_DEVICE_NAME_SERVICE_SCHEMA)
-        
         for service in [SERVICE_ENABLE_SCHEDULE, SERVICE_DISABLE_SCHEDULE, SERVICE_DELETE_SCHEDULE]:
-            hass.services.async_register(DOMAIN, service, async_manage_schedules_service, schema=MANAGE_SCHEDULE_SERVICE_SCHEMA)
+            device_services[service] = async_manage_schedules_service
 
-        hass.services.async_register(DOMAIN, SERVICE_CREATE_SCHEDULE, async_create_schedule_service, schema=CREATE_SCHEDULE_SERVICE_SCHEMA)
-        
-        """Resgister intervaled calls for schedule update"""
+        device_services[SERVICE_CREATE_SCHEDULE] = async_create_schedule_service
+        device_services[SERVICE_DUMP_IO_METRICS] = async_dump_io_metrics_service
+        device_services[SERVICE_TELEMETRY_STATS] = async_telemetry_stats_service
+
+        devices_services[discoverd_device.device_id] = device_services
+        for entity in switch_entities:
+            entities_devices[entity.entity_id] = discoverd_device.device_id
+
+        _LOGGER.info("set up device " + discoverd_device.device_id + " with " + str(len(device_entities)) + " entities and " + str(groups_count) + " groups in " +
+                     str(round((time.monotonic() - setup_started) * 1000, 1)) + "ms" + (" (lean mode)" if lean else ""))
+
+        """Show the schedules restored from the snapshot until they are retrieved from the device"""
+        if discoverd_device.schedules:
+            yield from async_apply_schedules(list(discoverd_device.schedules.values()))
+
+        """Resgister schedules updates for unexplained state changes and as an intervaled safety net"""
+        switcher_conn.register_schedules_refresh(discoverd_device.device_id, async_update_schedules_call)
         yield from async_update_schedules_call()
         async_track_time_interval(hass, async_update_schedules_call, schedules_scan_interval)
 
+    @asyncio.coroutine
+    def async_dispatch_service(service):
+        """Function to route service calls to the handlers of the targeted devices"""
+        if service.service in [SERVICE_TURN_ON, SERVICE_TURN_OFF]:
+            device_ids = set(entities_devices[entity_id] for entity_id in service.data[CONF_ENTITY_ID] if entity_id in entities_devices)
+        elif CONF_DEVICE_ID in service.data:
+            device_ids = [service.data[CONF_DEVICE_ID].lower()]
+        elif service.service in [SERVICE_DUMP_IO_METRICS, SERVICE_TELEMETRY_STATS]:
+            device_ids = list(devices_services)
+        elif len(devices_credentials) == 1:
+            device_ids = list(devices_credentials)
+        else:
+            _LOGGER.error("received: " + service.service + " without a device id, the device id is mandatory when managing multiple devices")
+            return
+
+        for device_id in device_ids:
+            if device_id in devices_services:
+                yield from devices_services[device_id][service.service](service)
+            else:
+                _LOGGER.error("received: " + service.service + " for device " + device_id + " which is not configured or not yet discovered")
+
+    @asyncio.coroutine
+    def async_dispatch_service_call_event(event):
+        """Function to route the service calls of the helper entities to the handler of the targeted entity"""
+        service_data = event.data["service_data"]
+        if service_data is None or not isinstance(service_data.get("entity_id"), str):
+            return
+
+        handler = service_call_handlers.get((event.data["domain"], service_data["entity_id"]))
+        if handler is not None:
+            yield from handler(event)
+
+    """Get the configured devices"""
+    devices_credentials = get_devices_credentials(config[DOMAIN])
+    if not devices_credentials:
+        _LOGGER.error("no valid switcher device configured")
+        return False
+
+    multiple_devices = len(devices_credentials) > 1
+    devices_services = {}
+    entities_devices = {}
+    service_call_handlers = {}
+
     """Get group parameters"""
     create_groups = config[DOMAIN][CONF_CREATE_GROUPS]
     create_view = config[DOMAIN][CONF_CREATE_VIEW]
+    lean = config[DOMAIN][CONF_LEAN]
     schedules_scan_interval = config[DOMAIN][CONF_SCHEDULE_SCAN_INTERVAL]
 
-    """Listen for discoverd device"""
-    hass.bus.async_listen_once(EVENT_SWITCHER_DISCOVERY_DATA, discover_devices)
+    """Register the services"""
+    for service in [SERVICE_TURN_ON_15, SERVICE_TURN_ON_30, SERVICE_TURN_ON_45, SERVICE_TURN_ON_60]:
+        hass.services.async_register(DOMAIN, service, async_dispatch_service, schema=TURN_ON_TIMER_SERVICE_SCHEMA)
+
+    hass.services.async_register(DOMAIN, SERVICE_TURN_ON, async_dispatch_service, schema=TURN_ONOFF_SERVICE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_TURN_OFF, async_dispatch_service, schema=TURN_ONOFF_SERVICE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_SET_AUTO_OFF, async_dispatch_service, schema=SET_AUTO_OFF_SERVICE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_UPDATE_DEVICE_NAME, async_dispatch_service, schema=UPDATE_DEVICE_NAME_SERVICE_SCHEMA)
 
-    """Start the connection thread"""
-    switcher_conn = SwitcherV2(hass, config[DOMAIN])
-    switcher_conn.start()
+    for service in [SERVICE_ENABLE_SCHEDULE, SERVICE_DISABLE_SCHEDULE, SERVICE_DELETE_SCHEDULE]:
+        hass.services.async_register(DOMAIN, service, async_dispatch_service, schema=MANAGE_SCHEDULE_SERVICE_SCHEMA)
+
+    hass.services.async_register(DOMAIN, SERVICE_CREATE_SCHEDULE, async_dispatch_service, schema=CREATE_SCHEDULE_SERVICE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_DUMP_IO_METRICS, async_dispatch_service, schema=DUMP_IO_METRICS_SERVICE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_TELEMETRY_STATS, async_dispatch_service, schema=TELEMETRY_STATS_SERVICE_SCHEMA)
+
+    """Listen for the service calls of the helper entities"""
+    hass.bus.async_listen(EVENT_CALL_SERVICE, async_dispatch_service_call_event)
+
+    """Listen for discoverd devices"""
+    hass.bus.async_listen(EVENT_SWITCHER_DISCOVERY_DATA, discover_devices)
+
+    """Start the broadcast listener"""
+    capture_file = config[DOMAIN].get(CONF_CAPTURE_FILE)
+    switcher_conn = SwitcherV2(hass, devices_credentials, config[DOMAIN][CONF_HEARTBEAT_INTERVAL], config[DOMAIN][CONF_SILENCE_WINDOW], get_attributes_policy(config[DOMAIN]), Store(hass, STORAGE_VERSION, STORAGE_KEY),
+                               None if capture_file is None else hass.config.path(capture_file), config[DOMAIN][CONF_WARM_SESSIONS])
+    """Load the snapshot before listening, a device broadcasting meanwhile would otherwise be saved without its schedules and energy counters"""
+    snapshot = yield from switcher_conn.async_load_snapshot()
+    if not (yield from switcher_conn.async_start()):
+        return False
+
+    """Create the entities of the devices known from the last run, reconciled with their first broadcast"""
+    switcher_conn.restore_snapshot(snapshot)
 
     return True
 
@@ -1416,74 +1717,194 @@ def async_setup(hass, config):
 #############################"""
 
 
-class SwitcherV2(threading.Thread):
-    """represntation of the switcher version 2 connection"""
-    def __init__(self, hass, config):
-        threading.Thread.__init__(self)
+class SwitcherV2(asyncio.DatagramProtocol):
+    """represntation of the switcher version 2 connection, listens for the devices broadcasts on the event loop"""
+    def __init__(self, hass, devices_credentials, heartbeat_interval, silence_window, attributes_policy, store, capture_path=None, warm_sessions=False):
         """initialize the manager"""
         self._hass = hass
-        self._device = None
-        self._ok_to_run = False
+        self._warm_sessions = warm_sessions
+        self._store = store
+        self._capture_path = capture_path
+        self._capture = None
+        self._liveness = SwitcherV2LivenessWheel(silence_window, LIVENESS_WHEEL_TICK)
+        self._unsub_liveness = None
+        self._devices = {}
+        self._devices_credentials = devices_credentials
+        self._heartbeat_interval = heartbeat_interval
+        self._attributes_policy = attributes_policy
+        self._last_heartbeats = {}
+        self._unknown_devices = set()
+        self._transport = None
         self._last_exception_dt = None
         self._exception_count = 0
-        self._config = config
-        self._state_entities = None
-        self._notify_select_entity = None
+        self._state_entities = {}
+        self._notify_select_entities = {}
+        self._schedules_refreshes = {}
 
-    def run(self):
-        """register functions for event listening"""
-        self._hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, self.stop)
+    @asyncio.coroutine
+    def async_start(self):
+        """bind the broadcast listener to the event loop"""
+        _LOGGER.debug("starting broadcast listener")
+        if self._capture_path is not None:
+            try:
+                self._capture = yield from self._hass.async_add_executor_job(SwitcherV2Capture, self._capture_path)
+                _LOGGER.info("capturing the broadcasts to " + self._capture_path)
+            except:
+                _LOGGER.error("failed to open the capture file, the broadcasts are not captured " + traceback.format_exc())
 
-        """start discovery loop"""
-        _LOGGER.debug("starting broadcast watch loop")
         try:
-            tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            #tcp_socket.bind(("0.0.0.0", 20002))
-            tcp_socket.bind(SOCKET_BIND_TUP)
-            self._ok_to_run = True
+            self._transport, _ = yield from self._hass.loop.create_datagram_endpoint(lambda: self, local_addr=SOCKET_BIND_TUP)
         except:
             _LOGGER.error("exception while binding socket" + traceback.format_exc())
+            return False
+
+        """register functions for event listening"""
+        self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self.stop)
+        self._unsub_liveness = async_track_time_interval(self._hass, self.check_liveness, LIVENESS_WHEEL_TICK)
+        return True
 
-        conf_dev_id = self._config[CONF_DEVICE_ID].lower()
-        while self._ok_to_run:
+    @asyncio.coroutine
+    def async_load_snapshot(self):
+        """load the snapshot of the last run, before the listener starts so no device is discovered meanwhile"""
+        try:
+            return (yield from self._store.async_load())
+        except:
+            _LOGGER.error("failed to load the devices snapshot " + traceback.format_exc())
+            return None
+
+    @callback
+    def restore_snapshot(self, snapshot):
+        """create the configured devices known from the snapshot, a device discovered meanwhile gets the snapshot schedules and energy counters"""
+        for device_id, device_snapshot in (snapshot or {}).items():
+            credentials = self._devices_credentials.get(device_id)
+            if credentials is None:
+                continue
+            device = self._devices.get(device_id)
+            if device is not None:
+                self.merge_snapshot(device, device_snapshot)
+                continue
             try:
-                message, address = tcp_socket.recvfrom(1024)
-                msg = SwitcherV2BroadcastMSG(message)
-                if msg.verified:
-                    if conf_dev_id == msg.device_id:
-                        state_changed = datetime.datetime.now()
-                        if self._device is None:
-                            """New device disvoverd"""
-                            self._device = SwitcherV2Device(self.ident, msg.device_id, msg.ip, msg.mac, msg.name, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current, self._config[CONF_PHONE_ID].lower(), self._config[CONF_DEVICE_PASSWORD].lower(), state_changed)
-                            self._hass.bus.fire(EVENT_SWITCHER_DISCOVERY_DATA, {CONF_DEVICE: self._device})
-                        else:
-                            """Update known device"""
-                            change_occur = True
-                            prev_state = self._device.state
-                            if prev_state == msg.state:
-                                state_changed = self._device.last_state_change
-                                change_occur = False
-
-                            self._device.update_device_data(self.ident, msg.ip, msg.name, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current, state_changed)
-                            self.update_states_to_entities()
-
-                            if change_occur:
-                                self.send_state_change_notification()
-                    else:
-                        _LOGGER.warning("found switcher device with different device id")
-                else:
-                    _LOGGER.debug("message not verified as a switcher v2 broadcast message")
+                device = SwitcherV2Device(device_id, device_snapshot[CONF_IP_ADDRESS], device_snapshot[CONF_MAC_ADDRESS], device_snapshot[CONF_DEVICE_NAME], device_snapshot[CONF_STATE],
+                                          device_snapshot[CONF_TIME_LEFT], device_snapshot[CONF_AUTO_OFF], device_snapshot[CONF_CURRENT_POWER_CONSUMPTIOMN], device_snapshot[CONF_ELECTRIC_CURRENT],
+                                          credentials[0], credentials[1], datetime.datetime.fromtimestamp(device_snapshot[CONF_LAST_STATE_CHANGE]), self._attributes_policy, restored=True)
+                schedules = device_snapshot[CONF_SCHEDULES]
+                device.update_schedules([SwitcherV2Schedule(idx, schedules) for idx in range(len(schedules))])
+                device.energy_meter.restore(device_snapshot.get(CONF_ENERGY), live=False)
             except:
-                _LOGGER.exception("exception while discovering device data: " + traceback.format_exc())
-                self.check_loop_run()
+                _LOGGER.error("failed to restore device " + device_id + " from the snapshot " + traceback.format_exc())
                 continue
 
+            _LOGGER.debug("restored device " + device_id + " from the snapshot, waiting for its first broadcast")
+            self._devices[device_id] = device
+            self._liveness.seen(device_id, time.monotonic())
+            self._hass.bus.async_fire(EVENT_SWITCHER_DISCOVERY_DATA, {CONF_DEVICE: device})
+
+    @callback
+    def merge_snapshot(self, device, device_snapshot):
+        """merge the snapshot into a device discovered before it was restored, so the next save keeps its energy counters"""
+        _LOGGER.debug("device " + device.device_id + " was discovered before the snapshot was restored, merging the snapshot")
+        try:
+            if not device.schedules:
+                schedules = device_snapshot[CONF_SCHEDULES]
+                device.update_schedules([SwitcherV2Schedule(idx, schedules) for idx in range(len(schedules))])
+            device.energy_meter.restore(device_snapshot.get(CONF_ENERGY), live=True)
+        except:
+            _LOGGER.error("failed to merge the snapshot into device " + device.device_id + " " + traceback.format_exc())
+            return
+        self.save_snapshot()
+
+    @callback
+    def snapshot(self):
+        """return the snapshot of the devices data and schedules"""
+        return {device_id: device.as_snapshot() for device_id, device in self._devices.items()}
+
+    @callback
+    def save_snapshot(self):
+        """schedule a delayed save of the devices snapshot, consecutive changes are written once"""
+        self._store.async_delay_save(self.snapshot, STORAGE_SAVE_DELAY)
+
+    def datagram_received(self, data, addr):
+        """handle a broadcast message"""
+        if self._capture is not None:
+            self.capture_datagram(data)
+        try:
+            msg = SwitcherV2BroadcastMSG(data)
+            if msg.verified:
+                device = self._devices.get(msg.device_id)
+                state_changed = datetime.datetime.now()
+                if device is None:
+                    credentials = self._devices_credentials.get(msg.device_id)
+                    if credentials is None:
+                        if msg.device_id not in self._unknown_devices:
+                            self._unknown_devices.add(msg.device_id)
+                            _LOGGER.warning("found unconfigured switcher device " + msg.device_id + " at " + msg.ip + ", ignoring its broadcasts")
+                    else:
+                        """New device disvoverd"""
+                        device = SwitcherV2Device(msg.device_id, msg.ip, msg.mac, msg.name, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current, credentials[0], credentials[1], state_changed, self._attributes_policy)
+                        self._devices[msg.device_id] = device
+                        self._hass.bus.async_fire(EVENT_SWITCHER_DISCOVERY_DATA, {CONF_DEVICE: device})
+                        self.save_snapshot()
+                elif device.restored:
+                    """First broadcast of a device restored from the snapshot, a change while not running is not notified"""
+                    _LOGGER.debug("received the first broadcast of restored device " + device.device_id)
+                    if device.state == msg.state:
+                        state_changed = device.last_state_change
+                    changed_fields = device.update_device_data(msg.ip, msg.name, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current, state_changed)
+                    device.set_live(msg.mac)
+                    self.update_states_to_entities(device, changed_fields)
+                    self.save_snapshot()
+                else:
+                    """Update known device"""
+                    change_occur = True
+                    prev_state = device.state
+                    if prev_state == msg.state:
+                        state_changed = device.last_state_change
+                        change_occur = False
+                    else:
+                        """Check before the update, the previous time left is needed to explain the change"""
+                        change_explained = device.state_change_explained(msg.state, state_changed)
+
+                    changed_fields = device.update_device_data(msg.ip, msg.name, msg.state, msg.time_left, msg.auto_off, msg.power, msg.current, state_changed)
+                    self.update_states_to_entities(device, changed_fields)
+                    if not changed_fields.isdisjoint(SNAPSHOT_SAVE_FIELDS):
+                        self.save_snapshot()
+
+                    if change_occur:
+                        self.send_state_change_notification(device)
+                        if not change_explained:
+                            self.request_schedules_refresh(device)
+
+                if device is not None:
+                    if self._liveness.seen(device.device_id, time.monotonic()):
+                        _LOGGER.info("device " + device.device_id + " is broadcasting again, marking it available")
+                        device.set_available(True)
+                        self.update_availability_to_entities(device)
+                    device.telemetry.add_sample(device.last_update, msg.power, msg.state == STATE_ON, convert_iso_time_to_seconds(msg.time_left) if msg.state == STATE_ON else 0)
+                    if self._warm_sessions and device.session.warm_up_due:
+                        self._hass.async_add_job(device.session.async_warm_up())
+            else:
+                _LOGGER.debug("message not verified as a switcher v2 broadcast message")
+        except:
+            _LOGGER.exception("exception while discovering device data: " + traceback.format_exc())
+            self.check_loop_run()
+
+    def capture_datagram(self, data):
+        """Buffer a received datagram for the capture file, the capture is dropped once stopped by its size limit or a write error"""
+        if not self._capture.record(self._hass, data):
+            _LOGGER.info("captured " + str(self._capture.records) + " datagrams to " + self._capture.path)
+            self._capture = None
+
+    def error_received(self, exc):
+        """handle a socket error reported by the transport"""
+        _LOGGER.error("broadcast listener received an error: " + str(exc))
+        self.check_loop_run()
+
     def as_dict(self):
         """Callback for __dict__."""
         return self.__dict__
 
     def check_loop_run(self):
-        """Stop thread of too many excption (x exception in y minutes) occured"""
+        """Stop the listener if too many excption (x exception in y minutes) occured"""
 
         """max exceptions allowed in loop before exiting"""
         max_exceptions_before_stop = 50
@@ -1505,78 +1926,344 @@ class SwitcherV2(threading.Thread):
             self._exception_count = 0
 
         if not (max_exceptions_before_stop > self._exception_count):
-            _LOGGER.error("max exceptions allowed in watch loop exceeded, stoping thread")
+            _LOGGER.error("max exceptions allowed in broadcast listener exceeded, stoping listener")
             self.stop()
 
         self._last_exception_dt = current_dt
 
+    @callback
     def stop(self, event=None):
-        """Stop the thread"""
+        """Stop the listener"""
         if not event is None:
             _LOGGER.debug("received :" + event.event_type + " shutting down connection manager")
-        self._ok_to_run = False
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        for device in self._devices.values():
+            device.session.close()
+        if self._unsub_liveness is not None:
+            self._unsub_liveness()
+            self._unsub_liveness = None
+        if self._capture is not None:
+            _LOGGER.info("captured " + str(self._capture.records) + " datagrams to " + self._capture.path)
+            self._capture.stop(self._hass)
+            self._capture = None
+
+    def get_device(self, device_id):
+        """return the data of a discoverd device"""
+        return self._devices.get(device_id)
+
+    def register_state_entities(self, device_id, state_entities):
+        """Register state entities of a device for constant updates"""
+        self._state_entities[device_id] = state_entities
+        self._last_heartbeats[device_id] = datetime.datetime.now()
+
+    def register_notify_select_entity(self, device_id, entity):
+        """Register the notify select entity of a device for notifications"""
+        self._notify_select_entities[device_id] = entity
+
+    def register_schedules_refresh(self, device_id, async_refresh):
+        """Register the schedules refresh coroutine of a device for unexplained state changes"""
+        self._schedules_refreshes[device_id] = async_refresh
+
+    def request_schedules_refresh(self, device):
+        """Refresh the schedules of a device, a state change no known schedule explains hints a schedule set elsewhere"""
+        async_refresh = self._schedules_refreshes.get(device.device_id)
+        if async_refresh is not None:
+            _LOGGER.debug("unexplained state change of device " + device.device_id + ", refreshing schedules")
+            self._hass.async_add_job(async_refresh("unexplained state change"))
+
+    def update_states_to_entities(self, device, changed_fields):
+        """Update new device state to the entities watching the changed fields, all the entities are updated on heartbeat"""
+        state_entities = self._state_entities.get(device.device_id)
+        if state_entities is not None:
+            heartbeat = device.last_update - self._last_heartbeats[device.device_id] >= self._heartbeat_interval
+            if heartbeat:
+                self._last_heartbeats[device.device_id] = device.last_update
+                device.publish_fields()
+                """Checkpoint the energy counters, a state change saves them as well"""
+                self.save_snapshot()
+            elif not changed_fields:
+                return
+
+            for entity in state_entities:
+                if heartbeat or not entity.watched_fields.isdisjoint(changed_fields):
+                    self._hass.async_add_job(entity.async_update_received(device))
 
-    def get_device(self):
-        """return devices data"""
-        return self._device
+    @callback
+    def check_liveness(self, now=None):
+        """Mark the devices silent for the silence window as unavailable, called on every tick of the liveness wheel"""
+        for device_id in self._liveness.advance(time.monotonic()):
+            device = self._devices.get(device_id)
+            if device is not None:
+                _LOGGER.warning("device " + device_id + " stopped broadcasting, marking it unavailable")
+                device.set_available(False)
+                self.update_availability_to_entities(device)
+
+    def update_availability_to_entities(self, device):
+        """Update the availability of a device to all its entities"""
+        for entity in self._state_entities.get(device.device_id, []):
+            self._hass.async_add_job(entity.async_update_received(device))
+
+    def send_state_change_notification(self, device):
+        """Send notification for state changes"""
+        notify_select_entity = self._notify_select_entities.get(device.device_id)
+        if notify_select_entity and not notify_select_entity.state == NOTIFICATION_SELECT_NONE:
+            if device.state == STATE_ON:
+                data = dict(TIMER_TURN_ON_NOTIFICATION_DATA)
+                data["message"] = data["message"].format(device.name, device.time_left)
+            else:
+                data = dict(TIMER_TURN_OFF_NOTIFICATION_DATA)
+                data["message"] = data["message"].format(device.name)
+            
+            self._hass.async_add_job(self._hass.services.async_call(NOTIFY_DOMAIN, notify_select_entity.state, data))
+
+
+class SwitcherV2LivenessWheel(object):
+    """represntation of a timer wheel of the devices silence deadlines, a slot per tick and each device in the slot of its deadline"""
+    def __init__(self, silence_window, tick):
+        self._window = silence_window.total_seconds()
+        self._tick = tick.total_seconds()
+        """A deadline is at most a silence window away, a wheel revolution covers it without tracking rounds"""
+        self._slots = [set() for _ in range(int(math.ceil(self._window / self._tick)) + 1)]
+        self._position = 0
+        self._next_tick = None
+        self._last_seen = {}
+        self._scheduled = set()
+        self._silent = set()
 
-    def register_state_entities(self, state_entities):
-        """Register state entities for constant updates"""
-        self._state_entities = state_entities
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
 
-    def register_notify_select_entity(self, entity):
-        """Register the notify select entity for notifications"""
-        self._notify_select_entity = entity
+    def seen(self, device_id, now):
+        """Record a broadcast of a device, returns true if the device was silent until now"""
+        self._last_seen[device_id] = now
+        if device_id not in self._scheduled:
+            self.schedule(device_id, now + self._window)
+        if device_id in self._silent:
+            self._silent.discard(device_id)
+            return True
+        return False
 
-    def update_states_to_entities(self):
-        """Update new device state to entities"""
-        if self._state_entities is not None:
-            update_tasks = [entity.async_update_received(self._device) for entity in self._state_entities]
-            self._hass.add_job(asyncio.wait(update_tasks, loop=self._hass.loop))
+    def schedule(self, device_id, deadline):
+        """Put a device in the slot of the first tick after its deadline"""
+        if self._next_tick is None:
+            self._next_tick = deadline - self._window + self._tick
+        steps = max(0, int(math.ceil((deadline - self._next_tick) / self._tick)))
+        self._slots[(self._position + min(steps, len(self._slots) - 1)) % len(self._slots)].add(device_id)
+        self._scheduled.add(device_id)
+
+    def advance(self, now):
+        """Run the ticks due by now, returns the devices found silent, a device seen since it was scheduled moves to the slot of its new deadline"""
+        expired = []
+        while self._next_tick is not None and self._next_tick <= now:
+            due = self._slots[self._position]
+            self._slots[self._position] = set()
+            self._position = (self._position + 1) % len(self._slots)
+            self._next_tick += self._tick
+            for device_id in due:
+                self._scheduled.discard(device_id)
+                deadline = self._last_seen[device_id] + self._window
+                if deadline <= now:
+                    self._silent.add(device_id)
+                    expired.append(device_id)
+                else:
+                    self.schedule(device_id, deadline)
+        return expired
+
+
+class SwitcherV2Capture(object):
+    """represntation of the append only capture file of the received datagrams, replayed by tools/switcher_replay.py"""
+    def __init__(self, path):
+        """open the capture file for appending, a new file starts with the magic header, blocking and called in the executor"""
+        self._path = path
+        self._records = 0
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._stopped = False
+        self._writer = None
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_FILE_MAGIC)
+        self._size = self._file.tell()
 
-    def send_state_change_notification(self):
-        """Send notification for state changes"""
-        if self._notify_select_entity and not self._notify_select_entity.state == NOTIFICATION_SELECT_NONE:
-            if self._device.state == STATE_ON:
-                data = TIMER_TURN_ON_NOTIFICATION_DATA
-                data["message"] = data["message"].format(self._device.name, self._device.time_left)
-            else:
-                data = TIMER_TURN_OFF_NOTIFICATION_DATA
-                data["message"] = data["message"].format(self._device.name)
-            
-            self._hass.add_job(self._hass.services.async_call(NOTIFY_DOMAIN, self._notify_select_entity.state, data))
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    @callback
+    def record(self, hass, data):
+        """Buffer a datagram with its receive time, return false once the capture is stopped"""
+        if self._stopped:
+            return False
+        self._buffer += CAPTURE_RECORD_STRUCT.pack(time.time(), len(data))
+        self._buffer += data
+        self._buffered += 1
+        self._records += 1
+        self._size += CAPTURE_RECORD_STRUCT.size + len(data)
+        if self._size >= CAPTURE_MAX_BYTES:
+            _LOGGER.warning("the capture file reached " + str(CAPTURE_MAX_BYTES) + " bytes, stopping the capture")
+            self.stop(hass)
+            return False
+        if self._buffered >= CAPTURE_FLUSH_RECORDS:
+            self.flush(hass)
+        return True
+
+    @callback
+    def flush(self, hass):
+        """Write the buffered datagrams in the executor, a single writer at a time keeps the records in order"""
+        if self._writer is None:
+            self._writer = hass.async_add_job(self.async_write(hass))
+
+    @callback
+    def stop(self, hass):
+        """Stop the capture, the buffered datagrams are written and the file closed in the executor"""
+        self._stopped = True
+        self.flush(hass)
+
+    @asyncio.coroutine
+    def async_write(self, hass):
+        """Write the buffered datagrams until none is left, datagrams received meanwhile are written by the next round, the file is closed once stopped"""
+        try:
+            while self._buffer:
+                chunk = bytes(self._buffer)
+                self._buffer = bytearray()
+                self._buffered = 0
+                yield from hass.async_add_executor_job(self.write, chunk)
+            if self._stopped:
+                yield from hass.async_add_executor_job(self.close)
+        except OSError:
+            _LOGGER.error("failed to write to the capture file, stopping the capture " + traceback.format_exc())
+            self._stopped = True
+            self._buffer = bytearray()
+            yield from hass.async_add_executor_job(self.close)
+        finally:
+            self._writer = None
+
+    def write(self, chunk):
+        """Append buffered records to the capture file, blocking and called in the executor"""
+        self._file.write(chunk)
+        self._file.flush()
+
+    def close(self):
+        """Close the capture file, blocking and called in the executor, the records a failed write left unflushed are dropped"""
+        try:
+            self._file.close()
+        except OSError:
+            pass
+
+    @property
+    def path(self):
+        """Return the path of the capture file"""
+        return self._path
+
+    @property
+    def records(self):
+        """Return the number of datagrams captured since the file was opened"""
+        return self._records
 
 
 class SwitcherV2Device(object):
     """represntation of the switcher version data store"""
-    def __init__(self, thread_id, device_id, ip_address, mac_address, name, state, time_left, auto_off, power_consumption, electric_current, phone_id, device_password, last_state_change):
+    def __init__(self, device_id, ip_address, mac_address, name, state, time_left, auto_off, power_consumption, electric_current, phone_id, device_password, last_state_change, attributes_policy, restored=False):
         self._device_id = device_id
         self._mac_address = mac_address
+        self._restored = restored
+        self._available = True
         self._phone_id = phone_id
         self._device_password = device_password
-        self.update_device_data(thread_id, ip_address, name, state, time_left, auto_off, power_consumption, electric_current, last_state_change)
-
-    def update_device_data(self, thread_id, ip_address, name, state, time_left, auto_off, power_consumption, electric_current, last_state_change):
-        self._thread_id = thread_id
+        self._session = SwitcherV2Session(device_id, phone_id, device_password)
+        self._command_queue = SwitcherV2CommandQueue(self._session)
+        self._attributes_policy = attributes_policy
+        self._excluded_attributes = frozenset(attribute for attribute, policy in attributes_policy.items() if policy.get(CONF_EXCLUDE))
+        self._published_fields = {}
+        self._schedules = {}
+        self._fingerprint = (None,) * len(DEVICE_DATA_FIELDS)
+        self._energy_meter = SwitcherV2EnergyMeter()
+        self._telemetry = SwitcherV2Telemetry()
+        self.update_device_data(ip_address, name, state, time_left, auto_off, power_consumption, electric_current, last_state_change)
+
+    def update_device_data(self, ip_address, name, state, time_left, auto_off, power_consumption, electric_current, last_state_change):
+        """Update the device data, returns the set of fields changed since the last update"""
+        self._last_update = datetime.datetime.now()
+        """Every broadcast is a power sample, including the ones not changing the device data"""
+        energy_fields = ENERGY_FIELDS if self._energy_meter.add_sample(power_consumption, self._last_update) else frozenset()
+        fingerprint = (ip_address, name, state, time_left, auto_off, power_consumption, electric_current, last_state_change)
+        if fingerprint == self._fingerprint:
+            return energy_fields
+
+        state_changed = not state == self._fingerprint[DEVICE_DATA_STATE_IDX]
+        changed_fields = energy_fields.union(field for field, previous, current in zip(DEVICE_DATA_FIELDS, self._fingerprint, fingerprint) if not previous == current and self.check_significance(field, current, state_changed))
+        self._fingerprint = fingerprint
         self._ip_address = ip_address
+        self._session.set_ip(ip_address)
         self._name = name
         self._state = state
         self._time_left = time_left
         self._auto_off = auto_off
         self._power_consumption = power_consumption
         self._electric_current = electric_current
-        self._last_update = datetime.datetime.now()
         self._last_state_change = last_state_change
+        return changed_fields
+
+    def check_significance(self, field, value, force=False):
+        """Check a field change against its attributes policy, significant changes are recorded as published"""
+        policy = self._attributes_policy.get(field)
+        if policy is None:
+            return True
+
+        if not force and field in self._published_fields:
+            published_value, published_at = self._published_fields[field]
+            if CONF_MIN_INTERVAL in policy and self._last_update - published_at < policy[CONF_MIN_INTERVAL]:
+                return False
+            if CONF_MIN_DELTA in policy and isinstance(value, (int, float)) and isinstance(published_value, (int, float)) and abs(value - published_value) < policy[CONF_MIN_DELTA]:
+                return False
+
+        self._published_fields[field] = (value, self._last_update)
+        return True
+
+    def update_schedules(self, schedules):
+        """Replace the cached schedules with the schedules retrieved from the device"""
+        self._schedules = {schedule.schedule_id: schedule for schedule in schedules}
+
+    def state_change_explained(self, state, changed_at):
+        """Return true if a state change is explained by a control request, an expiring timer or a cached schedule"""
+        last_control = self._command_queue.last_executed(async_send_command_to_device)
+        if last_control is not None and time.monotonic() - last_control < STATE_CHANGE_EXPLAIN_WINDOW:
+            return True
+        if state == STATE_OFF and self._state == STATE_ON and convert_iso_time_to_seconds(self._time_left) <= STATE_CHANGE_EXPLAIN_WINDOW:
+            return True
+        return any(schedule.explains(state, changed_at) for schedule in self._schedules.values())
+
+    def set_live(self, mac_address):
+        """Mark a device restored from the snapshot as reconciled with its first broadcast"""
+        self._mac_address = mac_address
+        self._restored = False
+
+    def set_available(self, available):
+        """Mark the device available or unavailable by its broadcasts liveness"""
+        self._available = available
+
+    def as_snapshot(self):
+        """Return the device data and the raw schedule records for the snapshot"""
+        snapshot = dict(zip(DEVICE_DATA_FIELDS, self._fingerprint))
+        snapshot[CONF_LAST_STATE_CHANGE] = self._last_state_change.timestamp()
+        snapshot[CONF_MAC_ADDRESS] = self._mac_address
+        snapshot[CONF_SCHEDULES] = [ba.hexlify(schedule.record).decode(ENCODING_CODEC) for schedule in self._schedules.values() if schedule.record]
+        snapshot[CONF_ENERGY] = self._energy_meter.as_snapshot()
+        return snapshot
+
+    def publish_fields(self):
+        """Record the current values of the policy governed fields as published"""
+        for field, value in zip(DEVICE_DATA_FIELDS, self._fingerprint):
+            if field in self._attributes_policy:
+                self._published_fields[field] = (value, self._last_update)
 
     def as_dict(self):
         """Callback for __dict__."""
         return self.__dict__
 
-    @property
-    def thread_id(self):
-        """Return the thread id"""
-        return self._thread_id
-
     @property
     def device_id(self):
         """Return the device id"""
@@ -1622,6 +2309,16 @@ class SwitcherV2Device(object):
         """Return the power consumption in amps"""
         return self._electric_current
 
+    @property
+    def energy_meter(self):
+        """Return the energy meter of the device"""
+        return self._energy_meter
+
+    @property
+    def telemetry(self):
+        """Return the broadcasts history of the device"""
+        return self._telemetry
+
     @property
     def phone_id(self):
         """Return the phone id"""
@@ -1642,6 +2339,654 @@ class SwitcherV2Device(object):
         """Return the timestamp of the state change"""
         return self._last_state_change
 
+    @property
+    def excluded_attributes(self):
+        """Return the attributes excluded from the entities state attributes"""
+        return self._excluded_attributes
+
+    @property
+    def session(self):
+        """Return the persistent session with the device"""
+        return self._session
+
+    @property
+    def command_queue(self):
+        """Return the command queue of the device"""
+        return self._command_queue
+
+    @property
+    def schedules(self):
+        """Return the cached schedules by schedule id"""
+        return self._schedules
+
+    @property
+    def restored(self):
+        """Return true until the first broadcast of a device restored from the snapshot"""
+        return self._restored
+
+    @property
+    def available(self):
+        """Return false while the device is silent for the silence window"""
+        return self._available
+
+
+class SwitcherV2Session(object):
+    """represntation of a persistent authenticated session with a switcher version 2 device"""
+    def __init__(self, device_id, phone_id, device_password):
+        self._device_id = device_id
+        self._phone_id = phone_id
+        self._device_password = device_password
+        self._encoder = SwitcherV2PacketEncoder(device_id, phone_id, device_password)
+        self._ip_address = None
+        self._conn_ip_address = None
+        self._conn = None
+        self._ts = None
+        self._session_id = None
+        self._last_used = None
+        self._lock = None
+        self._next_warm_up = 0
+        self._warm_up_failures = 0
+        self._metrics = SwitcherV2IOMetrics()
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    @property
+    def device_id(self):
+        """Return the device id"""
+        return self._device_id
+
+    @property
+    def phone_id(self):
+        """Return the phone id"""
+        return self._phone_id
+
+    @property
+    def device_password(self):
+        """Return the device password"""
+        return self._device_password
+
+    @property
+    def encoder(self):
+        """Return the packet encoder of the device"""
+        return self._encoder
+
+    @property
+    def metrics(self):
+        """Return the io latency and errors metrics of the session"""
+        return self._metrics
+
+    @property
+    def conn(self):
+        """Return the stream connection pair"""
+        return self._conn
+
+    @property
+    def ts(self):
+        """Return the timestamp the session was logged in with"""
+        return self._ts
+
+    @property
+    def session_id(self):
+        """Return the session id retrieved on login"""
+        return self._session_id
+
+    @property
+    def logged_in(self):
+        """Return true if the session is connected, authenticated and not expired"""
+        if self._conn is None or self._session_id is None or self._conn[0].at_eof() or not self._conn_ip_address == self._ip_address:
+            return False
+        return time.monotonic() - self._last_used < SESSION_IDLE_EXPIRY
+
+    @property
+    def warm_up_due(self):
+        """Return true if the session is not in use, not warmed up recently and either not logged in or due a keep alive"""
+        if self._lock is not None and self._lock.locked():
+            return False
+        if time.monotonic() < self._next_warm_up:
+            return False
+        return not self.logged_in or time.monotonic() - self._last_used >= SESSION_KEEP_ALIVE
+
+    def set_ip(self, ip_address):
+        """Update the device address, safe from the listener thread, the session is dropped on the next request if the device moved"""
+        self._ip_address = ip_address
+
+    @callback
+    def close(self):
+        """Close the connection and forget the session"""
+        if self._conn is not None:
+            close_connection(self._conn, self._conn_ip_address)
+        self._conn = self._ts = self._session_id = None
+
+    @asyncio.coroutine
+    def async_login(self):
+        """Connect and authenticate, the state packet is sent once per session as the device expects"""
+        if self._conn is not None and not self._conn_ip_address == self._ip_address:
+            _LOGGER.debug("device " + self._device_id + " moved to " + self._ip_address + ", dropping session")
+        self.close()
+        try:
+            self._conn_ip_address = self._ip_address
+            self._conn = yield from self.async_timed(IO_PHASE_CONNECT, async_get_connection(self._ip_address))
+            self._ts = get_timestamp()
+            _LOGGER.debug("sending login packet")
+            response = yield from self.async_timed(IO_PHASE_LOGIN, async_send_login_packet(self))
+            if not response.successful:
+                raise ConnectionError('login to device ' + self._device_id + ' failed')
+            self._session_id = response.session_id
+            _LOGGER.debug("login packet successful retreived session id " + self._session_id.hex() + ", sending state packet")
+            response = yield from self.async_timed(IO_PHASE_GET_STATE, async_send_get_state_packet(self))
+            if not response.successful:
+                raise ConnectionError('state packet for device ' + self._device_id + ' failed')
+            _LOGGER.debug("state packet successful, session established")
+            self._last_used = time.monotonic()
+        except Exception:
+            self.close()
+            raise
+
+    @asyncio.coroutine
+    def async_warm_up(self):
+        """Log in ahead of the requests, or keep a logged in session alive before it expires, a request then only pays its own round trip.
+        Skipped if a request took the session meanwhile"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if not self.warm_up_due:
+            return
+        self._next_warm_up = time.monotonic() + SESSION_WARM_UP_RETRY
+        yield from self._lock.acquire()
+        try:
+            if self.logged_in:
+                _LOGGER.debug("keeping the session with device " + self._device_id + " alive")
+                response = yield from asyncio.wait_for(self.async_send_request(async_send_get_state_packet), SESSION_REQUEST_TIMEOUT)
+                if not response.successful:
+                    raise ConnectionError('state packet for device ' + self._device_id + ' failed')
+                self._last_used = time.monotonic()
+            else:
+                _LOGGER.debug("warming up the session with device " + self._device_id)
+                yield from asyncio.wait_for(self.async_login(), SESSION_REQUEST_TIMEOUT)
+            self._warm_up_failures = 0
+        except Exception:
+            self.close()
+            self._warm_up_failures += 1
+            self._next_warm_up = time.monotonic() + min(SESSION_WARM_UP_RETRY * 2 ** self._warm_up_failures, SESSION_WARM_UP_MAX_RETRY)
+            _LOGGER.debug("failed to warm up the session with device " + self._device_id + " " + traceback.format_exc())
+        finally:
+            self._lock.release()
+
+    @asyncio.coroutine
+    def async_timed(self, phase, coro):
+        """Await an io phase, recording its latency and counting exceptions and unsuccessful responses as errors"""
+        started = time.monotonic()
+        try:
+            result = yield from coro
+        except Exception:
+            self._metrics.record(phase, time.monotonic() - started, True)
+            raise
+        self._metrics.record(phase, time.monotonic() - started, getattr(result, "successful", True) is False)
+        return result
+
+    @asyncio.coroutine
+    def async_request(self, packet_handler, *args):
+        """Send a request over the session within SESSION_REQUEST_TIMEOUT, the session is closed if the request failed or timed out"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        yield from self._lock.acquire()
+        try:
+            response = yield from asyncio.wait_for(self.async_send_request(packet_handler, *args), SESSION_REQUEST_TIMEOUT)
+            self._last_used = time.monotonic()
+            return response
+        except Exception:
+            self.close()
+            raise
+        finally:
+            self._lock.release()
+
+    @asyncio.coroutine
+    def async_send_request(self, packet_handler, *args):
+        """Log in if needed and send the request, a failed login or a lost session is retried once over a new connection, a sent non idempotent request is not sent again"""
+        try:
+            if not self.logged_in:
+                yield from self.async_login()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _LOGGER.debug("login to device " + self._device_id + " failed, logging in again")
+            yield from self.async_login()
+
+        try:
+            return (yield from self.async_timed(PACKET_HANDLER_PHASES[packet_handler], packet_handler(self, *args)))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if packet_handler in NON_IDEMPOTENT_PACKET_HANDLERS:
+                _LOGGER.debug("request to device " + self._device_id + " failed after it was sent, not sending it again as the device may have executed it")
+                raise
+            _LOGGER.debug("session with device " + self._device_id + " failed, logging in again")
+            yield from self.async_login()
+            return (yield from self.async_timed(PACKET_HANDLER_PHASES[packet_handler], packet_handler(self, *args)))
+
+
+class SwitcherV2IOMetrics(object):
+    """represntation of the io latency histograms and error counts of a device session, by io phase"""
+    def __init__(self):
+        self._phases = {}
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    def record(self, phase, seconds, failed=False):
+        """Record the latency of an io phase"""
+        histogram = self._phases.get(phase)
+        if histogram is None:
+            histogram = self._phases[phase] = {CONF_BUCKETS: [0] * (len(IO_LATENCY_BUCKETS) + 1), CONF_COUNT: 0, CONF_ERRORS: 0, CONF_AVG_MS: 0.0, CONF_MAX_MS: 0.0}
+        milliseconds = seconds * 1000
+        histogram[CONF_BUCKETS][bisect.bisect_left(IO_LATENCY_BUCKETS, milliseconds)] += 1
+        histogram[CONF_COUNT] += 1
+        histogram[CONF_AVG_MS] += (milliseconds - histogram[CONF_AVG_MS]) / histogram[CONF_COUNT]
+        histogram[CONF_MAX_MS] = max(histogram[CONF_MAX_MS], milliseconds)
+        if failed:
+            histogram[CONF_ERRORS] += 1
+
+    def percentile(self, phase, fraction):
+        """Return the bucket upper bound holding the percentile of an io phase latency, capped by the max latency"""
+        histogram = self._phases.get(phase)
+        if histogram is None:
+            return None
+        max_ms = round(histogram[CONF_MAX_MS], 1)
+        rank = fraction * histogram[CONF_COUNT]
+        cumulative = 0
+        for bound, count in zip(IO_LATENCY_BUCKETS, histogram[CONF_BUCKETS]):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, max_ms)
+        return max_ms
+
+    @property
+    def summary(self):
+        """Return the count, errors and latency percentiles by io phase"""
+        return {phase: {
+            CONF_COUNT: histogram[CONF_COUNT],
+            CONF_ERRORS: histogram[CONF_ERRORS],
+            CONF_AVG_MS: round(histogram[CONF_AVG_MS], 1),
+            CONF_P50_MS: self.percentile(phase, 0.5),
+            CONF_P95_MS: self.percentile(phase, 0.95),
+            CONF_MAX_MS: round(histogram[CONF_MAX_MS], 1)
+        } for phase, histogram in self._phases.items()}
+
+    def dump(self):
+        """Return the summary with the full histogram by io phase, the buckets are keyed by their upper bound"""
+        dump = self.summary
+        for phase, histogram in self._phases.items():
+            labels = ["<=" + str(bound) for bound in IO_LATENCY_BUCKETS] + [">" + str(IO_LATENCY_BUCKETS[-1])]
+            dump[phase][CONF_BUCKETS] = dict(zip(labels, histogram[CONF_BUCKETS]))
+        return dump
+
+
+class SwitcherV2EnergyMeter(object):
+    """represntation of the energy consumed by a device, integrated from the power of its broadcasts"""
+    def __init__(self):
+        self._total_energy = 0.0
+        self._daily_energy = 0.0
+        self._monthly_energy = 0.0
+        self._energy_date = None
+        self._last_sample = None
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    def add_sample(self, power, sampled_at):
+        """Integrate the power since the previous sample (trapezoidal), returns true if the displayed daily or monthly energy changed"""
+        displayed = (self.daily_energy, self.monthly_energy)
+        sampled_date = sampled_at.date()
+        if not sampled_date == self._energy_date:
+            if self._energy_date is None or not (sampled_date.year, sampled_date.month) == (self._energy_date.year, self._energy_date.month):
+                self._monthly_energy = 0.0
+            self._daily_energy = 0.0
+            self._energy_date = sampled_date
+
+        if self._last_sample is not None:
+            last_sampled_at, last_power = self._last_sample
+            elapsed = sampled_at - last_sampled_at
+            """A gap of missed broadcasts is not integrated, the power during it is unknown"""
+            if datetime.timedelta(0) < elapsed <= ENERGY_MAX_SAMPLE_GAP:
+                kwh = (last_power + power) / 2 * elapsed.total_seconds() / 3600000
+                self._total_energy += kwh
+                self._daily_energy += kwh
+                self._monthly_energy += kwh
+
+        self._last_sample = (sampled_at, power)
+        return not displayed == (self.daily_energy, self.monthly_energy)
+
+    def restore(self, snapshot, live=False):
+        """Add the energy counters of the snapshot to the counters integrated since startup, the time not running is not integrated.
+        A live meter keeps integrating from its last broadcast, a meter of a restored device starts with the next broadcast"""
+        if not live:
+            self._last_sample = None
+        if snapshot:
+            today = datetime.date.today()
+            energy_date = datetime.datetime.strptime(snapshot[CONF_ENERGY_DATE], "%Y-%m-%d").date()
+            self._total_energy += snapshot[CONF_TOTAL_ENERGY]
+            self._daily_energy += snapshot[CONF_DAILY_ENERGY] if energy_date == today else 0.0
+            self._monthly_energy += snapshot[CONF_MONTHLY_ENERGY] if (energy_date.year, energy_date.month) == (today.year, today.month) else 0.0
+            self._energy_date = today
+
+    def as_snapshot(self):
+        """Return the energy counters for the snapshot"""
+        return {
+            CONF_TOTAL_ENERGY: self._total_energy,
+            CONF_DAILY_ENERGY: self._daily_energy,
+            CONF_MONTHLY_ENERGY: self._monthly_energy,
+            CONF_ENERGY_DATE: (self._energy_date or datetime.date.today()).isoformat()
+        }
+
+    @property
+    def daily_energy(self):
+        """Return the energy consumed today in kWh"""
+        return round(self._daily_energy, ENERGY_DISPLAY_DIGITS)
+
+    @property
+    def monthly_energy(self):
+        """Return the energy consumed this month in kWh"""
+        return round(self._monthly_energy, ENERGY_DISPLAY_DIGITS)
+
+    @property
+    def total_energy(self):
+        """Return the energy consumed since the meter started in kWh"""
+        return round(self._total_energy, ENERGY_DISPLAY_DIGITS)
+
+
+class SwitcherV2Telemetry(object):
+    """represntation of the broadcasts history of a device, a ring of power, state and time left aggregates per resolution"""
+    def __init__(self):
+        self._rings = [SwitcherV2TelemetryRing(resolution, TELEMETRY_RING_SLOTS[resolution]) for resolution in sorted(TELEMETRY_RING_SLOTS)]
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    def add_sample(self, sampled_at, power, on, time_left):
+        """Add the power, state and time left in seconds of a broadcast to all the rings"""
+        timestamp = int(sampled_at.timestamp())
+        for ring in self._rings:
+            ring.add_sample(timestamp, power, on, time_left)
+
+    def get_ring(self, window, resolution=None):
+        """Return the ring of the resolution, or the finest ring covering the window (the coarsest if none does)"""
+        if resolution is not None:
+            return next(ring for ring in self._rings if ring.resolution == resolution)
+        return next((ring for ring in self._rings if ring.coverage >= window.total_seconds()), self._rings[-1])
+
+    def stats(self, window, resolution=None, view=False):
+        """Return the min, max and avg of the power and time left and the on ratio over the last window, with the downsampled samples if view is requested"""
+        ring = self.get_ring(window, resolution)
+        end = int(time.time())
+        start = end - min(int(window.total_seconds()), ring.coverage)
+        stats = ring.stats(start, end)
+        if view:
+            stats[CONF_VIEW] = list(ring.view(start, end))
+        return stats
+
+
+class SwitcherV2TelemetryRing(object):
+    """represntation of a fixed size ring of broadcasts aggregates, a typed array per column and a slot per resolution step"""
+    def __init__(self, resolution, slots):
+        self._resolution = resolution
+        self._slots = slots
+        """The step held by each slot, a slot holding an older step is stale and is reset on its next sample"""
+        self._steps = array.array("q", [TELEMETRY_EMPTY_SLOT]) * slots
+        self._counts = array.array("I", [0]) * slots
+        self._on_counts = array.array("I", [0]) * slots
+        self._power_min = array.array("H", [0]) * slots
+        self._power_max = array.array("H", [0]) * slots
+        self._power_sum = array.array("d", [0]) * slots
+        self._time_left_min = array.array("I", [0]) * slots
+        self._time_left_max = array.array("I", [0]) * slots
+        self._time_left_sum = array.array("d", [0]) * slots
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    def add_sample(self, timestamp, power, on, time_left):
+        """Aggregate a sample into the slot of its step"""
+        step = timestamp // self._resolution
+        idx = step % self._slots
+        if self._steps[idx] == step:
+            self._power_min[idx] = min(self._power_min[idx], power)
+            self._power_max[idx] = max(self._power_max[idx], power)
+            self._time_left_min[idx] = min(self._time_left_min[idx], time_left)
+            self._time_left_max[idx] = max(self._time_left_max[idx], time_left)
+        else:
+            self._steps[idx] = step
+            self._counts[idx] = self._on_counts[idx] = 0
+            self._power_sum[idx] = self._time_left_sum[idx] = 0
+            self._power_min[idx] = self._power_max[idx] = power
+            self._time_left_min[idx] = self._time_left_max[idx] = time_left
+
+        self._counts[idx] += 1
+        self._on_counts[idx] += on
+        self._power_sum[idx] += power
+        self._time_left_sum[idx] += time_left
+
+    def iter_slots(self, start, end):
+        """Yield the indexes of the slots holding the steps between the start and end timestamps, oldest first"""
+        for step in range(max(start // self._resolution, end // self._resolution - self._slots + 1), end // self._resolution + 1):
+            idx = step % self._slots
+            if self._steps[idx] == step:
+                yield idx
+
+    def view(self, start, end):
+        """Yield the downsampled samples between the start and end timestamps, oldest first"""
+        for idx in self.iter_slots(start, end):
+            count = self._counts[idx]
+            yield {
+                CONF_LAST_UPDATE: datetime.datetime.fromtimestamp(self._steps[idx] * self._resolution).isoformat(),
+                CONF_SAMPLES: count,
+                CONF_ON_RATIO: round(self._on_counts[idx] / count, 3),
+                CONF_CURRENT_POWER_CONSUMPTIOMN: {CONF_MIN: self._power_min[idx], CONF_MAX: self._power_max[idx], CONF_AVG: round(self._power_sum[idx] / count, 1)},
+                CONF_TIME_LEFT: {CONF_MIN: self._time_left_min[idx], CONF_MAX: self._time_left_max[idx], CONF_AVG: round(self._time_left_sum[idx] / count, 1)}
+            }
+
+    def stats(self, start, end):
+        """Return the aggregates of the slots between the start and end timestamps, computed in a single pass"""
+        count = on_count = 0
+        power_sum = time_left_sum = 0.0
+        power_min = power_max = time_left_min = time_left_max = None
+        for idx in self.iter_slots(start, end):
+            count += self._counts[idx]
+            on_count += self._on_counts[idx]
+            power_sum += self._power_sum[idx]
+            time_left_sum += self._time_left_sum[idx]
+            power_min = self._power_min[idx] if power_min is None else min(power_min, self._power_min[idx])
+            power_max = self._power_max[idx] if power_max is None else max(power_max, self._power_max[idx])
+            time_left_min = self._time_left_min[idx] if time_left_min is None else min(time_left_min, self._time_left_min[idx])
+            time_left_max = self._time_left_max[idx] if time_left_max is None else max(time_left_max, self._time_left_max[idx])
+
+        return {
+            CONF_WINDOW: str(datetime.timedelta(seconds=end - start)),
+            CONF_RESOLUTION: str(datetime.timedelta(seconds=self._resolution)),
+            CONF_SAMPLES: count,
+            CONF_ON_RATIO: round(on_count / count, 3) if count else None,
+            CONF_CURRENT_POWER_CONSUMPTIOMN: {CONF_MIN: power_min, CONF_MAX: power_max, CONF_AVG: round(power_sum / count, 1) if count else None},
+            CONF_TIME_LEFT: {CONF_MIN: time_left_min, CONF_MAX: time_left_max, CONF_AVG: round(time_left_sum / count, 1) if count else None}
+        }
+
+    @property
+    def resolution(self):
+        """Return the seconds aggregated by each slot"""
+        return self._resolution
+
+    @property
+    def coverage(self):
+        """Return the seconds covered by the ring"""
+        return self._resolution * self._slots
+
+
+class SwitcherV2CommandQueue(object):
+    """represntation of a per device command queue, serializing the requests over the session and coalescing superseded ones"""
+    def __init__(self, session):
+        self._session = session
+        self._pending = collections.OrderedDict()
+        self._sequence = 0
+        self._worker = None
+        self._executing = False
+        self._wait_time = None
+        self._last_executed = {}
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    @property
+    def depth(self):
+        """Return the number of queued requests, including the one being executed"""
+        return len(self._pending) + (1 if self._executing else 0)
+
+    @property
+    def wait_time(self):
+        """Return the seconds the last executed request waited in the queue"""
+        return None if self._wait_time is None else round(self._wait_time, 3)
+
+    def last_executed(self, request_handler):
+        """Return the monotonic time the last successful request of a request handler was executed, None if never successful"""
+        return self._last_executed.get(request_handler)
+
+    @asyncio.coroutine
+    def async_enqueue(self, request_handler, *args, coalesce_key=None):
+        """Queue a request handler and wait for its result, a pending request with the same coalesce key is superseded.
+        The superseded caller gets REQUEST_SUPERSEDED and not the result of the request replacing it, which takes its queue position and wait time"""
+        future = asyncio.get_event_loop().create_future()
+        if coalesce_key is None:
+            self._sequence += 1
+            coalesce_key = self._sequence
+        if coalesce_key in self._pending:
+            _LOGGER.debug("superseding pending " + str(coalesce_key) + " request for device " + self._session.device_id)
+            superseded_future, enqueued_at = self._pending[coalesce_key][2:]
+            if not superseded_future.done():
+                superseded_future.set_result(REQUEST_SUPERSEDED)
+            self._pending[coalesce_key] = (request_handler, args, future, enqueued_at)
+        else:
+            self._pending[coalesce_key] = (request_handler, args, future, time.monotonic())
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self.async_process_queue())
+        return (yield from future)
+
+    @asyncio.coroutine
+    def async_process_queue(self):
+        """Execute the queued requests one at a time in the order they were queued"""
+        while self._pending:
+            request_handler, args, future, enqueued_at = self._pending.popitem(last=False)[1]
+            self._wait_time = time.monotonic() - enqueued_at
+            self._executing = True
+            try:
+                result = yield from request_handler(self._session, *args)
+                """the request handlers return their success flag, alone or with the response"""
+                if (result[0] if isinstance(result, tuple) else result):
+                    self._last_executed[request_handler] = time.monotonic()
+                if not future.done():
+                    future.set_result(result)
+            except Exception as ex:
+                _LOGGER.error('queued request for device ' + self._session.device_id + ' failed ' + traceback.format_exc())
+                if not future.done():
+                    future.set_exception(ex)
+            finally:
+                self._executing = False
+
+
+class SwitcherV2PacketEncoder(object):
+    """bytes level encoder of the switcher version 2 request packets, the device invariant bytes are cached per frame"""
+    def __init__(self, device_id, phone_id, device_password):
+        device_id = ba.unhexlify(device_id)
+        phone_id = ba.unhexlify(phone_id)
+        device_password = ba.unhexlify(device_password)
+
+        self._login_frame = bytearray(LOGIN_PACKET)
+        LOGIN_CREDENTIALS_STRUCT.pack_into(self._login_frame, LOGIN_CREDENTIALS_OFFSET, phone_id, device_password)
+        self._login_frame = bytes(self._login_frame)
+
+        self._get_state_frame = bytearray(GET_STATE_PACKET)
+        STATE_DEVICE_ID_STRUCT.pack_into(self._get_state_frame, PACKET_DEVICE_OFFSET, device_id)
+        self._get_state_frame = bytes(self._get_state_frame)
+
+        self._control_frame = self._prepare_frame(SEND_CONTROL_PACKET, device_id, phone_id, device_password)
+        self._set_auto_off_frame = self._prepare_frame(SET_AUTO_OFF_PACKET, device_id, phone_id, device_password)
+        self._update_name_frame = self._prepare_frame(UPDATE_DEVICE_NAME_PACKET, device_id, phone_id, device_password)
+        self._get_schedules_frame = self._prepare_frame(GET_SCHEDULES_PACKET, device_id, phone_id, device_password)
+        self._delete_schedule_frame = self._prepare_frame(DELETE_SCHEDULE_PACKET, device_id, phone_id, device_password)
+        self._disable_enable_schedule_frame = self._prepare_frame(DISABLE_ENABLE_SCHEDULE_PACKET, device_id, phone_id, device_password)
+        self._create_schedule_frame = self._prepare_frame(CREATE_SCHEDULE_PACKET, device_id, phone_id, device_password)
+
+    @staticmethod
+    def _prepare_frame(packet, device_id, phone_id, device_password):
+        """Fill the device invariant fields of a request frame"""
+        frame = bytearray(packet)
+        PACKET_DEVICE_STRUCT.pack_into(frame, PACKET_DEVICE_OFFSET, device_id, phone_id, device_password)
+        return bytes(frame)
+
+    @staticmethod
+    def _new_packet(frame, session_id, timestamp):
+        """Copy a cached frame into a new buffer and fill the session fields"""
+        packet = bytearray(frame)
+        SESSION_ID_STRUCT.pack_into(packet, SESSION_ID_OFFSET, session_id)
+        TIMESTAMP_STRUCT.pack_into(packet, TIMESTAMP_OFFSET, timestamp)
+        return packet
+
+    def as_dict(self):
+        """Callback for __dict__."""
+        return self.__dict__
+
+    def login(self, timestamp):
+        """Return a signed login packet, the remote session id is all zeros"""
+        packet = bytearray(self._login_frame)
+        TIMESTAMP_STRUCT.pack_into(packet, TIMESTAMP_OFFSET, timestamp)
+        return crc_sign_packet(packet)
+
+    def get_state(self, session_id, timestamp):
+        """Return a signed get state packet"""
+        return crc_sign_packet(self._new_packet(self._get_state_frame, session_id, timestamp))
+
+    def control(self, session_id, timestamp, cmd, timer_seconds):
+        """Return a signed control packet"""
+        packet = self._new_packet(self._control_frame, session_id, timestamp)
+        CONTROL_STRUCT.pack_into(packet, PACKET_PAYLOAD_OFFSET, cmd, timer_seconds)
+        return crc_sign_packet(packet)
+
+    def set_auto_off(self, session_id, timestamp, auto_off_seconds):
+        """Return a signed set auto-off packet"""
+        packet = self._new_packet(self._set_auto_off_frame, session_id, timestamp)
+        AUTO_OFF_STRUCT.pack_into(packet, PACKET_PAYLOAD_OFFSET, auto_off_seconds)
+        return crc_sign_packet(packet)
+
+    def update_name(self, session_id, timestamp, name):
+        """Return a signed update name packet, the name is padded to 32 bytes"""
+        packet = self._new_packet(self._update_name_frame, session_id, timestamp)
+        DEVICE_NAME_STRUCT.pack_into(packet, DEVICE_NAME_OFFSET, name)
+        return crc_sign_packet(packet)
+
+    def get_schedules(self, session_id, timestamp):
+        """Return a signed get schedules packet"""
+        return crc_sign_packet(self._new_packet(self._get_schedules_frame, session_id, timestamp))
+
+    def delete_schedule(self, session_id, timestamp, schedule_id):
+        """Return a signed delete schedule packet"""
+        packet = self._new_packet(self._delete_schedule_frame, session_id, timestamp)
+        SCHEDULE_ID_STRUCT.pack_into(packet, PACKET_PAYLOAD_OFFSET, schedule_id)
+        return crc_sign_packet(packet)
+
+    def disable_enable_schedule(self, session_id, timestamp, schedule_data):
+        """Return a signed disable enable schedule packet"""
+        packet = self._new_packet(self._disable_enable_schedule_frame, session_id, timestamp)
+        packet[PACKET_PAYLOAD_OFFSET:PACKET_PAYLOAD_OFFSET + SCHEDULE_STRUCT.size] = schedule_data
+        return crc_sign_packet(packet)
+
+    def create_schedule(self, session_id, timestamp, schedule_data):
+        """Return a signed create schedule packet"""
+        packet = self._new_packet(self._create_schedule_frame, session_id, timestamp)
+        packet[CREATE_SCHEDULE_OFFSET:CREATE_SCHEDULE_OFFSET + CREATE_SCHEDULE_STRUCT.size] = schedule_data
+        return crc_sign_packet(packet)
+
 
 class SwitcherV2Schedule(object):
     """represnation of the switcher version 2 schedule"""
@@ -1654,7 +2999,11 @@ class SwitcherV2Schedule(object):
         self._end_time = None
         self._duration = None
         self._schedule_data = None
+        self._record = None
+        self._days_mask = 0
+        self._start_clock = self._end_clock = None
         try:
+            self._record = ba.unhexlify(schedule_details[idx])
             self._schedule_id = str(int(schedule_details[idx][0:2], 16))
             if int(schedule_details[idx][2:4], 16) == 1:
                 self._enabled = True
@@ -1675,7 +3024,11 @@ class SwitcherV2Schedule(object):
             timestate = schedule_details[idx][6:8]
             start_time = schedule_details[idx][8:16]
             end_time = schedule_details[idx][16:24]
-            self._schedule_data = (time_id + on_off + week + timestate + start_time + end_time)
+            self._schedule_data = ba.unhexlify(time_id + on_off + week + timestate + start_time + end_time)
+
+            _, _, self._days_mask, _, start_timestamp, end_timestamp = SCHEDULE_STRUCT.unpack_from(self._record)
+            self._start_clock = datetime.time(*time.localtime(start_timestamp)[3:5])
+            self._end_clock = datetime.time(*time.localtime(end_timestamp)[3:5])
         except:
             _LOGGER.error("failed to parse schedule data " + traceback.format_exc())
 
@@ -1723,6 +3076,42 @@ class SwitcherV2Schedule(object):
         """Return the schedule data for managing the schedule"""
         return self._schedule_data
 
+    @property
+    def record(self):
+        """Return the raw schedule record as retrieved from the device"""
+        return self._record
+
+    def runs_on(self, weekday):
+        """Return true if the days bitmask includes the weekday (monday is 0), bit 1 is monday and bit 7 is sunday"""
+        return bool(self._days_mask & (2 << weekday))
+
+    def next_run(self, now):
+        """Return the datetime of the first run after now, None if the schedule failed parsing"""
+        if self._start_clock is None:
+            return None
+        for days_ahead in range(len(WEEKDAY_TUP) + 1):
+            run_at = datetime.datetime.combine(now.date() + datetime.timedelta(days=days_ahead), self._start_clock)
+            if run_at > now and (not self._recurring or self.runs_on(run_at.weekday())):
+                return run_at
+        return None
+
+    def explains(self, state, changed_at):
+        """Return true if the schedule is enabled and starts (on) or ends (off) around the time of a state change,
+        an end earlier than the start is past midnight and belongs to the run started the day before"""
+        if not self._enabled or self._start_clock is None:
+            return False
+        scheduled_clock = self._start_clock if state == STATE_ON else self._end_clock
+        run_days = 1 if state == STATE_OFF and self._end_clock < self._start_clock else 0
+        """the runs of the day before and after are checked as well for a state change around midnight"""
+        for days_ago in (-1, 0, 1):
+            start_day = changed_at.date() - datetime.timedelta(days=days_ago + run_days)
+            if self._recurring and not self.runs_on(start_day.weekday()):
+                continue
+            scheduled_at = datetime.datetime.combine(start_day + datetime.timedelta(days=run_days), scheduled_clock)
+            if abs((changed_at - scheduled_at).total_seconds()) <= STATE_CHANGE_EXPLAIN_WINDOW:
+                return True
+        return False
+
     def set_enabled(self, value):
         """Function to set the device as enabled or disabled"""
         self._enabled = value
@@ -1745,33 +3134,21 @@ class SwitcherV2BroadcastMSG(object):
         self._power_consumption = self._electric_current = 0
 
         try:
-            self._verified = ba.hexlify(message)[0:4].decode(ENCODING_CODEC) == 'fef0' and len(message) == 165
+            self._verified = len(message) == BROADCAST_MSG_LENGTH and message[0:2] == BROADCAST_MSG_MAGIC
             if self._verified:
-                temp_ip = ba.hexlify(message)[152:160]
-                ip_addr = int(temp_ip[6:8] + temp_ip[4:6] + temp_ip[2:4] + temp_ip[0:2], 16)
-                self._ip_address = socket.inet_ntoa(pack("<L", ip_addr))
-
-                mac = ba.hexlify(message)[160:172].decode(ENCODING_CODEC).upper()
-                self._mac = mac[0:2] + ':' + mac[2:4] + ':' + mac[4:6] + ':' + mac[6:8] + ':' + mac[8:10] + ':' + mac[10:12]
-
-                self._name = message[42:74].decode(ENCODING_CODEC).rstrip('\x00')
-
-                self._device_id = ba.hexlify(message)[36:42].decode(ENCODING_CODEC)
+                device_id, name, ip_addr, mac, state, power, time_left, auto_off = BROADCAST_MSG_STRUCT.unpack_from(message)
 
-                self._state = self._time_to_auto_off = STATE_ON if ba.hexlify(message)[266:270].decode(ENCODING_CODEC) == STATE_RESPONSE_ON else STATE_OFF
-
-                temp_auto_off_config = ba.hexlify(message)[310:318]
-                temp_auto_off_seconds = int(temp_auto_off_config[6:8] + temp_auto_off_config[4:6] + temp_auto_off_config[2:4] + temp_auto_off_config[0:2], 16)
-                self._auto_off_config_time = convert_seconds_to_iso_time(temp_auto_off_seconds)
+                self._ip_address = socket.inet_ntoa(ip_addr)
+                self._mac = MAC_ADDRESS_FORMAT % tuple(mac)
+                self._name = name.decode(ENCODING_CODEC).rstrip('\x00')
+                self._device_id = device_id.hex()
+                self._state = self._time_to_auto_off = STATE_ON if state == BROADCAST_STATE_ON else STATE_OFF
+                self._auto_off_config_time = convert_seconds_to_iso_time(auto_off)
 
                 if self._state == STATE_ON:
-                    temp_power = ba.hexlify(message)[270:278]
-                    self._power_consumption = int(temp_power[2:4] + temp_power[0:2], 16)
-                    self._electric_current = round((self._power_consumption / float(220)), 1)
-
-                    temp_time_left = ba.hexlify(message)[294:302]
-                    temp_time_left_seconds = int(temp_time_left[6:8] + temp_time_left[4:6] + temp_time_left[2:4] + temp_time_left[0:2], 16)
-                    self._time_to_auto_off = convert_seconds_to_iso_time(temp_time_left_seconds)
+                    self._power_consumption = power
+                    self._electric_current = round((power / float(220)), 1)
+                    self._time_to_auto_off = convert_seconds_to_iso_time(time_left)
 
             self._validated = True
         except:
@@ -1838,7 +3215,8 @@ class SwitcherV2LoginResponseMSG(object):
         self._unparsed_response = response
         self._session_id = None
         try:
-            self._session_id = ba.hexlify(response)[16:24].decode(ENCODING_CODEC)
+            if len(response) >= 12:
+                self._session_id = response[8:12]
         except:
             _LOGGER.exception("failed to parse login response message " + traceback.format_exc())
 
@@ -2152,8 +3530,19 @@ class SwitcherSensor(Entity):
             return self._device.electric_current
         if self._entity_config[CONF_TYPE] == ENTITY_DEVICE_NAME_TYPE:
             return self._device.name
+        if self._entity_config[CONF_TYPE] == ENTITY_IO_LATENCY_TYPE:
+            return self._device.session.metrics.percentile(IO_PHASE_CONTROL, 0.95)
+        if self._entity_config[CONF_TYPE] == ENTITY_DAILY_ENERGY_TYPE:
+            return self._device.energy_meter.daily_energy
+        if self._entity_config[CONF_TYPE] == ENTITY_MONTHLY_ENERGY_TYPE:
+            return self._device.energy_meter.monthly_energy
         return None
 
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement"""
+        return self._entity_config.get(CONF_UNIT_OF_MEASUREMENT)
+
     @property
     def should_poll(self):
         """No polling needed"""
@@ -2167,10 +3556,28 @@ class SwitcherSensor(Entity):
     @property
     def state_attributes(self):
         """Return the state attributes"""
-        return {
+        attributes = {
             CONF_LAST_UPDATE: self._device.last_update,
             CONF_STATE_CARD: self._entity_config[CONF_CARD]
         }
+        if self._entity_config[CONF_TYPE] == ENTITY_IO_LATENCY_TYPE:
+            attributes.update(self._device.session.metrics.summary)
+        if self._entity_config[CONF_TYPE] in (ENTITY_DAILY_ENERGY_TYPE, ENTITY_MONTHLY_ENERGY_TYPE):
+            attributes[CONF_TOTAL_ENERGY] = self._device.energy_meter.total_energy
+        for attribute in self._device.excluded_attributes:
+            attributes.pop(attribute, None)
+
+        return attributes
+
+    @property
+    def available(self):
+        """Return false while the device is silent"""
+        return self._device.available
+
+    @property
+    def watched_fields(self):
+        """Return the device data fields presented by the entity"""
+        return self._entity_config[CONF_WATCHED_FIELDS]
 
     @asyncio.coroutine
     def async_update_received(self, device):
@@ -2219,7 +3626,7 @@ class SwitcherControl(ToggleEntity):
     @property
     def available(self):
         """Return true if the device is available for use"""
-        return self._state is not None
+        return self._state is not None and self._device.available
 
     @property
     def is_on(self):
@@ -2244,7 +3651,11 @@ class SwitcherControl(ToggleEntity):
         attributes[CONF_LAST_UPDATE] = self._device.last_update
         attributes[CONF_LAST_STATE_CHANGE] = self._device.last_state_change
         attributes[CONF_DEVICE_NAME] = self._device.name
+        attributes[CONF_QUEUE_DEPTH] = self._device.command_queue.depth
+        attributes[CONF_QUEUE_WAIT_TIME] = self._device.command_queue.wait_time
         attributes[CONF_STATE_CARD] = self._entity_config[CONF_CARD]
+        for attribute in self._device.excluded_attributes:
+            attributes.pop(attribute, None)
 
         return attributes
 
@@ -2252,8 +3663,10 @@ class SwitcherControl(ToggleEntity):
     def async_turn_on_with_timer(self, minutes):
         """turn on the device and set timer for off"""
         _LOGGER.debug("received turn on request with timer for " + minutes + " minutes for " + self.entity_id)
-        result = yield from async_send_command_to_device(self._device.ip, self._device.phone_id, self._device.device_id, self._device.device_password, COMMAND_ON, minutes)
-        if result:
+        result = yield from self._device.command_queue.async_enqueue(async_send_command_to_device, COMMAND_ON, minutes, coalesce_key=QUEUE_KEY_CONTROL)
+        if result == REQUEST_SUPERSEDED:
+            _LOGGER.debug("turn on with timer request superseded by a later request for " + self.entity_id)
+        elif result:
             self._state = STATE_ON
             self._self_initiated = True
             yield from self.async_update_ha_state()
@@ -2265,8 +3678,10 @@ class SwitcherControl(ToggleEntity):
     def async_turn_on(self, **kwargs):
         """turn on the device"""
         _LOGGER.debug("received turn on request for " + self.entity_id)
-        result = yield from async_send_command_to_device(self._device.ip, self._device.phone_id, self._device.device_id, self._device.device_password, COMMAND_ON)
-        if result:
+        result = yield from self._device.command_queue.async_enqueue(async_send_command_to_device, COMMAND_ON, coalesce_key=QUEUE_KEY_CONTROL)
+        if result == REQUEST_SUPERSEDED:
+            _LOGGER.debug("turn on request superseded by a later request for " + self.entity_id)
+        elif result:
             self._state = STATE_ON
             self._self_initiated = True
             yield from self.async_update_ha_state()
@@ -2278,8 +3693,10 @@ class SwitcherControl(ToggleEntity):
     def async_turn_off(self, **kwargs):
         """turn off the device"""
         _LOGGER.debug("received turn off request for " + self.entity_id)
-        result = yield from async_send_command_to_device(self._device.ip, self._device.phone_id, self._device.device_id, self._device.device_password, COMMAND_OFF)
-        if result:
+        result = yield from self._device.command_queue.async_enqueue(async_send_command_to_device, COMMAND_OFF, coalesce_key=QUEUE_KEY_CONTROL)
+        if result == REQUEST_SUPERSEDED:
+            _LOGGER.debug("turn off request superseded by a later request for " + self.entity_id)
+        elif result:
             self._state = STATE_OFF
             self._self_initiated = True
             yield from self.async_update_ha_state()
@@ -2287,6 +3704,11 @@ class SwitcherControl(ToggleEntity):
         else:
             _LOGGER.error("failed to turn off the device")
 
+    @property
+    def watched_fields(self):
+        """Return the device data fields presented by the entity"""
+        return self._entity_config[CONF_WATCHED_FIELDS]
+
     @asyncio.coroutine
     def async_update_received(self, device):
         """Update the device's state and attributes upon device update"""
@@ -2368,8 +3790,6 @@ class SwitcherSlider(Entity):
         self._unit = unit
         self._mode = mode
 
-        self.hass.bus.async_listen(EVENT_CALL_SERVICE, self.async_service_call_event)
-
     def as_dict(self):
         """Callback for __dict__."""
         return self.__dict__
@@ -2412,8 +3832,8 @@ class SwitcherSlider(Entity):
 
     @asyncio.coroutine
     def async_service_call_event(self, event):
-        """Handle all service calls"""
-        if (event.data["service_data"] is not None and event.data["domain"] == INPUT_NUMBER_DOMAIN and event.data["service"] == SERVICE_SET_VALUE and event.data["service_data"]["entity_id"] == self.entity_id):
+        """Handle the service calls targeting the entity"""
+        if event.data["service"] == SERVICE_SET_VALUE:
             yield from self.async_set_value(event.data["service_data"]["value"])
 
     @asyncio.coroutine
@@ -2430,15 +3850,16 @@ class SwitcherSlider(Entity):
 
 class SwitcherScript(ToggleEntity):
     """Representation of the script entity."""
-    def __init__(self, hass, slug_id, name, sequence, entity_config):
+    def __init__(self, hass, slug_id, name, action, entity_config):
         """Initialize the script."""
         self.hass = hass
         self.entity_id = ENTITY_ID_FORMAT.format(slug_id)
-        self.script = Script(hass, sequence, name, self.async_update_ha_state)
+        self._name = name
+        self._action = action
+        self._running = False
+        self._last_triggered = None
         self._entity_config = entity_config
 
-        self.hass.bus.async_listen(EVENT_CALL_SERVICE, self.async_service_call_event)
-
     @property
     def should_poll(self):
         """No polling needed."""
@@ -2447,7 +3868,7 @@ class SwitcherScript(ToggleEntity):
     @property
     def name(self):
         """Return the name of the entity."""
-        return self.script.name
+        return self._name
 
     @property
     def icon(self):
@@ -2457,38 +3878,40 @@ class SwitcherScript(ToggleEntity):
     @property
     def state_attributes(self):
         """Return the state attributes"""
-        attrs = {}
-        attrs[ATTR_LAST_TRIGGERED] = self.script.last_triggered
-        if self.script.can_cancel:
-            attrs[ATTR_CAN_CANCEL] = self.script.can_cancel
-        if self.script.last_action:
-            attrs[ATTR_LAST_ACTION] = self.script.last_action
-        attrs[CONF_STATE_CARD] = self._entity_config[CONF_CARD]
-        return attrs
+        return {
+            ATTR_LAST_TRIGGERED: self._last_triggered,
+            CONF_STATE_CARD: self._entity_config[CONF_CARD]
+        }
 
     @property
     def is_on(self):
         """Return true if script is on."""
-        return self.script.is_running
+        return self._running
 
     @asyncio.coroutine
     def async_service_call_event(self, event):
-        """Handle all service calls"""
-        if (event.data["service_data"] is not None and event.data["domain"] == SCRIPT_DOMAIN and "entity_id" in event.data["service_data"] and event.data["service_data"]["entity_id"] == self.entity_id):
-            if event.data["service"] == SERVICE_TURN_ON:
-                yield from self.async_turn_on()
-            elif event.data["service"] == SERVICE_TURN_OFF:
-                yield from self.async_turn_off()
+        """Handle the service calls targeting the entity"""
+        if event.data["service"] == SERVICE_TURN_ON:
+            yield from self.async_turn_on()
+        elif event.data["service"] == SERVICE_TURN_OFF:
+            yield from self.async_turn_off()
 
     @asyncio.coroutine
     def async_turn_on(self, **kwargs):
-        """Turn the script on."""
-        yield from self.script.async_run()
+        """Turn the script on, the script is on while its action runs"""
+        self._running = True
+        self._last_triggered = datetime.datetime.now(datetime.timezone.utc)
+        yield from self.async_update_ha_state()
+        try:
+            yield from self._action()
+        finally:
+            self._running = False
+            yield from self.async_update_ha_state()
 
     @asyncio.coroutine
     def async_turn_off(self, **kwargs):
-        """Turn the script off."""
-        self.script.async_stop()
+        """Turn the script off, the action is a single request that can not be stopped"""
+        _LOGGER.debug("received turn off request for " + self.entity_id + ", nothing to stop")
 
 
 class SwitcherSelect(RestoreEntity):
@@ -2502,7 +3925,6 @@ class SwitcherSelect(RestoreEntity):
         self._options = options
         self._current_option = None
 
-        self.hass.bus.async_listen(EVENT_CALL_SERVICE, self.async_service_call_event)
         if self._entity_config[CONF_TYPE] == ENTITY_NOTIFICATION_SELECT_TYPE:
             self.hass.bus.async_listen(EVENT_SERVICE_REGISTERED, self.async_check_notify_service)
 
@@ -2557,14 +3979,13 @@ class SwitcherSelect(RestoreEntity):
 
     @asyncio.coroutine
     def async_service_call_event(self, event):
-        """Handle all service calls"""
-        if (event.data["service_data"] is not None and event.data["domain"] == INPUT_SELECT_DOMAIN and event.data["service_data"]["entity_id"] == self.entity_id):
-            if event.data["service"] == SERVICE_SELECT_OPTION:
-                yield from self.async_select_option(event.data["service_data"]["option"])
-            elif event.data["service"] == SERVICE_SELECT_NEXT:
-                yield from self.async_offset_index(1)
-            elif event.data["service"] == SERVICE_SELECT_PREVIOUS:
-                yield from self.async_offset_index(-1)
+        """Handle the service calls targeting the entity"""
+        if event.data["service"] == SERVICE_SELECT_OPTION:
+            yield from self.async_select_option(event.data["service_data"]["option"])
+        elif event.data["service"] == SERVICE_SELECT_NEXT:
+            yield from self.async_offset_index(1)
+        elif event.data["service"] == SERVICE_SELECT_PREVIOUS:
+            yield from self.async_offset_index(-1)
 
     @asyncio.coroutine
     def async_check_notify_service(self, event):
@@ -2607,8 +4028,6 @@ class SwitcherText(Entity):
         self._pattern = None
         self._mode = mode
 
-        self.hass.bus.async_listen(EVENT_CALL_SERVICE, self.async_service_call_event)
-
     @property
     def should_poll(self):
         """No polling needed"""
@@ -2647,8 +4066,8 @@ class SwitcherText(Entity):
 
     @asyncio.coroutine
     def async_service_call_event(self, event):
-        """Handle all service calls"""
-        if (event.data["service_data"] is not None and event.data["domain"] == INPUT_TEXT_DOMAIN and event.data["service"] == SERVICE_SET_VALUE and event.data["service_data"]["entity_id"] == self.entity_id):
+        """Handle the service calls targeting the entity"""
+        if event.data["service"] == SERVICE_SET_VALUE:
             yield from self.async_set_value(event.data["service_data"]["value"])
 
     @asyncio.coroutine
@@ -2674,6 +4093,7 @@ class SwitcherScheduleSensor(Entity):
         self._configured = False
         self._schedule_details = None
         self._next_run = None
+        self._remove_next_run_listener = None
 
     def as_dict(self):
         """Callback for __dict__."""
@@ -2692,7 +4112,7 @@ class SwitcherScheduleSensor(Entity):
         elif not self._schedule_details.enabled:
             return ATTR_NOT_ENABLED
         else:
-            return self._next_run
+            return self.format_next_run(datetime.datetime.now())
 
     @property
     def should_poll(self):
@@ -2720,6 +4140,7 @@ class SwitcherScheduleSensor(Entity):
             attributes[CONF_START_TIME] = self._schedule_details.start_time
             attributes[CONF_END_TIME] = self._schedule_details.end_time
             attributes[CONF_DURATION] = self._schedule_details.duration
+            attributes[CONF_NEXT_RUN] = None if self._next_run is None else self._next_run.isoformat()
             if self._schedule_details.recurring:
                 attributes[CONF_DAYS] = self._schedule_details.days
 
@@ -2731,8 +4152,8 @@ class SwitcherScheduleSensor(Entity):
         if self._configured:
             _LOGGER.debug("received deconfiguring request for " + self.entity_id)
             self._configured = False
-            self._next_run = None
             self._schedule_details = None
+            self.update_next_run()
             yield from self.async_update_ha_state()
 
     @asyncio.coroutine
@@ -2742,12 +4163,12 @@ class SwitcherScheduleSensor(Entity):
         if self._schedule_details.enabled:
             _LOGGER.warning("schedule " + self._schedule_id + " is already enabled")
         else:
-            schedule_data = self._schedule_details.schedule_data[0:2] + ENABLE_SCHEDULE + self._schedule_details.schedule_data[4:]
-            successful = yield from  async_disable_enable_schedule(device.ip, device.phone_id, device.device_id, device.device_password, schedule_data)
+            schedule_data = self._schedule_details.schedule_data[0:1] + bytes((ENABLE_SCHEDULE,)) + self._schedule_details.schedule_data[2:]
+            successful = yield from device.command_queue.async_enqueue(async_disable_enable_schedule, schedule_data)
             if successful:
                 self._schedule_details.set_enabled(True)
                 self._schedule_details.set_schedule_data(schedule_data)
-                self._next_run = self.get_next_run()
+                self.update_next_run()
                 yield from self.async_update_ha_state()
                 _LOGGER.debug("successfully enabled schedule " + self._schedule_id)
             else:
@@ -2760,11 +4181,12 @@ class SwitcherScheduleSensor(Entity):
         if not self._schedule_details.enabled:
             _LOGGER.warning("schedule " + self._schedule_id + " is already disabled")
         else:
-            schedule_data = self._schedule_details.schedule_data[0:2] + DISABLE_SCHEDULE + self._schedule_details.schedule_data[4:]
-            successful = yield from  async_disable_enable_schedule(device.ip, device.phone_id, device.device_id, device.device_password, schedule_data)
+            schedule_data = self._schedule_details.schedule_data[0:1] + bytes((DISABLE_SCHEDULE,)) + self._schedule_details.schedule_data[2:]
+            successful = yield from device.command_queue.async_enqueue(async_disable_enable_schedule, schedule_data)
             if successful:
                 self._schedule_details.set_enabled(False)
                 self._schedule_details.set_schedule_data(schedule_data)
+                self.update_next_run()
                 yield from self.async_update_ha_state()
                 _LOGGER.debug("successfully enabled schedule " + self._schedule_id)
             else:
@@ -2777,7 +4199,7 @@ class SwitcherScheduleSensor(Entity):
         if not self._configured:
             _LOGGER.warning("schedule " + self._schedule_id + " is not configured")
         else:
-            successful = yield from  async_delete_schedule(device.ip, device.phone_id, device.device_id, device.device_password, self._schedule_id)
+            successful = yield from device.command_queue.async_enqueue(async_delete_schedule, self._schedule_id)
             if successful:
                 yield from self.async_deconfigure()
                 _LOGGER.debug("successfully deleted schedule " + self._schedule_id)
@@ -2790,41 +4212,44 @@ class SwitcherScheduleSensor(Entity):
         _LOGGER.debug('received update for ' + self.entity_id)
         self._configured = True
         self._schedule_details = schedule_details
-        if self._schedule_details.enabled:
-            self._next_run = self.get_next_run()
-        else:
-            self._next_run = None
+        self.update_next_run()
         yield from self.async_update_ha_state()
 
     @callback
-    def get_next_run(self):
-        """Calculate the next runtime of the schedule"""
-        if self._schedule_details.recurring:
-            today_datetime = datetime.datetime.now()
-            
-            start_time = datetime.datetime.strptime(self._schedule_details.start_time, "%H:%M")
-            current_time = datetime.datetime.strptime(("0" + str(today_datetime.hour))[-2:] + ":" + ("0" + str(today_datetime.minute))[-2:], "%H:%M")
-
-            current_weekday = today_datetime.weekday()
-            found_day = None
-            if self._schedule_details.days == ALL_DAYS:
-                if current_time < start_time:
-                    return "Due today at " + self._schedule_details.start_time
-                else:
-                    return "Due tommorow at " + self._schedule_details.start_time
-
-            for day in self._schedule_details.days:
-                set_weekday = WEEKDAY_TUP.index(day)
-                
-                if set_weekday == current_weekday and current_time < start_time:
-                    return "Due today at " + self._schedule_details.start_time
-                
-                if found_day is None or found_day > set_weekday:
-                    found_day = set_weekday
+    def update_next_run(self):
+        """Calculate the next run of the schedule and track it, the sensor is refreshed when the run passes or at midnight"""
+        if self._remove_next_run_listener is not None:
+            self._remove_next_run_listener()
+            self._remove_next_run_listener = None
+
+        if self._configured and self._schedule_details.enabled:
+            now = datetime.datetime.now()
+            self._next_run = self._schedule_details.next_run(now)
+        else:
+            self._next_run = None
 
-            if found_day - 1 == current_weekday or (found_day == WEEKDAY_TUP.index(MONDAY) and current_weekday == WEEKDAY_TUP.index(SUNDAY)):
-                return "Due tommorow at " + self._schedule_details.start_time
+        if self._next_run is not None:
+            """The state is relative to the current day, a run due tommorow is due today after midnight"""
+            midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+            refresh_at = min(self._next_run, midnight)
+            self._remove_next_run_listener = async_track_point_in_utc_time(self.hass, self.async_next_run_passed, datetime.datetime.fromtimestamp(refresh_at.timestamp(), datetime.timezone.utc))
 
-            return "Due next " + WEEKDAY_TUP[found_day] + " at " + self._schedule_details.start_time
+    @callback
+    def async_next_run_passed(self, now):
+        """Refresh the sensor when the tracked run passes"""
+        self._remove_next_run_listener = None
+        self.update_next_run()
+        self.hass.async_add_job(self.async_update_ha_state())
 
-        return "Due today at " + self._schedule_details.start_time
\ No newline at end of file
+    @callback
+    def format_next_run(self, now):
+        """Format the next run relative to now"""
+        if self._next_run is None:
+            return None
+        start_time = self._next_run.strftime("%H:%M")
+        days_ahead = (self._next_run.date() - now.date()).days
+        if days_ahead <= 0:
+            return "Due today at " + start_time
+        if days_ahead == 1:
+            return "Due tommorow at " + start_time
+        return "Due next " + WEEKDAY_TUP[self._next_run.weekday()] + " at " + start_time
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Shared setup of the switcher_aio unit tests, imports the component with the shims of
+benchmarks/compat.py so the tests run in the python environment Home Assistant runs in, or anywhere
+voluptuous is installed. The tested classes are plain python, none of them calls Home Assistant.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import os
+import sys
+import time
+from struct import pack
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "custom_components"))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "benchmarks"))
+
+import compat  # noqa: E402
+compat.install()
+
+import switcher_aio  # noqa: E402
+
+
+def build_schedule(start_at, end_at, days_mask=0, enabled=True, schedule_id=0):
+    """return a SwitcherV2Schedule of a record starting and ending at the local datetimes, a days mask of 0 runs once"""
+    record = pack("<BBBBII", schedule_id, 1 if enabled else 0, days_mask, 1, int(time.mktime(start_at.timetuple())), int(time.mktime(end_at.timetuple())))
+    return switcher_aio.SwitcherV2Schedule(0, [record.hex() + "00000000"])
@@ -0,0 +1,113 @@
+"""Unit tests of SwitcherV2Capture, the broadcasts capture file buffered off the event loop"""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common import switcher_aio
+
+DATAGRAM = bytes(range(165))
+RECORD_SIZE = switcher_aio.CAPTURE_RECORD_STRUCT.size + len(DATAGRAM)
+
+
+class FakeHass(object):
+    """stand-in of hass, running the jobs on the loop and the executor jobs in the default executor"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.executor_jobs = 0
+
+    def async_add_job(self, target):
+        return self.loop.create_task(target)
+
+    def async_add_executor_job(self, target, *args):
+        self.executor_jobs += 1
+        return self.loop.run_in_executor(None, target, *args)
+
+
+class CaptureTest(unittest.TestCase):
+    """buffering, flushing and size limit of the capture file"""
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.hass = FakeHass(self.loop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "switcher_aio.capture")
+        self.capture = switcher_aio.SwitcherV2Capture(self.path)
+
+    def tearDown(self):
+        self.capture.stop(self.hass)
+        self.settle()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.directory.cleanup()
+
+    def settle(self):
+        """run the loop until the capture writer is done"""
+        async def wait():
+            while self.capture._writer is not None:
+                await asyncio.sleep(0.001)
+        self.loop.run_until_complete(wait())
+
+    def file_size(self):
+        return os.path.getsize(self.path)
+
+    def test_records_are_buffered_until_a_flush_is_due(self):
+        for _ in range(switcher_aio.CAPTURE_FLUSH_RECORDS - 1):
+            self.assertTrue(self.capture.record(self.hass, DATAGRAM))
+        self.settle()
+        self.assertEqual(self.hass.executor_jobs, 0)
+        self.capture.record(self.hass, DATAGRAM)
+        self.settle()
+        self.assertEqual(self.hass.executor_jobs, 1)
+        self.assertEqual(self.file_size(), len(switcher_aio.CAPTURE_FILE_MAGIC) + switcher_aio.CAPTURE_FLUSH_RECORDS * RECORD_SIZE)
+
+    def test_stop_writes_the_buffer_and_closes_the_file(self):
+        for _ in range(3):
+            self.capture.record(self.hass, DATAGRAM)
+        self.capture.stop(self.hass)
+        self.settle()
+        self.assertTrue(self.capture._file.closed)
+        self.assertFalse(self.capture.record(self.hass, DATAGRAM))
+        self.assertEqual(self.capture.records, 3)
+        with open(self.path, "rb") as capture_file:
+            self.assertEqual(capture_file.read(len(switcher_aio.CAPTURE_FILE_MAGIC)), switcher_aio.CAPTURE_FILE_MAGIC)
+            received_at, length = switcher_aio.CAPTURE_RECORD_STRUCT.unpack(capture_file.read(switcher_aio.CAPTURE_RECORD_STRUCT.size))
+            self.assertEqual(capture_file.read(length), DATAGRAM)
+
+    def test_records_received_while_writing_are_written_in_order(self):
+        for index in range(switcher_aio.CAPTURE_FLUSH_RECORDS * 3):
+            self.capture.record(self.hass, bytes([index]) * 10)
+        self.capture.stop(self.hass)
+        self.settle()
+        with open(self.path, "rb") as capture_file:
+            capture_file.read(len(switcher_aio.CAPTURE_FILE_MAGIC))
+            indexes = []
+            while True:
+                header = capture_file.read(switcher_aio.CAPTURE_RECORD_STRUCT.size)
+                if not header:
+                    break
+                indexes.append(capture_file.read(switcher_aio.CAPTURE_RECORD_STRUCT.unpack(header)[1])[0])
+        self.assertEqual(indexes, list(range(switcher_aio.CAPTURE_FLUSH_RECORDS * 3)))
+
+    def test_capture_stops_at_the_size_limit(self):
+        with mock.patch.object(switcher_aio, "CAPTURE_MAX_BYTES", len(switcher_aio.CAPTURE_FILE_MAGIC) + 5 * RECORD_SIZE):
+            with self.assertLogs("switcher_aio", "WARNING"):
+                results = [self.capture.record(self.hass, DATAGRAM) for _ in range(6)]
+        self.assertEqual(results, [True, True, True, True, False, False])
+        self.settle()
+        self.assertEqual(self.file_size(), len(switcher_aio.CAPTURE_FILE_MAGIC) + 5 * RECORD_SIZE)
+
+    def test_write_error_stops_the_capture(self):
+        for _ in range(3):
+            self.capture.record(self.hass, DATAGRAM)
+        with mock.patch.object(self.capture, "write", side_effect=OSError("disk full")):
+            with self.assertLogs("switcher_aio", "ERROR"):
+                self.capture.flush(self.hass)
+                self.settle()
+        self.assertTrue(self.capture._file.closed)
+        self.assertFalse(self.capture.record(self.hass, DATAGRAM))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Unit tests of SwitcherV2CommandQueue, the per device requests queue"""
+import asyncio
+import unittest
+
+from common import switcher_aio
+
+
+class FakeSession(object):
+    """stand-in of the device session, the queue only reads its device id"""
+    device_id = "a1b2c3"
+
+
+class CommandQueueTest(unittest.TestCase):
+    """ordering and coalescing of the queued requests"""
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = switcher_aio.SwitcherV2CommandQueue(FakeSession())
+        self.executed = []
+        self.release = asyncio.Event()
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    async def blocking_request(self, session, name):
+        """a request holding the queue until released"""
+        self.executed.append(name)
+        await self.release.wait()
+        return name
+
+    async def request(self, session, name):
+        """a request returning its name"""
+        self.executed.append(name)
+        return name
+
+    async def failing_request(self, session, name):
+        """a request raising an error"""
+        self.executed.append(name)
+        raise ConnectionError(name)
+
+    def run_queued(self, *requests):
+        """enqueue the (request handler, name, coalesce key) requests while a first request holds the queue, returns the callers results"""
+        async def run():
+            first = asyncio.ensure_future(self.queue.async_enqueue(self.blocking_request, "first"))
+            await asyncio.sleep(0)
+            callers = [asyncio.ensure_future(self.queue.async_enqueue(handler, name, coalesce_key=key)) for handler, name, key in requests]
+            await asyncio.sleep(0)
+            self.depth = self.queue.depth
+            self.release.set()
+            return await asyncio.gather(first, *callers, return_exceptions=True)
+        return self.loop.run_until_complete(run())[1:]
+
+    def test_requests_run_one_at_a_time_in_order(self):
+        results = self.run_queued((self.request, "a", None), (self.request, "b", None), (self.request, "c", None))
+        self.assertEqual(results, ["a", "b", "c"])
+        self.assertEqual(self.executed, ["first", "a", "b", "c"])
+        self.assertEqual(self.depth, 4)
+
+    def test_pending_request_is_superseded_by_the_same_key(self):
+        results = self.run_queued((self.request, "on", "control"), (self.request, "name", "device_name"), (self.request, "off", "control"))
+        self.assertEqual(results, [switcher_aio.REQUEST_SUPERSEDED, "name", "off"])
+        self.assertEqual(self.executed, ["first", "off", "name"])
+
+    def test_superseding_request_keeps_the_queue_position(self):
+        results = self.run_queued((self.request, "a", "control"), (self.request, "b", None), (self.request, "c", "control"), (self.request, "d", "control"))
+        self.assertEqual(results, [switcher_aio.REQUEST_SUPERSEDED, "b", switcher_aio.REQUEST_SUPERSEDED, "d"])
+        self.assertEqual(self.executed, ["first", "d", "b"])
+
+    def test_executing_request_is_not_superseded(self):
+        async def run():
+            first = asyncio.ensure_future(self.queue.async_enqueue(self.blocking_request, "first", coalesce_key="control"))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(self.queue.async_enqueue(self.request, "second", coalesce_key="control"))
+            await asyncio.sleep(0)
+            self.release.set()
+            return await asyncio.gather(first, second)
+        self.assertEqual(self.loop.run_until_complete(run()), ["first", "second"])
+
+    def test_failed_request_raises_to_its_caller_only(self):
+        with self.assertLogs("switcher_aio", "ERROR"):
+            results = self.run_queued((self.failing_request, "a", None), (self.request, "b", None))
+        self.assertIsInstance(results[0], ConnectionError)
+        self.assertEqual(results[1], "b")
+        self.assertEqual(self.queue.depth, 0)
+
+    def test_only_successful_requests_are_stamped_executed(self):
+        async def unsuccessful_request(session):
+            return False, None
+
+        async def run():
+            await self.queue.async_enqueue(unsuccessful_request)
+            await self.queue.async_enqueue(self.request, "a")
+        self.loop.run_until_complete(run())
+        self.assertIsNone(self.queue.last_executed(unsuccessful_request))
+        self.assertIsNotNone(self.queue.last_executed(self.request))
+        with self.assertLogs("switcher_aio", "ERROR"):
+            self.run_queued((self.failing_request, "b", None))
+        self.assertIsNone(self.queue.last_executed(self.failing_request))
+
+
+if __name__ == "__main__":
+    unittest.main()
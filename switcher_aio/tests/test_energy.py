@@ -0,0 +1,98 @@
+"""Unit tests of SwitcherV2EnergyMeter, the energy integrated from the broadcasts power"""
+import datetime
+import unittest
+
+from common import switcher_aio
+
+# 36kW consume 10Wh a second, 0.01kWh, the displayed precision
+POWER = 36000
+
+
+def feed(meter, start, seconds, step=10, power=POWER):
+    """add a sample every step seconds from start to start + seconds included"""
+    for offset in range(0, seconds + 1, step):
+        meter.add_sample(power, start + datetime.timedelta(seconds=offset))
+
+
+class EnergyMeterTest(unittest.TestCase):
+    """integration, gaps and rollovers of the energy meter"""
+    def setUp(self):
+        self.meter = switcher_aio.SwitcherV2EnergyMeter()
+
+    def test_constant_power_is_integrated(self):
+        feed(self.meter, datetime.datetime(2019, 3, 10, 12, 0), 100)
+        self.assertEqual(self.meter.total_energy, 1.0)
+        self.assertEqual(self.meter.daily_energy, 1.0)
+        self.assertEqual(self.meter.monthly_energy, 1.0)
+
+    def test_power_change_is_integrated_as_a_trapezoid(self):
+        start = datetime.datetime(2019, 3, 10, 12, 0)
+        self.meter.add_sample(0, start)
+        self.meter.add_sample(POWER * 2, start + datetime.timedelta(seconds=50))
+        self.assertEqual(self.meter.total_energy, 0.5)
+
+    def test_gap_of_missed_broadcasts_is_not_integrated(self):
+        start = datetime.datetime(2019, 3, 10, 12, 0)
+        self.meter.add_sample(POWER, start)
+        self.meter.add_sample(POWER, start + switcher_aio.ENERGY_MAX_SAMPLE_GAP + datetime.timedelta(seconds=1))
+        self.assertEqual(self.meter.total_energy, 0.0)
+        self.meter.add_sample(POWER, start + switcher_aio.ENERGY_MAX_SAMPLE_GAP + datetime.timedelta(seconds=11))
+        self.assertEqual(self.meter.total_energy, 0.1)
+
+    def test_out_of_order_sample_is_not_integrated(self):
+        start = datetime.datetime(2019, 3, 10, 12, 0)
+        self.meter.add_sample(POWER, start)
+        self.meter.add_sample(POWER, start - datetime.timedelta(seconds=10))
+        self.assertEqual(self.meter.total_energy, 0.0)
+
+    def test_day_rollover_resets_the_daily_energy(self):
+        feed(self.meter, datetime.datetime(2019, 3, 10, 23, 58, 10), 100)
+        self.assertEqual(self.meter.daily_energy, 1.0)
+        """the interval crossing midnight is integrated into the new day"""
+        feed(self.meter, datetime.datetime(2019, 3, 11), 20)
+        self.assertEqual(self.meter.daily_energy, 0.3)
+        self.assertEqual(self.meter.monthly_energy, 1.3)
+        self.assertEqual(self.meter.total_energy, 1.3)
+
+    def test_month_rollover_resets_the_monthly_energy(self):
+        feed(self.meter, datetime.datetime(2019, 3, 31, 23, 58, 10), 100)
+        feed(self.meter, datetime.datetime(2019, 4, 1), 20)
+        self.assertEqual(self.meter.daily_energy, 0.3)
+        self.assertEqual(self.meter.monthly_energy, 0.3)
+        self.assertEqual(self.meter.total_energy, 1.3)
+
+    def test_add_sample_reports_displayed_changes(self):
+        start = datetime.datetime(2019, 3, 10, 12, 0)
+        self.assertFalse(self.meter.add_sample(POWER, start))
+        self.assertTrue(self.meter.add_sample(POWER, start + datetime.timedelta(seconds=1)))
+        self.meter.add_sample(0, start + datetime.timedelta(seconds=2))
+        self.assertFalse(self.meter.add_sample(0, start + datetime.timedelta(seconds=3)))
+
+    def test_restore_adds_the_snapshot_counters_of_today(self):
+        today = datetime.date.today()
+        snapshot = {switcher_aio.CONF_TOTAL_ENERGY: 10.0, switcher_aio.CONF_DAILY_ENERGY: 1.5, switcher_aio.CONF_MONTHLY_ENERGY: 4.0,
+                    switcher_aio.CONF_ENERGY_DATE: today.isoformat()}
+        self.meter.restore(snapshot)
+        self.assertEqual((self.meter.total_energy, self.meter.daily_energy, self.meter.monthly_energy), (10.0, 1.5, 4.0))
+        self.meter.restore(snapshot, live=True)
+        self.assertEqual((self.meter.total_energy, self.meter.daily_energy, self.meter.monthly_energy), (20.0, 3.0, 8.0))
+
+    def test_restore_drops_the_counters_of_past_periods(self):
+        snapshot = {switcher_aio.CONF_TOTAL_ENERGY: 10.0, switcher_aio.CONF_DAILY_ENERGY: 1.5, switcher_aio.CONF_MONTHLY_ENERGY: 4.0,
+                    switcher_aio.CONF_ENERGY_DATE: "2001-01-01"}
+        self.meter.restore(snapshot)
+        self.assertEqual((self.meter.total_energy, self.meter.daily_energy, self.meter.monthly_energy), (10.0, 0.0, 0.0))
+
+    def test_live_restore_keeps_integrating_from_the_last_sample(self):
+        now = datetime.datetime.now()
+        self.meter.add_sample(POWER, now)
+        self.meter.restore(None, live=True)
+        self.meter.add_sample(POWER, now + datetime.timedelta(seconds=10))
+        self.assertEqual(self.meter.total_energy, 0.1)
+        self.meter.restore(None)
+        self.meter.add_sample(POWER, now + datetime.timedelta(seconds=20))
+        self.assertEqual(self.meter.total_energy, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
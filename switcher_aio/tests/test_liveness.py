@@ -0,0 +1,62 @@
+"""Unit tests of SwitcherV2LivenessWheel, the silence deadlines of the devices"""
+import datetime
+import unittest
+
+from common import switcher_aio
+
+WINDOW = datetime.timedelta(seconds=60)
+TICK = datetime.timedelta(seconds=5)
+
+
+class LivenessWheelTest(unittest.TestCase):
+    """silence detection of the devices by the timer wheel"""
+    def setUp(self):
+        self.wheel = switcher_aio.SwitcherV2LivenessWheel(WINDOW, TICK)
+
+    def test_broadcasting_device_is_not_silent(self):
+        self.wheel.seen("a1b2c3", 0)
+        for now in range(5, 300, 5):
+            self.wheel.seen("a1b2c3", now)
+            self.assertEqual(self.wheel.advance(now), [])
+
+    def test_device_silent_for_the_window_expires_once(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.assertEqual(self.wheel.advance(55), [])
+        expired = []
+        for now in range(60, 200, 5):
+            expired.extend(self.wheel.advance(now))
+        self.assertEqual(expired, ["a1b2c3"])
+
+    def test_expiry_is_at_most_a_tick_late(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.assertEqual(self.wheel.advance(59.9), [])
+        self.assertEqual(self.wheel.advance(60 + TICK.total_seconds()), ["a1b2c3"])
+
+    def test_seen_device_moves_to_its_new_deadline(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.wheel.seen("a1b2c3", 50)
+        self.assertEqual(self.wheel.advance(100), [])
+        self.assertEqual(self.wheel.advance(115), ["a1b2c3"])
+
+    def test_silent_device_seen_again_is_reported_back(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.wheel.advance(70)
+        self.assertTrue(self.wheel.seen("a1b2c3", 80))
+        self.assertFalse(self.wheel.seen("a1b2c3", 85))
+        self.assertEqual(self.wheel.advance(140), [])
+        self.assertEqual(self.wheel.advance(150), ["a1b2c3"])
+
+    def test_devices_expire_independently(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.wheel.seen("d4e5f6", 30)
+        self.assertEqual(self.wheel.advance(70), ["a1b2c3"])
+        self.assertEqual(self.wheel.advance(100), ["d4e5f6"])
+
+    def test_late_advance_expires_all_the_due_devices(self):
+        self.wheel.seen("a1b2c3", 0)
+        self.wheel.seen("d4e5f6", 10)
+        self.assertEqual(sorted(self.wheel.advance(1000)), ["a1b2c3", "d4e5f6"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Unit tests of SwitcherV2Schedule, the schedule records parsing, next runs and explained state changes"""
+import datetime
+import unittest
+
+from common import build_schedule, switcher_aio
+
+# 2019-03-11 is a monday
+MONDAY = datetime.date(2019, 3, 11)
+MONDAY_MASK = 0x02
+WEDNESDAY_MASK = 0x08
+SUNDAY_MASK = 0x80
+ALL_DAYS_MASK = 0xfe
+
+
+def at(day, hour, minute=0):
+    """return the local datetime of a day at a clock time"""
+    return datetime.datetime.combine(day, datetime.time(hour, minute))
+
+
+class ScheduleNextRunTest(unittest.TestCase):
+    """next run of one time and recurring schedules"""
+    def test_parsed_record(self):
+        schedule = build_schedule(at(MONDAY, 6, 30), at(MONDAY, 7, 45), MONDAY_MASK | WEDNESDAY_MASK, schedule_id=3)
+        self.assertEqual(schedule.schedule_id, "3")
+        self.assertTrue(schedule.enabled)
+        self.assertTrue(schedule.recurring)
+        self.assertEqual(sorted(schedule.days), sorted([switcher_aio.MONDAY, switcher_aio.WEDNESDAY]))
+        self.assertEqual((schedule.start_time, schedule.end_time, schedule.duration), ("06:30", "07:45", "1:15:00"))
+
+    def test_runs_on_the_days_of_the_mask(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK | SUNDAY_MASK)
+        self.assertEqual([schedule.runs_on(weekday) for weekday in range(7)], [True, False, False, False, False, False, True])
+
+    def test_one_time_schedule_runs_at_the_next_start_time(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7))
+        self.assertFalse(schedule.recurring)
+        self.assertEqual(schedule.next_run(at(MONDAY, 5)), at(MONDAY, 6))
+        self.assertEqual(schedule.next_run(at(MONDAY, 6)), at(MONDAY + datetime.timedelta(days=1), 6))
+
+    def test_recurring_schedule_runs_on_its_next_day(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK | WEDNESDAY_MASK)
+        self.assertEqual(schedule.next_run(at(MONDAY, 5)), at(MONDAY, 6))
+        self.assertEqual(schedule.next_run(at(MONDAY, 8)), at(MONDAY + datetime.timedelta(days=2), 6))
+        self.assertEqual(schedule.next_run(at(MONDAY + datetime.timedelta(days=2), 8)), at(MONDAY + datetime.timedelta(days=7), 6))
+
+    def test_weekly_schedule_runs_a_week_later(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK)
+        self.assertEqual(schedule.next_run(at(MONDAY, 6, 1)), at(MONDAY + datetime.timedelta(days=7), 6))
+
+    def test_daily_schedule_runs_every_day(self):
+        schedule = build_schedule(at(MONDAY, 22), at(MONDAY, 23), ALL_DAYS_MASK)
+        self.assertEqual(schedule.days, switcher_aio.ALL_DAYS)
+        now = at(MONDAY, 23)
+        for day in range(1, 8):
+            now = schedule.next_run(now)
+            self.assertEqual(now, at(MONDAY + datetime.timedelta(days=day), 22))
+
+    def test_unparsable_record_has_no_next_run(self):
+        with self.assertLogs("switcher_aio", "ERROR"):
+            schedule = switcher_aio.SwitcherV2Schedule(0, ["zz"])
+        self.assertIsNone(schedule.next_run(at(MONDAY, 5)))
+
+
+class ScheduleExplainsTest(unittest.TestCase):
+    """state changes explained by the start and end of a schedule"""
+    def test_start_and_end_explain_on_and_off(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK)
+        self.assertTrue(schedule.explains(switcher_aio.STATE_ON, at(MONDAY, 6, 1)))
+        self.assertTrue(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY, 7)))
+        self.assertFalse(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY, 6)))
+        self.assertFalse(schedule.explains(switcher_aio.STATE_ON, at(MONDAY, 9)))
+
+    def test_days_out_of_the_mask_are_not_explained(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK)
+        self.assertFalse(schedule.explains(switcher_aio.STATE_ON, at(MONDAY + datetime.timedelta(days=1), 6)))
+
+    def test_disabled_schedule_explains_nothing(self):
+        schedule = build_schedule(at(MONDAY, 6), at(MONDAY, 7), MONDAY_MASK, enabled=False)
+        self.assertFalse(schedule.explains(switcher_aio.STATE_ON, at(MONDAY, 6)))
+
+    def test_end_past_midnight_belongs_to_the_start_day(self):
+        schedule = build_schedule(at(MONDAY, 23), at(MONDAY + datetime.timedelta(days=1), 1), MONDAY_MASK)
+        self.assertTrue(schedule.explains(switcher_aio.STATE_ON, at(MONDAY, 23)))
+        self.assertTrue(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY + datetime.timedelta(days=1), 1)))
+        self.assertFalse(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY, 1)))
+
+    def test_change_around_midnight_is_explained_by_the_adjacent_day(self):
+        schedule = build_schedule(at(MONDAY, 22), at(MONDAY + datetime.timedelta(days=1), 0), MONDAY_MASK)
+        self.assertTrue(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY, 23, 59)))
+        self.assertTrue(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY + datetime.timedelta(days=1), 0, 1)))
+        self.assertFalse(schedule.explains(switcher_aio.STATE_OFF, at(MONDAY + datetime.timedelta(days=7), 0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
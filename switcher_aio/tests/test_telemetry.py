@@ -0,0 +1,67 @@
+"""Unit tests of SwitcherV2TelemetryRing, the array backed rings of the broadcasts history"""
+import unittest
+
+from common import switcher_aio
+
+CONF_POWER = switcher_aio.CONF_CURRENT_POWER_CONSUMPTIOMN
+CONF_TIME_LEFT = switcher_aio.CONF_TIME_LEFT
+
+
+class TelemetryRingTest(unittest.TestCase):
+    """aggregation, windows and wrap around of a telemetry ring"""
+    def setUp(self):
+        self.ring = switcher_aio.SwitcherV2TelemetryRing(60, 10)
+
+    def test_empty_ring_stats(self):
+        stats = self.ring.stats(0, 600)
+        self.assertEqual(stats[switcher_aio.CONF_SAMPLES], 0)
+        self.assertIsNone(stats[switcher_aio.CONF_ON_RATIO])
+        self.assertEqual(stats[CONF_POWER], {switcher_aio.CONF_MIN: None, switcher_aio.CONF_MAX: None, switcher_aio.CONF_AVG: None})
+
+    def test_samples_of_a_step_are_aggregated_in_one_slot(self):
+        self.ring.add_sample(600, 1000, 1, 300)
+        self.ring.add_sample(610, 3000, 1, 290)
+        self.ring.add_sample(620, 0, 0, 0)
+        view = list(self.ring.view(600, 659))
+        self.assertEqual(len(view), 1)
+        self.assertEqual(view[0][switcher_aio.CONF_SAMPLES], 3)
+        self.assertEqual(view[0][CONF_POWER], {switcher_aio.CONF_MIN: 0, switcher_aio.CONF_MAX: 3000, switcher_aio.CONF_AVG: 1333.3})
+        self.assertEqual(view[0][CONF_TIME_LEFT], {switcher_aio.CONF_MIN: 0, switcher_aio.CONF_MAX: 300, switcher_aio.CONF_AVG: 196.7})
+        self.assertEqual(view[0][switcher_aio.CONF_ON_RATIO], 0.667)
+
+    def test_stats_combine_the_slots_of_the_window(self):
+        for minute in range(10, 15):
+            self.ring.add_sample(minute * 60, minute * 100, minute % 2, minute)
+        stats = self.ring.stats(11 * 60, 13 * 60 + 59)
+        self.assertEqual(stats[switcher_aio.CONF_SAMPLES], 3)
+        self.assertEqual(stats[CONF_POWER], {switcher_aio.CONF_MIN: 1100, switcher_aio.CONF_MAX: 1300, switcher_aio.CONF_AVG: 1200.0})
+        self.assertEqual(stats[switcher_aio.CONF_ON_RATIO], 0.667)
+
+    def test_view_is_oldest_first(self):
+        for minute in (12, 10, 11):
+            self.ring.add_sample(minute * 60, minute, 1, 0)
+        self.assertEqual([sample[CONF_POWER][switcher_aio.CONF_MIN] for sample in self.ring.view(0, 12 * 60 + 59)], [10, 11, 12])
+
+    def test_wrapped_slots_drop_the_oldest_steps(self):
+        for minute in range(25):
+            self.ring.add_sample(minute * 60, minute, 1, 0)
+        stats = self.ring.stats(0, 24 * 60 + 59)
+        self.assertEqual(stats[switcher_aio.CONF_SAMPLES], 10)
+        self.assertEqual(stats[CONF_POWER][switcher_aio.CONF_MIN], 15)
+
+    def test_stale_slots_are_not_counted(self):
+        self.ring.add_sample(0, 500, 1, 0)
+        """the slot of minute 0 is reused by minute 10, minute 0 is out of the ring coverage"""
+        self.ring.add_sample(10 * 60, 700, 1, 0)
+        self.assertEqual(self.ring.stats(0, 10 * 60)[switcher_aio.CONF_SAMPLES], 1)
+        """a slot not written since the last revolution holds an older step and is skipped"""
+        self.ring.add_sample(25 * 60, 900, 1, 0)
+        self.assertEqual(self.ring.stats(16 * 60, 25 * 60 + 59)[switcher_aio.CONF_SAMPLES], 1)
+
+    def test_coverage(self):
+        self.assertEqual(self.ring.resolution, 60)
+        self.assertEqual(self.ring.coverage, 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Replayer of the broadcasts captured by switcher_aio (the capture_file configuration key), for
+reproducing field issues and benchmarking the listener with real traffic. The captured datagrams are
+sent to the broadcast port at the captured pace, accelerated by the speed factor, or as fast as
+possible with a speed of 0. The capture file is a magic header followed by a record per datagram:
+the receive time (little endian double), the length (little endian short) and the raw datagram.
+
+Requires python 3.5.3 or later and nothing else, run from this folder:
+python3 switcher_replay.py switcher_aio.capture [--speed 10] [--info]
+
+The component must run on the same machine to receive the datagrams sent to the loopback address,
+use --broadcast-address otherwise.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import argparse
+import asyncio
+import binascii as ba
+import logging
+import socket
+import time
+from struct import Struct
+
+_LOGGER = logging.getLogger("switcher_replay")
+
+BROADCAST_PORT = 20002
+DEFAULT_BROADCAST_ADDRESS = "127.0.0.1"
+DEFAULT_SPEED = 1.0
+
+# same format as SwitcherV2Capture in the component
+CAPTURE_FILE_MAGIC = b"SWV2CAP1"
+CAPTURE_RECORD_STRUCT = Struct("<dH")
+
+# the device id of a 165 bytes broadcast, same layout as BROADCAST_MSG_STRUCT in the component
+BROADCAST_MSG_LENGTH = 165
+DEVICE_ID_STRUCT = Struct("<18x3s")
+
+
+def read_capture(path):
+    """yield the (receive time, datagram) records of a capture file, a record truncated by a crash is skipped"""
+    with open(path, "rb") as capture_file:
+        if not capture_file.read(len(CAPTURE_FILE_MAGIC)) == CAPTURE_FILE_MAGIC:
+            raise ValueError(path + " is not a switcher_aio capture file")
+        while True:
+            header = capture_file.read(CAPTURE_RECORD_STRUCT.size)
+            if not header:
+                return
+            if len(header) < CAPTURE_RECORD_STRUCT.size:
+                break
+            received_at, length = CAPTURE_RECORD_STRUCT.unpack(header)
+            data = capture_file.read(length)
+            if len(data) < length:
+                break
+            yield received_at, data
+    _LOGGER.warning("skipped the truncated last record of " + path)
+
+
+def get_device_id(data):
+    """return the device id of a broadcast datagram, None for other datagrams"""
+    if not len(data) == BROADCAST_MSG_LENGTH:
+        return None
+    return ba.hexlify(DEVICE_ID_STRUCT.unpack_from(data)[0]).decode("utf-8")
+
+
+def describe_capture(records):
+    """return the number of datagrams, the captured seconds and the number of datagrams by device id"""
+    count = 0
+    first = last = None
+    devices = {}
+    for received_at, data in records:
+        count += 1
+        first = received_at if first is None else first
+        last = received_at
+        device_id = get_device_id(data)
+        devices[device_id] = devices.get(device_id, 0) + 1
+    return count, (last - first) if count else 0.0, devices
+
+
+async def async_replay(records, send, speed=DEFAULT_SPEED):
+    """send the records datagrams at the captured pace divided by the speed, or back to back with a speed of 0, returns the number sent"""
+    count = 0
+    first = None
+    started = time.monotonic()
+    for received_at, data in records:
+        if first is None:
+            first = received_at
+        if speed > 0:
+            delay = (received_at - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif count % 100 == 0:
+            """let the loop flush the transport buffer"""
+            await asyncio.sleep(0)
+        send(data)
+        count += 1
+    return count
+
+
+async def async_open_sender(broadcast_address=DEFAULT_BROADCAST_ADDRESS, broadcast_port=BROADCAST_PORT):
+    """open a broadcast socket, returns the transport and a send function for async_replay"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    transport, _ = await asyncio.get_event_loop().create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+    address = (broadcast_address, broadcast_port)
+    return transport, lambda data: transport.sendto(data, address)
+
+
+async def async_replay_capture(path, speed, broadcast_address, broadcast_port):
+    """replay a capture file to the broadcast port"""
+    transport, send = await async_open_sender(broadcast_address, broadcast_port)
+    try:
+        started = time.monotonic()
+        count = await async_replay(read_capture(path), send, speed)
+        _LOGGER.info("replayed " + str(count) + " datagrams in " + str(round(time.monotonic() - started, 1)) + " seconds")
+    finally:
+        transport.close()
+
+
+def main():
+    """parse the command line and replay or describe the capture file"""
+    parser = argparse.ArgumentParser(description="Replay the broadcasts captured by switcher_aio")
+    parser.add_argument("capture_file", help="path of the capture file")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="replay speed factor, 0 replays as fast as possible")
+    parser.add_argument("--broadcast-address", default=DEFAULT_BROADCAST_ADDRESS, help="destination of the replayed broadcasts")
+    parser.add_argument("--broadcast-port", type=int, default=BROADCAST_PORT, help="destination port of the replayed broadcasts")
+    parser.add_argument("--info", action="store_true", help="describe the capture file instead of replaying it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.info:
+        count, seconds, devices = describe_capture(read_capture(args.capture_file))
+        print("{} datagrams over {:.1f} seconds".format(count, seconds))
+        for device_id, device_count in sorted(devices.items(), key=lambda item: str(item[0])):
+            print("{:<10} {} datagrams".format(device_id or "other", device_count))
+        return
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(async_replay_capture(args.capture_file, args.speed, args.broadcast_address, args.broadcast_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""////////////////////////////////////////////////////////////////////////////////////////////////
+Local simulator of SwitcherV2 devices, a stand-in for the physical heater in benchmarks and tests.
+Each simulated device listens on its own loopback address on the device tcp port, answers the
+login, get state, control, auto-off, update name and schedules requests, and sends the 165 bytes
+status broadcast parsed by SwitcherV2BroadcastMSG. Latency, packet loss and the number of devices
+are configurable, so hundreds of devices can run on one Linux box (the whole 127.0.0.0/8 range is
+local on Linux, no interface aliases are needed).
+
+Requires python 3.5.3 or later and nothing else, run from this folder:
+python3 switcher_simulator.py --devices 100 --latency 20 --loss 0.01
+
+Point the component at the simulated devices by listing their ids (printed on start) under
+devices, the phone id and device password are not verified by the simulator.
+
+////////////////////////////////////////////////////////////////////////////////////////////////"""
+import argparse
+import asyncio
+import binascii as ba
+import ipaddress
+import logging
+import os
+import random
+import socket
+import time
+from struct import Struct
+
+_LOGGER = logging.getLogger("switcher_simulator")
+
+SOCKET_PORT = 9957
+BROADCAST_PORT = 20002
+DEFAULT_DEVICES = 1
+DEFAULT_BASE_IP = "127.0.0.1"
+DEFAULT_BROADCAST_ADDRESS = "127.0.0.1"
+DEFAULT_BROADCAST_INTERVAL = 4.0
+DEFAULT_DEVICE_ID_BASE = "a10000"
+DEFAULT_POWER = 2640
+DEFAULT_AUTO_OFF = 5400
+MAX_SCHEDULES = 8
+
+REMOTE_KEY = b"00000000000000000000000000000000"
+PACKET_MAGIC = b"\xfe\xf0"
+PACKET_CRC_LENGTH = 4
+CRC_STRUCT = Struct("<H")
+LENGTH_STRUCT = Struct("<H")
+
+# requests are told apart by their length, packets of the same length by the opcode byte @80
+REQUEST_LOGIN = "login"
+REQUEST_GET_STATE = "get_state"
+REQUEST_CONTROL = "control"
+REQUEST_SET_AUTO_OFF = "set_auto_off"
+REQUEST_UPDATE_NAME = "update_name"
+REQUEST_GET_SCHEDULES = "get_schedules"
+REQUEST_DELETE_SCHEDULE = "delete_schedule"
+REQUEST_DISABLE_ENABLE_SCHEDULE = "disable_enable_schedule"
+REQUEST_CREATE_SCHEDULE = "create_schedule"
+REQUEST_OPCODE_OFFSET = 80
+REQUEST_TYPES = {
+    (0x52, None): REQUEST_LOGIN,
+    (0x30, None): REQUEST_GET_STATE,
+    (0x5d, None): REQUEST_CONTROL,
+    (0x5b, None): REQUEST_SET_AUTO_OFF,
+    (0x74, None): REQUEST_UPDATE_NAME,
+    (0x57, None): REQUEST_GET_SCHEDULES,
+    (0x58, None): REQUEST_DELETE_SCHEDULE,
+    (0x63, 0x07): REQUEST_DISABLE_ENABLE_SCHEDULE,
+    (0x63, 0x03): REQUEST_CREATE_SCHEDULE
+}
+
+# request payloads
+PAYLOAD_OFFSET = 83
+CONTROL_STRUCT = Struct("<BxI")
+AUTO_OFF_STRUCT = Struct("<I")
+DEVICE_NAME_STRUCT = Struct("<32s")
+DEVICE_NAME_OFFSET = 80
+SCHEDULE_ID_STRUCT = Struct("<B")
+SCHEDULE_DATA_LENGTH = 12
+CREATE_SCHEDULE_OFFSET = 84
+CREATE_SCHEDULE_DATA_LENGTH = 11
+
+# responses, the session id @8 is what the component reads from the acknowledgements
+RESPONSE_SESSION_ID_OFFSET = 8
+ACK_RESPONSE_LENGTH = 44
+STATE_RESPONSE_LENGTH = 105
+# state (0100/0000) @75, power @77, time left @89, auto-off @97
+STATE_RESPONSE_STRUCT = Struct("<HH10xI4xI")
+STATE_RESPONSE_OFFSET = 75
+SCHEDULES_RESPONSE_OFFSET = 45
+SCHEDULE_RECORD_LENGTH = 16
+
+# the 165 bytes broadcast, same layout as BROADCAST_MSG_STRUCT in the component
+BROADCAST_MSG_LENGTH = 165
+BROADCAST_MSG_STRUCT = Struct("<2s16x3s21x32s2x4s6s47xHH10xI4xI")
+STATE_ON = 0x0001
+STATE_OFF = 0x0000
+
+
+def crc_sign_packet(packet):
+    """sign the packet in place over the last four bytes, the same way the component does"""
+    crc_offset = len(packet) - PACKET_CRC_LENGTH
+    CRC_STRUCT.pack_into(packet, crc_offset, ba.crc_hqx(memoryview(packet)[:crc_offset], 0x1021))
+    CRC_STRUCT.pack_into(packet, crc_offset + 2, ba.crc_hqx(REMOTE_KEY, ba.crc_hqx(memoryview(packet)[crc_offset:crc_offset + 2], 0x1021)))
+    return packet
+
+
+def crc_verified(packet):
+    """return true if the packet carries a valid crc signature"""
+    if len(packet) <= PACKET_CRC_LENGTH:
+        return False
+    return bytes(crc_sign_packet(bytearray(packet))) == bytes(packet)
+
+
+def get_request_type(packet):
+    """return the request type of a request packet, None for unknown packets"""
+    if len(packet) < 8 or not packet[0:2] == PACKET_MAGIC:
+        return None
+    length = packet[2]
+    request_type = REQUEST_TYPES.get((length, None))
+    if request_type is None and len(packet) > REQUEST_OPCODE_OFFSET:
+        request_type = REQUEST_TYPES.get((length, packet[REQUEST_OPCODE_OFFSET]))
+    return request_type
+
+
+def new_response(length, session_id):
+    """return a new response frame with the magic, length and session id set"""
+    response = bytearray(length)
+    response[0:2] = PACKET_MAGIC
+    LENGTH_STRUCT.pack_into(response, 2, length)
+    response[RESPONSE_SESSION_ID_OFFSET:RESPONSE_SESSION_ID_OFFSET + 4] = session_id
+    return response
+
+
+class SimulatorConfig(object):
+    """representation of the simulator knobs shared by all the simulated devices"""
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, broadcast_address=DEFAULT_BROADCAST_ADDRESS, broadcast_port=BROADCAST_PORT, broadcast_interval=DEFAULT_BROADCAST_INTERVAL, port=SOCKET_PORT, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.broadcast_address = broadcast_address
+        self.broadcast_port = broadcast_port
+        self.broadcast_interval = broadcast_interval
+        self.port = port
+        self.random = random.Random(seed)
+
+    def response_delay(self):
+        """Return the seconds to wait before answering a request"""
+        if self.jitter:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        return self.latency
+
+    def lost(self):
+        """Return true if the next packet should be dropped"""
+        return self.loss > 0 and self.random.random() < self.loss
+
+
+class SimulatedSwitcher(object):
+    """representation of a single simulated switcher version 2 device"""
+    def __init__(self, config, device_id, ip_address, name, power=DEFAULT_POWER, auto_off=DEFAULT_AUTO_OFF):
+        self._config = config
+        self._device_id = device_id
+        self._ip_address = ip_address
+        self._mac = bytes((0x12, 0x34)) + socket.inet_aton(ip_address)
+        self._name = name
+        self._rated_power = power
+        self._auto_off = auto_off
+        self._state = STATE_OFF
+        self._off_at = None
+        self._schedules = {}
+        self._server = None
+        self._requests = {}
+        self._dropped = 0
+
+    @property
+    def device_id(self):
+        """Return the device id"""
+        return self._device_id
+
+    @property
+    def ip(self):
+        """Return the ip address the device listens on"""
+        return self._ip_address
+
+    @property
+    def name(self):
+        """Return the device name"""
+        return self._name
+
+    @property
+    def is_on(self):
+        """Return true if the device is on, expiring the running timer"""
+        if self._state == STATE_ON and self._off_at is not None and time.monotonic() >= self._off_at:
+            self._state = STATE_OFF
+            self._off_at = None
+        return self._state == STATE_ON
+
+    @property
+    def time_left(self):
+        """Return the seconds left to auto-off"""
+        if not self.is_on or self._off_at is None:
+            return 0
+        return int(self._off_at - time.monotonic())
+
+    @property
+    def power(self):
+        """Return the power consumption in watts"""
+        return self._rated_power if self.is_on else 0
+
+    @property
+    def requests(self):
+        """Return the requests count by request type"""
+        return self._requests
+
+    @property
+    def dropped(self):
+        """Return the number of dropped responses and broadcasts"""
+        return self._dropped
+
+    def count_dropped(self):
+        """Count a dropped response or broadcast"""
+        self._dropped += 1
+
+    def turn_on(self, timer_seconds=0):
+        """Turn on the device, the auto-off configuration applies if no timer was requested"""
+        self._state = STATE_ON
+        seconds = timer_seconds or self._auto_off
+        self._off_at = time.monotonic() + seconds if seconds else None
+
+    def turn_off(self):
+        """Turn off the device"""
+        self._state = STATE_OFF
+        self._off_at = None
+
+    def broadcast_message(self):
+        """Return the 165 bytes status broadcast of the device"""
+        is_on = self.is_on
+        message = bytearray(BROADCAST_MSG_LENGTH)
+        BROADCAST_MSG_STRUCT.pack_into(message, 0, PACKET_MAGIC, ba.unhexlify(self._device_id), self._name.encode("utf-8")[:32], socket.inet_aton(self._ip_address),
+                                       self._mac, STATE_ON if is_on else STATE_OFF, self.power, self.time_left, self._auto_off)
+        return bytes(message)
+
+    async def async_start(self):
+        """Start listening for requests on the device address"""
+        self._server = await asyncio.start_server(self.async_handle_connection, self._ip_address, self._config.port)
+
+    async def async_stop(self):
+        """Stop listening and drop the open connections"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def async_handle_connection(self, reader, writer):
+        """Serve one connection, every read is a single request answered with a single response"""
+        session_id = None
+        try:
+            while True:
+                packet = await reader.read(1024)
+                if not packet:
+                    break
+                request_type = get_request_type(packet)
+                self._requests[request_type] = self._requests.get(request_type, 0) + 1
+                if request_type is None or not crc_verified(packet):
+                    _LOGGER.warning("device " + self._device_id + " received an invalid packet " + packet.hex())
+                    continue
+                if request_type == REQUEST_LOGIN:
+                    session_id = os.urandom(4)
+                response = self.handle_request(request_type, packet, session_id or bytes(4))
+                delay = self._config.response_delay()
+                if delay:
+                    await asyncio.sleep(delay)
+                if self._config.lost():
+                    self.count_dropped()
+                    continue
+                writer.write(crc_sign_packet(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def handle_request(self, request_type, packet, session_id):
+        """Apply the request to the device and return its unsigned response"""
+        if request_type == REQUEST_GET_STATE:
+            response = new_response(STATE_RESPONSE_LENGTH, session_id)
+            STATE_RESPONSE_STRUCT.pack_into(response, STATE_RESPONSE_OFFSET, STATE_ON if self.is_on else STATE_OFF, self.power, self.time_left, self._auto_off)
+            return response
+
+        if request_type == REQUEST_GET_SCHEDULES:
+            records = b"".join(self._schedules[schedule_id] for schedule_id in sorted(self._schedules))
+            response = new_response(SCHEDULES_RESPONSE_OFFSET + len(records) + PACKET_CRC_LENGTH, session_id)
+            response[SCHEDULES_RESPONSE_OFFSET:SCHEDULES_RESPONSE_OFFSET + len(records)] = records
+            return response
+
+        if request_type == REQUEST_CONTROL:
+            cmd, timer_seconds = CONTROL_STRUCT.unpack_from(packet, PAYLOAD_OFFSET)
+            if cmd:
+                self.turn_on(timer_seconds)
+            else:
+                self.turn_off()
+        elif request_type == REQUEST_SET_AUTO_OFF:
+            self._auto_off = AUTO_OFF_STRUCT.unpack_from(packet, PAYLOAD_OFFSET)[0]
+        elif request_type == REQUEST_UPDATE_NAME:
+            self._name = DEVICE_NAME_STRUCT.unpack_from(packet, DEVICE_NAME_OFFSET)[0].rstrip(b"\x00").decode("utf-8", "replace")
+        elif request_type == REQUEST_DELETE_SCHEDULE:
+            self._schedules.pop(SCHEDULE_ID_STRUCT.unpack_from(packet, PAYLOAD_OFFSET)[0], None)
+        elif request_type == REQUEST_DISABLE_ENABLE_SCHEDULE:
+            schedule_data = bytes(packet[PAYLOAD_OFFSET:PAYLOAD_OFFSET + SCHEDULE_DATA_LENGTH])
+            if schedule_data[0] in self._schedules:
+                self._schedules[schedule_data[0]] = schedule_data + self._schedules[schedule_data[0]][SCHEDULE_DATA_LENGTH:]
+        elif request_type == REQUEST_CREATE_SCHEDULE:
+            free_ids = [schedule_id for schedule_id in range(MAX_SCHEDULES) if schedule_id not in self._schedules]
+            if free_ids:
+                schedule_data = bytes(packet[CREATE_SCHEDULE_OFFSET:CREATE_SCHEDULE_OFFSET + CREATE_SCHEDULE_DATA_LENGTH])
+                self._schedules[free_ids[0]] = bytes((free_ids[0],)) + schedule_data + bytes(SCHEDULE_RECORD_LENGTH - CREATE_SCHEDULE_DATA_LENGTH - 1)
+
+        return new_response(ACK_RESPONSE_LENGTH, session_id)
+
+
+class SwitcherSimulator(object):
+    """representation of a group of simulated devices sharing one broadcast socket"""
+    def __init__(self, config, devices):
+        self._config = config
+        self._devices = devices
+        self._transport = None
+        self._broadcast_task = None
+
+    @property
+    def devices(self):
+        """Return the simulated devices"""
+        return self._devices
+
+    async def async_start(self):
+        """Start the devices servers and the broadcasts"""
+        await asyncio.gather(*(device.async_start() for device in self._devices))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._transport, _ = await asyncio.get_event_loop().create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+        self._broadcast_task = asyncio.ensure_future(self.async_broadcast())
+
+    async def async_stop(self):
+        """Stop the broadcasts and the devices servers"""
+        if self._broadcast_task is not None:
+            self._broadcast_task.cancel()
+            self._broadcast_task = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        await asyncio.gather(*(device.async_stop() for device in self._devices))
+
+    def broadcast_once(self):
+        """Send one broadcast of every device"""
+        address = (self._config.broadcast_address, self._config.broadcast_port)
+        for device in self._devices:
+            if self._config.lost():
+                device.count_dropped()
+                continue
+            self._transport.sendto(device.broadcast_message(), address)
+
+    async def async_broadcast(self):
+        """Broadcast the devices status on the configured interval"""
+        while True:
+            self.broadcast_once()
+            await asyncio.sleep(self._config.broadcast_interval)
+
+
+def create_simulator(config, devices=DEFAULT_DEVICES, base_ip=DEFAULT_BASE_IP, device_id_base=DEFAULT_DEVICE_ID_BASE):
+    """create a simulator with sequential device ids and loopback addresses"""
+    first_ip = ipaddress.ip_address(base_ip)
+    first_id = int(device_id_base, 16)
+    return SwitcherSimulator(config, [
+        SimulatedSwitcher(config, "{:06x}".format(first_id + idx), str(first_ip + idx), "Simulated Switcher " + str(idx + 1))
+        for idx in range(devices)])
+
+
+def main():
+    """parse the command line and run the simulator until interrupted"""
+    parser = argparse.ArgumentParser(description="Simulate SwitcherV2 devices on the loopback interface")
+    parser.add_argument("--devices", type=int, default=DEFAULT_DEVICES, help="number of simulated devices")
+    parser.add_argument("--base-ip", default=DEFAULT_BASE_IP, help="address of the first device, the following devices take the next addresses")
+    parser.add_argument("--device-id-base", default=DEFAULT_DEVICE_ID_BASE, help="hex id of the first device")
+    parser.add_argument("--port", type=int, default=SOCKET_PORT, help="tcp port of the devices")
+    parser.add_argument("--broadcast-address", default=DEFAULT_BROADCAST_ADDRESS, help="destination of the status broadcasts")
+    parser.add_argument("--broadcast-port", type=int, default=BROADCAST_PORT, help="destination port of the status broadcasts")
+    parser.add_argument("--broadcast-interval", type=float, default=DEFAULT_BROADCAST_INTERVAL, help="seconds between broadcasts")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="response latency jitter in milliseconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of responses and broadcasts to drop")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible runs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = SimulatorConfig(args.latency / 1000, args.jitter / 1000, args.loss, args.broadcast_address, args.broadcast_port, args.broadcast_interval, args.port, args.seed)
+    simulator = create_simulator(config, args.devices, args.base_ip, args.device_id_base)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(simulator.async_start())
+    for device in simulator.devices:
+        _LOGGER.info("device " + device.device_id + " listening on " + device.ip + ":" + str(args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(simulator.async_stop())
+        for device in simulator.devices:
+            _LOGGER.info("device " + device.device_id + " requests " + str(device.requests) + " dropped " + str(device.dropped))
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,7 @@ import logging
 
 import binascii as ba
 import time
-from struct import pack
+from struct import Struct
 import socket
 import datetime
 import traceback
@@ -69,6 +69,10 @@ CONF_DEVICE_ID = 'device_id'
 CONF_DEVICE_PASSWORD = 'device_password'
 CONF_NOTIFY_SERVICE_NAME = "notify_service_name"
 CONF_AUTO_OFF_CONFIG = "auto_off"
+# the credentials are packed as raw bytes into the request packets, a malformed value is rejected by the schema
+PHONE_ID_PATTERN = r"^[0-9a-fA-F]{4}$"
+DEVICE_ID_PATTERN = r"^[0-9a-fA-F]{6}$"
+DEVICE_PASSWORD_PATTERN = r"^[0-9a-fA-F]{8}$"
 
 """###############################
 ######## Default Values ##########
@@ -104,9 +108,9 @@ TIMER_TURN_OFF_NOTIFICATION_DATA = {
 SWITCH_SCHEMA = vol.Schema({
     vol.Optional(CONF_FRIENDLY_NAME, default=DEFAULT_NAME): cv.string,
     vol.Required(CONF_LOCAL_IP_ADDR): cv.string,
-    vol.Required(CONF_PHONE_ID): cv.string,
-    vol.Required(CONF_DEVICE_ID): cv.string,
-    vol.Required(CONF_DEVICE_PASSWORD): cv.string,
+    vol.Required(CONF_PHONE_ID): vol.All(cv.string, vol.Match(PHONE_ID_PATTERN, msg="phone id must be 4 hex digits")),
+    vol.Required(CONF_DEVICE_ID): vol.All(cv.string, vol.Match(DEVICE_ID_PATTERN, msg="device id must be 6 hex digits")),
+    vol.Required(CONF_DEVICE_PASSWORD): vol.All(cv.string, vol.Match(DEVICE_PASSWORD_PATTERN, msg="device password must be 8 hex digits")),
     vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): cv.positive_int,
     vol.Optional(CONF_ICON, default=DEFAULT_ICON): cv.icon
 })
@@ -129,36 +133,49 @@ SET_AUTO_OFF_SERVICE_SCHEMA = vol.Schema({
 """###############################
 ###### SwitcherV2 Constants ######
 ###############################"""
-REMOTE_SESSION_ID = "00000000"
 REMOTE_KEY = b"00000000000000000000000000000000"
 SOCKET_PORT = 9957
-NO_TIMER_REQUESTED = "00000000"
+NO_TIMER_REQUESTED = 0
 
 """###############################
-######### Packet Formats #########
+######### Packet Layouts #########
 ###############################"""
-# remote session id, timestamp, phone id, device password
-LOGIN_PACKET = "fef052000232a100{}340001000000000000000000{}00000000000000000000f0fe1c00{}0000{}00000000000000000000000000000000000000000000000000000000"
-# local session id, timestamp, device id
-GET_STATE_PACKET = "fef0300002320103{}340001000000000000000000{}00000000000000000000f0fe{}00"
-# local session id, timestamp, device id, phone id, device password, command (1/0), timer
-SEND_CONTROL_PACKET = "fef05d0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000106000{}00{}"
-# local session id, timestamp, device id, phone id, device password, auto-off seconds
-SET_AUTO_OFF_PACKET ="fef05b0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000040400{}"
+# request frames with every variable field zeroed, the last four bytes are reserved for the crc signature
+# remote session id @8, timestamp @24, phone id @42, device password @46
+LOGIN_PACKET = ba.unhexlify("fef052000232a100{}340001000000000000000000{}00000000000000000000f0fe1c00{}0000{}00000000000000000000000000000000000000000000000000000000".format("00" * 4, "00" * 4, "00" * 2, "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40
+GET_STATE_PACKET = ba.unhexlify("fef0300002320103{}340001000000000000000000{}00000000000000000000f0fe{}00".format("00" * 4, "00" * 4, "00" * 3) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, command (1/0) @83, timer @85
+SEND_CONTROL_PACKET = ba.unhexlify("fef05d0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}000000000000000000000000000000000000000000000000000000000106000{}00{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "0", "00" * 4) + "00" * 4)
+# local session id @8, timestamp @24, device id @40, phone id @44, device password @48, auto-off seconds @83
+SET_AUTO_OFF_PACKET = ba.unhexlify("fef05b0002320102{}340001000000000000000000{}00000000000000000000f0fe{}00{}0000{}00000000000000000000000000000000000000000000000000000000040400{}".format("00" * 4, "00" * 4, "00" * 3, "00" * 2, "00" * 4, "00" * 4) + "00" * 4)
+
+PACKET_CRC_LENGTH = 4
+SESSION_ID_STRUCT = Struct("<4s")
+SESSION_ID_OFFSET = 8
+TIMESTAMP_STRUCT = Struct("<I")
+TIMESTAMP_OFFSET = 24
+PACKET_DEVICE_STRUCT = Struct("<3sx2s2x4s")
+PACKET_DEVICE_OFFSET = 40
+PACKET_PAYLOAD_OFFSET = 83
+LOGIN_CREDENTIALS_STRUCT = Struct("<2s2x4s")
+LOGIN_CREDENTIALS_OFFSET = 42
+STATE_DEVICE_ID_STRUCT = Struct("<3s")
+CONTROL_STRUCT = Struct("<BxI")
+AUTO_OFF_STRUCT = Struct("<I")
+CRC_STRUCT = Struct("<H")
 
 """###############################
 #### Tools Parsers Converters ####
 ###############################"""
 @callback
-def crc_sign_full_packet_com_key(pData):
-    """CRC calculation"""
+def crc_sign_packet(packet):
+    """CRC calculation, signs the packet in place over the last four bytes reserved for it"""
     try:
-        crc = (ba.hexlify(pack('>I', ba.crc_hqx(ba.unhexlify(pData), 0x1021)))).decode('utf-8')
-        pData = pData + crc[6:8] + crc[4:6]
-        crc = crc[6:8] + crc[4:6] + (ba.hexlify(REMOTE_KEY)).decode('utf-8')
-        crc = (ba.hexlify(pack('>I', ba.crc_hqx(ba.unhexlify(crc), 0x1021)))).decode('utf-8')
-        pData = pData + crc[6:8] + crc[4:6]
-        return pData
+        crc_offset = len(packet) - PACKET_CRC_LENGTH
+        CRC_STRUCT.pack_into(packet, crc_offset, ba.crc_hqx(memoryview(packet)[:crc_offset], 0x1021))
+        CRC_STRUCT.pack_into(packet, crc_offset + 2, ba.crc_hqx(REMOTE_KEY, ba.crc_hqx(memoryview(packet)[crc_offset:crc_offset + 2], 0x1021)))
+        return packet
     except:
         _LOGGER.exception('failed to sign crc ' + traceback.format_exc())
         return None
@@ -166,7 +183,7 @@ def crc_sign_full_packet_com_key(pData):
 @callback
 def get_timestamp():
     """Generate timestamp"""
-    return (ba.hexlify(pack('<I', int(round(time.time()))))).decode('utf-8')
+    return int(round(time.time()))
 
 @callback
 def get_socket(ip_addr):
@@ -192,8 +209,8 @@ def close_socket_connection(sock, ip_addr):
 
 @callback
 def convert_minutes_to_timer(minutes):
-    """convert minutes to hex for timer"""
-    return (ba.hexlify(pack('<I', int(minutes) * 60 ))).decode('utf-8')
+    """convert minutes to seconds for timer"""
+    return int(minutes) * 60
 
 @callback
 def convert_seconds_to_iso_time(all_seconds):
@@ -204,14 +221,14 @@ def convert_seconds_to_iso_time(all_seconds):
 
 @callback
 def convert_timedelta_to_auto_off(full_time):
-    """convert timedelta seconds to hex for auto-off"""
+    """convert timedelta to seconds for auto-off"""
     auto_off = auto_off_config = None
     try:
         minutes = full_time.total_seconds() / 60
         hours, minutes = divmod(minutes, 60)
         seconds = int(hours) * 3600 + int(minutes) * 60
         if seconds > 3599 and seconds < 86341:
-            auto_off = (ba.hexlify(pack('<I', int(seconds)))).decode('utf-8')
+            auto_off = seconds
             auto_off_config = convert_seconds_to_iso_time(seconds)
     except:
         _LOGGER.warning('failed to create auto-off from timedelta')
@@ -277,20 +294,20 @@ def parse_status(response):
 ####### Packet Handlers #######
 ############################"""
 @asyncio.coroutine
-def async_send_login_packet(phone_id, device_password, sock, ts, retry=3):
+def async_send_login_packet(encoder, sock, ts, retry=3):
     """Send login packet"""
     session_id = None
     try:
-        packet = crc_sign_full_packet_com_key(LOGIN_PACKET.format(REMOTE_SESSION_ID, ts, phone_id, device_password))
+        packet = encoder.login(ts)
         if not packet is None:
-            sock.send(ba.unhexlify(packet))
+            sock.send(packet)
             res = sock.recv(1024)
-            session_id = (ba.hexlify(res)[16:24]).decode('utf-8')
-            _LOGGER.debug('login packet sent, retreived session id is: ' + session_id)
-            if (session_id is None or session_id == ""):
+            session_id = res[8:12]
+            _LOGGER.debug('login packet sent, retreived session id is: ' + session_id.hex())
+            if (session_id is None or len(session_id) < 4):
                 if (retry > 0):
                     _LOGGER.warning('failed to get session id from device, retrying')
-                    return async_send_login_packet(phone_id, device_password, sock, ts, retry - 1)
+                    return (yield from async_send_login_packet(encoder, sock, ts, retry - 1))
                 else:
                     _LOGGER.error('failed to session id from device, please try again later')
                     session_id = None
@@ -300,13 +317,13 @@ def async_send_login_packet(phone_id, device_password, sock, ts, retry=3):
     return session_id
 
 @asyncio.coroutine
-def async_send_get_state_packet(device_id, sock, ts, session_id):
+def async_send_get_state_packet(encoder, sock, ts, session_id):
     """Send get state packet"""
     current_status = current_power_w = current_power_a = auto_off_time_left = auto_off_config = None
     try:
-        packet = crc_sign_full_packet_com_key(GET_STATE_PACKET.format(session_id, ts, device_id))
+        packet = encoder.get_state(session_id, ts)
         if not packet is None:
-            sock.send(ba.unhexlify(packet))
+            sock.send(packet)
             res = sock.recv(1024)
             current_status = parse_status(res)
             if not current_status is None:
@@ -323,20 +340,20 @@ def async_send_get_state_packet(device_id, sock, ts, session_id):
     return current_status, current_power_w, current_power_a, auto_off_time_left, auto_off_config
 
 @asyncio.coroutine
-def async_send_control_packet(device_id, phone_id, device_password, sock, ts, session_id, cmd, timer=None):
+def async_send_control_packet(encoder, sock, ts, session_id, cmd, timer=None):
     """Send control packet"""
     status = power_w = power_a = auto_off_time_left = None
     try:
         if timer is None:
             """No timer requested"""
-            packet = crc_sign_full_packet_com_key(SEND_CONTROL_PACKET.format(session_id, ts, device_id, phone_id, device_password, cmd, NO_TIMER_REQUESTED))
+            packet = encoder.control(session_id, ts, int(cmd), NO_TIMER_REQUESTED)
         else:
             """Incorporate timer in packet"""
             _LOGGER.debug('incorporating timer for ' + timer + ' minutes')
-            packet = crc_sign_full_packet_com_key(SEND_CONTROL_PACKET.format(session_id, ts, device_id, phone_id, device_password, cmd, convert_minutes_to_timer(timer)))
+            packet = encoder.control(session_id, ts, int(cmd), convert_minutes_to_timer(timer))
         
         if not packet is None:
-            sock.send(ba.unhexlify(packet))
+            sock.send(packet)
             res = sock.recv(1024)
             if cmd == "0":
                 _LOGGER.debug('control packet sent for state off')
@@ -354,15 +371,15 @@ def async_send_control_packet(device_id, phone_id, device_password, sock, ts, se
     return status, power_w, power_a, auto_off_time_left
 
 @asyncio.coroutine
-def async_send_set_auto_off_packet(device_id, phone_id, device_password, full_time, sock, ts, session_id):
+def async_send_set_auto_off_packet(encoder, full_time, sock, ts, session_id):
     """Send set auto-off packet"""
     auto_off_config = None
     try:
         prep_auto_off, auto_off_config = convert_timedelta_to_auto_off(full_time)
         if not prep_auto_off is None:
-            packet = crc_sign_full_packet_com_key(SET_AUTO_OFF_PACKET.format(session_id, ts, device_id, phone_id, device_password, prep_auto_off))
+            packet = encoder.set_auto_off(session_id, ts, prep_auto_off)
             if not packet is None:
-                sock.send(ba.unhexlify(packet))
+                sock.send(packet)
                 res = sock.recv(1024)
         else:
             _LOGGER.error('failed to validate input. the correct format is HH:mm with a minimum of 01:00 and maximum of 23:59')
@@ -371,6 +388,64 @@ def async_send_set_auto_off_packet(device_id, phone_id, device_password, full_ti
 
     return auto_off_config
 
+"""###########################
+####### Packet Encoder ########
+###########################"""
+class SwitcherV2PacketEncoder(object):
+    """bytes level encoder of the switcher version 2 request packets, the device invariant bytes are cached per frame"""
+    def __init__(self, device_id, phone_id, device_password):
+        device_id = ba.unhexlify(device_id)
+        phone_id = ba.unhexlify(phone_id)
+        device_password = ba.unhexlify(device_password)
+
+        self._login_frame = bytearray(LOGIN_PACKET)
+        LOGIN_CREDENTIALS_STRUCT.pack_into(self._login_frame, LOGIN_CREDENTIALS_OFFSET, phone_id, device_password)
+        self._login_frame = bytes(self._login_frame)
+
+        self._get_state_frame = bytearray(GET_STATE_PACKET)
+        STATE_DEVICE_ID_STRUCT.pack_into(self._get_state_frame, PACKET_DEVICE_OFFSET, device_id)
+        self._get_state_frame = bytes(self._get_state_frame)
+
+        self._control_frame = self._prepare_frame(SEND_CONTROL_PACKET, device_id, phone_id, device_password)
+        self._set_auto_off_frame = self._prepare_frame(SET_AUTO_OFF_PACKET, device_id, phone_id, device_password)
+
+    @staticmethod
+    def _prepare_frame(packet, device_id, phone_id, device_password):
+        """Fill the device invariant fields of a request frame"""
+        frame = bytearray(packet)
+        PACKET_DEVICE_STRUCT.pack_into(frame, PACKET_DEVICE_OFFSET, device_id, phone_id, device_password)
+        return bytes(frame)
+
+    @staticmethod
+    def _new_packet(frame, session_id, timestamp):
+        """Copy a cached frame into a new buffer and fill the session fields"""
+        packet = bytearray(frame)
+        SESSION_ID_STRUCT.pack_into(packet, SESSION_ID_OFFSET, session_id)
+        TIMESTAMP_STRUCT.pack_into(packet, TIMESTAMP_OFFSET, timestamp)
+        return packet
+
+    def login(self, timestamp):
+        """Return a signed login packet, the remote session id is all zeros"""
+        packet = bytearray(self._login_frame)
+        TIMESTAMP_STRUCT.pack_into(packet, TIMESTAMP_OFFSET, timestamp)
+        return crc_sign_packet(packet)
+
+    def get_state(self, session_id, timestamp):
+        """Return a signed get state packet"""
+        return crc_sign_packet(self._new_packet(self._get_state_frame, session_id, timestamp))
+
+    def control(self, session_id, timestamp, cmd, timer_seconds):
+        """Return a signed control packet"""
+        packet = self._new_packet(self._control_frame, session_id, timestamp)
+        CONTROL_STRUCT.pack_into(packet, PACKET_PAYLOAD_OFFSET, cmd, timer_seconds)
+        return crc_sign_packet(packet)
+
+    def set_auto_off(self, session_id, timestamp, auto_off_seconds):
+        """Return a signed set auto-off packet"""
+        packet = self._new_packet(self._set_auto_off_frame, session_id, timestamp)
+        AUTO_OFF_STRUCT.pack_into(packet, PACKET_PAYLOAD_OFFSET, auto_off_seconds)
+        return crc_sign_packet(packet)
+
 """###########################
 ###### Platform Setup ########
 ###########################"""
@@ -466,6 +541,7 @@ class SwitcherHeater(SwitchDevice):
         self._phone_id = phone_id
         self._device_id = device_id
         self._device_password = device_password
+        self._encoder = SwitcherV2PacketEncoder(device_id, phone_id, device_password)
         self._scan_interval = scan_interval
         self._icon = icon
 
@@ -490,11 +566,11 @@ class SwitcherHeater(SwitchDevice):
             sock = get_socket(self._ip_address)
             if not sock is None:
                 ts = get_timestamp()
-                session_id = yield from async_send_login_packet(self._phone_id, self._device_password, sock, ts)
+                session_id = yield from async_send_login_packet(self._encoder, sock, ts)
                 if not session_id is None:
-                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config =  yield from async_send_get_state_packet(self._device_id, sock, ts, session_id)
+                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config =  yield from async_send_get_state_packet(self._encoder, sock, ts, session_id)
                     if not status is None:
-                        status, current_power_w, current_power_a, auto_off_time_left = yield from async_send_control_packet(self._device_id, self._phone_id, self._device_password, sock, ts, session_id, cmd, timer)
+                        status, current_power_w, current_power_a, auto_off_time_left = yield from async_send_control_packet(self._encoder, sock, ts, session_id, cmd, timer)
                     close_socket_connection(sock, self._ip_address)
         except:
             _LOGGER.error('failed to set the state of the device ' + traceback.format_exc())
@@ -509,9 +585,9 @@ class SwitcherHeater(SwitchDevice):
             sock = get_socket(self._ip_address)
             if not sock is None:
                 ts = get_timestamp()
-                session_id = yield from async_send_login_packet(self._phone_id, self._device_password, sock, ts)
+                session_id = yield from async_send_login_packet(self._encoder, sock, ts)
                 if not session_id is None:
-                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config = yield from async_send_get_state_packet(self._device_id, sock, ts, session_id)
+                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config = yield from async_send_get_state_packet(self._encoder, sock, ts, session_id)
                     close_socket_connection(sock, self._ip_address)
         except:
             _LOGGER.error('failed to update device ' + traceback.format_exc())
@@ -526,11 +602,11 @@ class SwitcherHeater(SwitchDevice):
             sock = get_socket(self._ip_address)
             if not sock is None:
                 ts = get_timestamp()
-                session_id = yield from async_send_login_packet(self._phone_id, self._device_password, sock, ts)
+                session_id = yield from async_send_login_packet(self._encoder, sock, ts)
                 if not session_id is None:
-                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config =  yield from async_send_get_state_packet(self._device_id, sock, ts, session_id)
+                    status, current_power_w, current_power_a, auto_off_time_left, auto_off_config =  yield from async_send_get_state_packet(self._encoder, sock, ts, session_id)
                     if not status is None:
-                        auto_off_config = yield from async_send_set_auto_off_packet(self._device_id, self._phone_id, self._device_password, full_time, sock, ts, session_id)
+                        auto_off_config = yield from async_send_set_auto_off_packet(self._encoder, full_time, sock, ts, session_id)
                     close_socket_connection(sock, self._ip_address)
         except:
             _LOGGER.error('failed to set auto-off for the device ' + traceback.format_exc())